@@ -4,49 +4,79 @@ Enhanced Morvo AI Companion with MCP & A2A Protocol Integration
 """
 
 import asyncio
+import importlib.util
 import logging
 import json
 import httpx
 import os
 from typing import Dict, List, Optional, Any, Tuple
 from datetime import datetime
-from crewai import Agent, Task, Crew
 from config import AGENTS_CONFIG
 
-# Supabase integration for MCP
-try:
-    from supabase import create_client, Client
-    SUPABASE_AVAILABLE = True
-except ImportError:
-    SUPABASE_AVAILABLE = False
-    print("⚠️ Supabase client not available, using fallback mode")
+# crewai and supabase are heavy to import; they load on first use, not at
+# worker boot (see benchmarks/bench_import_time.py)
+SUPABASE_AVAILABLE = importlib.util.find_spec("supabase") is not None
 
 logger = logging.getLogger(__name__)
 
+if not SUPABASE_AVAILABLE:
+    logger.warning("⚠️ Supabase client not available, using fallback mode")
+
 class UnifiedMorvoCompanion:
     """رفيق مورفو الموحد - مساعد تسويق ذكي واحد"""
     
-    def __init__(self):
+    def __init__(
+        self,
+        supabase_client: Optional[Any] = None,
+        load_system_prompt: bool = True,
+        create_supabase_client: bool = True
+    ):
         self.system_prompt = None
-        self.supabase_client = None
-        self._initialize_companion()
+        # Shared client injected by the app lifespan, created here only as a fallback
+        self.supabase_client = supabase_client
+        self._prompt_task: Optional[asyncio.Task] = None
+        self._prompt_lock = asyncio.Lock()
+        self._initialize_companion(load_system_prompt, create_supabase_client)
     
-    def _initialize_companion(self):
+    def _initialize_companion(self, load_system_prompt: bool = True, create_supabase_client: bool = True):
         """تهيئة رفيق مورفو الموحد"""
         try:
-            if SUPABASE_AVAILABLE:
+            if self.supabase_client is None and create_supabase_client and SUPABASE_AVAILABLE:
                 url = os.getenv('SUPABASE_URL')
                 key = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
                 if url and key:
+                    from supabase import create_client
                     self.supabase_client = create_client(url, key)
                     logger.info("✅ Unified Morvo Companion initialized")
             
             # Load system prompt from database or use fallback
-            asyncio.create_task(self._load_system_prompt())
+            if load_system_prompt:
+                try:
+                    self._prompt_task = asyncio.get_running_loop().create_task(self.ensure_system_prompt())
+                except RuntimeError:
+                    # No running loop yet, the prompt is loaded on first use
+                    pass
             
         except Exception as e:
             logger.error(f"❌ Error initializing Morvo Companion: {e}")
     
+    async def ensure_system_prompt(self) -> str:
+        """تحميل System Prompt مرة واحدة فقط لكل عملية"""
+        async with self._prompt_lock:
+            if self.system_prompt is None:
+                await self._load_system_prompt()
+        return self.system_prompt
+    
+    def attach_supabase(self, supabase_client: Any):
+        """ربط عميل Supabase المشترك بعد اكتمال تهيئته وإعادة تحميل System Prompt منه"""
+        self.supabase_client = supabase_client
+
+        async def reload():
+            async with self._prompt_lock:
+                await self._load_system_prompt()
+
+        self._prompt_task = asyncio.get_running_loop().create_task(reload())
+
     async def _load_system_prompt(self):
         """تحميل System Prompt من قاعدة البيانات"""
         try:
@@ -76,9 +106,11 @@ class UnifiedMorvoCompanion:
         logger.info(f"🤖 Processing message with unified Morvo companion for user: {user_id}")
         
         try:
-            # Load MCP connector for user context
+            await self.ensure_system_prompt()
+            
+            # Load MCP connector for user context, sharing this companion's client
             from mcp_connector import get_mcp_connector
-            mcp_connector = get_mcp_connector()
+            mcp_connector = get_mcp_connector(self.supabase_client)
             
             # Get user context via MCP
             user_context = await mcp_connector.get_user_data(user_id)
@@ -87,6 +119,7 @@ class UnifiedMorvoCompanion:
             context_prompt = await self._build_unified_context(user_context, message)
             
             # Create unified Morvo agent
+            from crewai import Agent, Task, Crew
             morvo_agent = Agent(
                 role="مورفو - رفيق التسويق الذكي",
                 goal="تبسيط التسويق وتحقيق أهداف العميل بطريقة محادثية ودودة",
@@ -265,8 +298,9 @@ class UnifiedMorvoCompanion:
 class EnhancedMorvoAgents:
     """Wrapper class for backward compatibility"""
     
-    def __init__(self):
-        self.morvo_companion = UnifiedMorvoCompanion()
+    def __init__(self, companion: Optional[UnifiedMorvoCompanion] = None):
+        # Reuse the app's per-process companion when given one
+        self.morvo_companion = companion or UnifiedMorvoCompanion()
         logger.info("🤖 Enhanced Morvo Agents initialized with unified companion")
     
     async def process_message(self, user_id: str, message: str, filters: Dict = None) -> Dict[str, Any]:
@@ -282,8 +316,8 @@ class EnhancedMorvoAgents:
 class MorvoAgents:
     """Legacy wrapper - redirects to unified companion"""
     
-    def __init__(self):
-        self.enhanced_agents = EnhancedMorvoAgents()
+    def __init__(self, companion: Optional[UnifiedMorvoCompanion] = None):
+        self.enhanced_agents = EnhancedMorvoAgents(companion)
         logger.info("🔄 Legacy MorvoAgents redirecting to unified companion")
     
     async def process_message(self, user_id: str, message: str) -> Dict[str, Any]:
@@ -0,0 +1,113 @@
+"""
+A2A Transport Benchmark
+قياس أداء نقل رسائل A2A: HTTP ومجمّع ومحلي
+
+Sends the same messages through EnhancedA2AProtocol.send_secure_message to
+an agent served over HTTP on localhost (one POST per message, what M1–M5
+paid before), to remote agents over the batching transport (persistent
+WebSocket, and /receive_batch for an agent without one) and to the same
+agent registered as local, with both a direct handler and the in-memory
+inbox. Works offline.
+
+Usage: python benchmarks/bench_a2a_transport.py --messages 2000 --concurrency 20
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from typing import List
+
+import aiohttp
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from protocols.a2a_protocol import EnhancedA2AProtocol
+
+
+async def ack(payload):
+    return {"status": "received", "message_id": payload.get("message_id")}
+
+
+async def start_agent_server():
+    async def receive(request: web.Request) -> web.Response:
+        return web.json_response(await ack(await request.json()))
+
+    async def replies(messages):
+        return [{"message_id": m["message_id"], "status": 200, "result": await ack(m)} for m in messages]
+
+    async def receive_batch(request: web.Request) -> web.Response:
+        return web.json_response({"replies": await replies((await request.json())["messages"])})
+
+    async def ws(request: web.Request) -> web.WebSocketResponse:
+        socket = web.WebSocketResponse()
+        await socket.prepare(request)
+        async for msg in socket:
+            await socket.send_json({"type": "replies", "replies": await replies(msg.json()["messages"])})
+        return socket
+
+    app = web.Application()
+    app.router.add_post("/agents/{agent_id}/receive", receive)
+    app.router.add_post("/agents/{agent_id}/receive_batch", receive_batch)
+    # Only remote_ws gets a socket; remote_batch falls back to /receive_batch
+    app.router.add_get("/agents/remote_ws/ws", ws)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", 0).start()
+    return runner, f"http://127.0.0.1:{runner.addresses[0][1]}"
+
+
+async def run(protocol: EnhancedA2AProtocol, to_agent: str, messages: int, concurrency: int) -> List[float]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+
+    async def one(i: int):
+        async with semaphore:
+            start = time.perf_counter()
+            await protocol.send_secure_message("M0", to_agent, {"type": "task", "seq": i, "text": "تحليل السوق"})
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one(i) for i in range(messages)))
+    return latencies
+
+
+def report(name: str, latencies: List[float], elapsed: float):
+    ordered = sorted(latencies)
+    p50 = ordered[len(ordered) // 2] * 1000
+    p95 = ordered[int(len(ordered) * 0.95) - 1] * 1000
+    print(f"{name:<14} p50={p50:8.3f}ms p95={p95:8.3f}ms throughput={len(latencies) / elapsed:10.1f} msg/s")
+
+
+async def main(messages: int, concurrency: int):
+    runner, base_url = await start_agent_server()
+    session = aiohttp.ClientSession()
+    try:
+        protocol = EnhancedA2AProtocol(session)
+        protocol.local_transport.inbox_size = messages
+        await protocol.register_agent("M0", f"{base_url}/agents/M0", [])
+        await protocol.register_agent("remote", f"{base_url}/agents/remote", [], transport="http")
+        await protocol.register_agent("remote_ws", f"{base_url}/agents/remote_ws", [], transport="websocket")
+        await protocol.register_agent("remote_batch", f"{base_url}/agents/remote_batch", [], transport="websocket")
+        await protocol.register_agent("local_call", f"{base_url}/agents/local_call", [], handler=ack)
+        await protocol.register_agent("local_inbox", f"{base_url}/agents/local_inbox", [], local=True)
+
+        print(f"messages={messages} concurrency={concurrency}")
+        for agent_id in ("remote", "remote_ws", "remote_batch", "local_call", "local_inbox"):
+            start = time.perf_counter()
+            latencies = await run(protocol, agent_id, messages, concurrency)
+            report(agent_id, latencies, time.perf_counter() - start)
+        print(protocol.get_network_status()["transports"])
+    finally:
+        await protocol.close()
+        await session.close()
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.messages, args.concurrency))
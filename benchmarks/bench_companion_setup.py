@@ -0,0 +1,89 @@
+"""
+Companion Setup Benchmark
+قياس تكلفة تهيئة رفيق مورفو لكل اتصال
+
+Measures per-connection setup time and memory of the served WebSocket path
+(websocket_manager): every connection is registered with a
+ConnectionManager, then either builds its own UnifiedMorvoCompanion
+(previous behaviour) or resolves the per-process instance the app lifespan
+hands to set_companion().
+
+Needs the full requirements (crewai, supabase). Set SUPABASE_URL and
+SUPABASE_SERVICE_ROLE_KEY to include real client construction in the numbers.
+
+Usage: python benchmarks/bench_companion_setup.py --connections 200
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents import UnifiedMorvoCompanion
+from websocket_manager import ConnectionManager, get_companion, set_companion
+
+
+class FakeWebSocket:
+    """Accepts the handshake and discards frames, like an idle client"""
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, data: str):
+        pass
+
+
+async def per_connection(connections: int):
+    """One companion, Supabase client and prompt load per connection"""
+    manager = ConnectionManager()
+    held = []
+    for i in range(connections):
+        await manager.connect(FakeWebSocket(), f"user_{i}")
+        companion = UnifiedMorvoCompanion()
+        await companion.ensure_system_prompt()
+        held.append(companion)
+    return manager, held
+
+
+async def shared(connections: int):
+    """One companion for the process (as the app lifespan sets it), resolved per connection"""
+    companion = UnifiedMorvoCompanion(load_system_prompt=False)
+    await companion.ensure_system_prompt()
+    set_companion(companion)
+    manager = ConnectionManager()
+    held = []
+    for i in range(connections):
+        await manager.connect(FakeWebSocket(), f"user_{i}")
+        held.append(get_companion())
+    return manager, held
+
+
+async def measure(name: str, setup, connections: int):
+    tracemalloc.start()
+    start = time.perf_counter()
+    held = await setup(connections)
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{name:<15} setup/connection={elapsed / connections * 1000:8.3f}ms "
+        f"memory={current / 1024:10.1f}KiB peak={peak / 1024:10.1f}KiB"
+    )
+    del held
+
+
+async def main(connections: int):
+    print(f"connections={connections} supabase={'configured' if os.getenv('SUPABASE_URL') else 'not configured'}")
+    await measure("per-connection", per_connection, connections)
+    await measure("shared", shared, connections)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--connections", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(main(args.connections))
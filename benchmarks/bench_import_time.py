@@ -0,0 +1,102 @@
+"""
+Import-Time Budget
+قياس زمن استيراد التطبيق عند إقلاع العامل
+
+Imports a module (default: main, what each gunicorn worker loads) in fresh
+interpreters with `python -X importtime`, reports the median wall time and
+the slowest top-level imports, and exits with status 1 when the median is
+over budget, so CI catches a heavy dependency creeping back into module
+scope. Also fails if any module listed in --forbid (crewai, supabase, git,
+mcp by default) was imported, since those must load on first use.
+
+Usage: python benchmarks/bench_import_time.py --budget-ms 1500 --runs 5
+"""
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_FORBIDDEN = ["crewai", "supabase", "git", "mcp"]
+
+# "import time: self [us] | cumulative | imported package"
+_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure(module: str) -> Tuple[float, Dict[str, int]]:
+    """زمن الاستيراد (ms) والزمن التراكمي لكل استيراد مباشر للوحدة (us)"""
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    elapsed = (time.perf_counter() - started) * 1000
+    if proc.returncode != 0:
+        sys.stderr.write(proc.stderr[-2000:])
+        raise SystemExit(f"import {module} failed")
+
+    # Post-order output, indent grows by two per level: children (indent 3)
+    # are listed just before their top-level parent (indent 1)
+    children: Dict[str, int] = {}
+    for line in proc.stderr.splitlines():
+        match = _LINE.match(line)
+        if not match:
+            continue
+        indent = len(match.group(3))
+        if indent == 3:
+            children[match.group(4)] = int(match.group(2))
+        elif indent == 1:
+            if match.group(4) == module:
+                return elapsed, children
+            children = {}  # interpreter startup (site, encodings)
+    return elapsed, {}
+
+
+def imported_modules(module: str) -> List[str]:
+    code = f"import sys, {module}; print('\\n'.join(sys.modules))"
+    proc = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True)
+    return proc.stdout.split()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("IMPORT_TIME_BUDGET_MS", 1500)))
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--forbid", nargs="*", default=DEFAULT_FORBIDDEN)
+    args = parser.parse_args()
+
+    timings = []
+    slowest: Dict[str, int] = {}
+    for _ in range(args.runs):
+        elapsed, direct = measure(args.module)
+        timings.append(elapsed)
+        for name, us in direct.items():
+            slowest[name] = max(slowest.get(name, 0), us)
+
+    median = statistics.median(timings)
+    print(f"import {args.module}: median={median:.1f}ms min={min(timings):.1f}ms max={max(timings):.1f}ms "
+          f"budget={args.budget_ms:.0f}ms runs={args.runs}")
+    for name, us in sorted(slowest.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"  {us / 1000:8.1f}ms  {name}")
+
+    loaded = set(imported_modules(args.module))
+    eager = [name for name in args.forbid if name in loaded]
+    failed = False
+    if eager:
+        print(f"FAIL: imported at module load (should be lazy): {', '.join(eager)}")
+        failed = True
+    if median > args.budget_ms:
+        print(f"FAIL: median import time {median:.1f}ms exceeds budget {args.budget_ms:.0f}ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Provider HTTP Benchmark
+قياس أداء عميل HTTP لمزودي البيانات
+
+Runs the provider stub server in-process and drives requests through
+BaseProvider._request, comparing the pooled shared ProviderHTTPClient with a
+fresh aiohttp session per request (what every call paid before pooling).
+Works offline; no vendor keys needed.
+
+Usage: python benchmarks/bench_provider_http.py --requests 500 --concurrency 20 --latency lognormal:30,0.5
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from typing import List
+
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from provider_http import ProviderHTTPClient, ProviderRequestError
+from providers import SERANKingProvider
+from benchmarks.provider_stub_server import StubProvider, start_stub_server
+
+
+class UnpooledClient(ProviderHTTPClient):
+    """New session (TCP connect per call) for every request"""
+
+    async def request(self, provider, method, url, headers=None, timeout=None, **kwargs):
+        async with aiohttp.ClientSession(timeout=self.timeout) as session:
+            self.session = session
+            try:
+                return await super().request(provider, method, url, headers=headers, timeout=timeout, **kwargs)
+            finally:
+                self.session = None
+
+
+async def run(provider: SERANKingProvider, requests: int, concurrency: int) -> List[float]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+
+    async def one(i: int):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await provider._request("POST", "/keywords/research", json={"keywords": [f"كلمة {i}"]})
+            except ProviderRequestError:
+                pass
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return latencies
+
+
+def report(name: str, latencies: List[float], elapsed: float, client: ProviderHTTPClient, connections: int):
+    ordered = sorted(latencies)
+    p50 = ordered[len(ordered) // 2] * 1000
+    p95 = ordered[int(len(ordered) * 0.95) - 1] * 1000
+    errors = client.metrics["seranking"].errors if "seranking" in client.metrics else 0
+    print(
+        f"{name:<9} p50={p50:7.2f}ms p95={p95:7.2f}ms throughput={len(latencies) / elapsed:8.1f} req/s "
+        f"errors={errors} server_connections={connections}"
+    )
+
+
+async def main(requests: int, concurrency: int, latency: str, error_rate: float, per_host: int):
+    stubs = {"seranking": StubProvider("seranking", latency, error_rate)}
+    runner, base_urls = await start_stub_server(stubs)
+    try:
+        print(
+            f"requests={requests} concurrency={concurrency} latency={latency} "
+            f"error_rate={error_rate} per_host_limit={per_host}"
+        )
+        clients = (("unpooled", UnpooledClient()), ("pooled", ProviderHTTPClient(max_per_host=per_host)))
+        for name, client in clients:
+            stubs["seranking"].stats["connections"].clear()
+            provider = SERANKingProvider()
+            provider.base_url = base_urls["seranking"]
+            provider.http = client
+            start = time.perf_counter()
+            latencies = await run(provider, requests, concurrency)
+            elapsed = time.perf_counter() - start
+            report(name, latencies, elapsed, client, len(stubs["seranking"].stats["connections"]))
+            await client.close()
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency", default="fixed:20", help="stub latency distribution")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--per-host", type=int, default=20, help="pooled client connections per host")
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency, args.latency, args.error_rate, args.per_host))
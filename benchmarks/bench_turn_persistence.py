@@ -0,0 +1,137 @@
+"""
+Turn Persistence Benchmark
+قياس زمن حفظ المحادثة
+
+Compares the legacy three-write turn persistence of the companion
+WebSocket handlers with the real turn_persistence.schedule_turn_persistence
+path (one record_conversation_turn RPC after the reply has been sent), both
+against a fake Supabase client with a fixed round trip.
+
+Usage: python benchmarks/bench_turn_persistence.py --rtt-ms 40 --llm-ms 5 --turns 50
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from turn_persistence import pending_turn_writes, persist_turn, schedule_turn_persistence
+
+
+class FakeQuery:
+    """Stand-in for a Supabase query builder with a fixed network round trip"""
+
+    def __init__(self, client: "FakeSupabase"):
+        self.client = client
+
+    def __getattr__(self, name):
+        # insert/update/eq/... just keep building the same query
+        return lambda *args, **kwargs: self
+
+    async def execute(self):
+        self.client.round_trips += 1
+        await asyncio.sleep(self.client.rtt)
+        return {"data": []}
+
+
+class FakeSupabase:
+    """Counts round trips and sleeps for the configured latency on each one"""
+
+    def __init__(self, rtt: float):
+        self.rtt = rtt
+        self.round_trips = 0
+        self.rpc_calls: List[str] = []
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self)
+
+    def rpc(self, name: str, params: Dict) -> FakeQuery:
+        self.rpc_calls.append(name)
+        return FakeQuery(self)
+
+
+def turn_fields() -> Dict[str, str]:
+    now = datetime.utcnow().isoformat()
+    return {
+        "conversation_id": str(uuid.uuid4()),
+        "user_id": str(uuid.uuid4()),
+        "user_message": "كيف أحسن ظهوري في البحث؟",
+        "assistant_message": "ابدأ بالكلمات المفتاحية المحلية",
+        "user_created_at": now,
+        "assistant_created_at": now
+    }
+
+
+async def legacy_turn(client: FakeSupabase, llm_latency: float) -> float:
+    """insert user -> LLM -> insert assistant -> update conversation -> reply"""
+    start = time.perf_counter()
+    await client.table("messages").insert({"role": "user"}).execute()
+    await asyncio.sleep(llm_latency)
+    await client.table("messages").insert({"role": "assistant"}).execute()
+    await client.table("conversations").update({}).eq("id", "c").execute()
+    return time.perf_counter() - start
+
+
+async def inline_turn(client: FakeSupabase, llm_latency: float) -> float:
+    """LLM -> persist_turn awaited before the reply (one RPC, still on the critical path)"""
+    start = time.perf_counter()
+    await asyncio.sleep(llm_latency)
+    await persist_turn(client, **turn_fields())
+    return time.perf_counter() - start
+
+
+async def batched_turn(client: FakeSupabase, llm_latency: float, pending: List[asyncio.Task]) -> float:
+    """LLM -> reply -> schedule_turn_persistence in the background (served path)"""
+    start = time.perf_counter()
+    await asyncio.sleep(llm_latency)
+    elapsed = time.perf_counter() - start
+    pending.append(schedule_turn_persistence(client, **turn_fields()))
+    return elapsed
+
+
+def summarize(name: str, samples: List[float], round_trips: int, turns: int):
+    samples_ms = sorted(s * 1000 for s in samples)
+    p95 = samples_ms[int(len(samples_ms) * 0.95) - 1] if len(samples_ms) > 1 else samples_ms[0]
+    print(
+        f"{name:<10} reply latency p50={statistics.median(samples_ms):7.2f}ms "
+        f"p95={p95:7.2f}ms  db round trips/turn={round_trips / turns:.1f}"
+    )
+
+
+async def main(rtt_ms: float, llm_ms: float, turns: int):
+    rtt, llm_latency = rtt_ms / 1000, llm_ms / 1000
+
+    legacy_client = FakeSupabase(rtt)
+    legacy_samples = [await legacy_turn(legacy_client, llm_latency) for _ in range(turns)]
+
+    inline_client = FakeSupabase(rtt)
+    inline_samples = [await inline_turn(inline_client, llm_latency) for _ in range(turns)]
+
+    batched_client = FakeSupabase(rtt)
+    pending: List[asyncio.Task] = []
+    batched_samples = [await batched_turn(batched_client, llm_latency, pending) for _ in range(turns)]
+    in_flight = pending_turn_writes()
+    stored = await asyncio.gather(*pending)
+    assert all(stored) and batched_client.rpc_calls.count("record_conversation_turn") == turns
+
+    print(f"turns={turns} db_rtt={rtt_ms}ms llm={llm_ms}ms")
+    summarize("legacy", legacy_samples, legacy_client.round_trips, turns)
+    summarize("inline", inline_samples, inline_client.round_trips, turns)
+    summarize("batched", batched_samples, batched_client.round_trips, turns)
+    print(f"batched writes still in flight after the last reply: {in_flight}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rtt-ms", type=float, default=40.0, help="simulated database round trip")
+    parser.add_argument("--llm-ms", type=float, default=5.0, help="simulated companion latency")
+    parser.add_argument("--turns", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(main(args.rtt_ms, args.llm_ms, args.turns))
@@ -0,0 +1,221 @@
+"""
+Provider Stub Server
+خادم محاكاة لمزودي البيانات (SE Ranking, Awario, Mention)
+
+Local HTTP stand-in for the three vendor APIs so the provider request path
+(BaseProvider._request, rate limiter, shared HTTP pool) can be load-tested
+with no network and no vendor keys.
+Each provider is served under its own prefix with a configurable latency
+distribution, error rate and server-side rate limit (429 + Retry-After).
+
+Point the providers at it with the base URL overrides:
+
+    SERANKING_BASE_URL=http://127.0.0.1:8099/seranking
+    AWARIO_BASE_URL=http://127.0.0.1:8099/awario
+    MENTION_BASE_URL=http://127.0.0.1:8099/mention
+
+Usage:
+    python benchmarks/provider_stub_server.py --port 8099 \\
+        --latency seranking=lognormal:40,0.6 --latency awario=uniform:20,80 \\
+        --error-rate 0.02 --rate-limit seranking=5
+
+Latency specs: fixed:MS, uniform:LOW_MS,HIGH_MS, lognormal:MEDIAN_MS,SIGMA
+"""
+
+import argparse
+import asyncio
+import math
+import random
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+PROVIDERS = ("seranking", "awario", "mention")
+
+
+def parse_latency(spec: str):
+    """تحويل وصف توزيع زمن الاستجابة إلى دالة تعيد ثوانٍ"""
+    kind, _, params = spec.partition(":")
+    values = [float(v) for v in params.split(",")] if params else []
+    if kind == "fixed":
+        return lambda: values[0] / 1000
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[1]) / 1000
+    if kind == "lognormal":
+        mu = math.log(values[0])
+        return lambda: random.lognormvariate(mu, values[1]) / 1000
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+class StubProvider:
+    """إعدادات وإحصائيات مزود واحد في خادم المحاكاة"""
+
+    def __init__(self, name: str, latency: str = "fixed:0", error_rate: float = 0.0, rate_limit: Optional[float] = None):
+        self.name = name
+        self.latency_spec = latency
+        self.latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self._tokens = rate_limit or 0.0
+        self._refilled_at = time.monotonic()
+        self.stats = {"requests": 0, "errors": 0, "rate_limited": 0, "connections": set()}
+
+    def take_token(self) -> Tuple[bool, float]:
+        if not self.rate_limit:
+            return True, 0.0
+        now = time.monotonic()
+        self._tokens = min(self.rate_limit, self._tokens + (now - self._refilled_at) * self.rate_limit)
+        self._refilled_at = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True, 0.0
+        return False, (1 - self._tokens) / self.rate_limit
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "latency": self.latency_spec,
+            "error_rate": self.error_rate,
+            "rate_limit": self.rate_limit,
+            "requests": self.stats["requests"],
+            "errors": self.stats["errors"],
+            "rate_limited": self.stats["rate_limited"],
+            # Distinct client sockets seen; low numbers mean keep-alive pooling works
+            "connections": len(self.stats["connections"])
+        }
+
+
+def canned_response(provider: str, path: str, body: Dict[str, Any]) -> Dict[str, Any]:
+    """بيانات وهمية بشكل قريب من استجابات المزودين"""
+    now = time.strftime("%Y-%m-%dT%H:%M:%S")
+    if provider == "seranking" and "keyword" in path:
+        keywords: List[str] = body.get("keywords", [])
+        return {
+            "keywords": [
+                {"keyword": k, "volume": random.randint(100, 5000), "difficulty": random.randint(10, 90),
+                 "cpc": round(random.uniform(0.2, 5), 2)}
+                for k in keywords
+            ]
+        }
+    if provider in ("awario", "mention") and "mention" in path:
+        return {
+            "mentions": [
+                {"id": f"{provider}_{random.getrandbits(40):x}", "text": "إشارة تجريبية",
+                 "sentiment": random.choice(["positive", "neutral", "negative"]), "timestamp": now}
+                for _ in range(int(body.get("limit", 10)))
+            ]
+        }
+    return {"status": "ok", "provider": provider, "path": path, "timestamp": now}
+
+
+def create_stub_app(providers: Dict[str, StubProvider]) -> web.Application:
+    """إنشاء تطبيق aiohttp لخادم المحاكاة"""
+
+    async def handle(request: web.Request) -> web.Response:
+        provider = providers.get(request.match_info["provider"])
+        if provider is None:
+            return web.json_response({"error": "unknown provider"}, status=404)
+
+        provider.stats["requests"] += 1
+        peer = request.transport.get_extra_info("peername") if request.transport else None
+        if peer:
+            provider.stats["connections"].add(peer)
+
+        allowed, retry_after = provider.take_token()
+        if not allowed:
+            provider.stats["rate_limited"] += 1
+            return web.json_response(
+                {"error": "rate limit exceeded"}, status=429,
+                headers={"Retry-After": f"{retry_after:.3f}"}
+            )
+
+        await asyncio.sleep(max(0.0, provider.latency()))
+
+        if random.random() < provider.error_rate:
+            provider.stats["errors"] += 1
+            return web.json_response({"error": "injected failure"}, status=random.choice([500, 502, 503]))
+
+        body: Dict[str, Any] = {}
+        if request.can_read_body:
+            try:
+                body = await request.json()
+            except Exception:
+                body = {}
+        body.update(request.query)
+        return web.json_response(canned_response(provider.name, request.match_info["path"], body))
+
+    async def stats(request: web.Request) -> web.Response:
+        return web.json_response({name: p.snapshot() for name, p in providers.items()})
+
+    async def configure(request: web.Request) -> web.Response:
+        """تعديل الإعدادات أثناء التشغيل: {"seranking": {"latency": "...", "error_rate": 0.1}}"""
+        updates = await request.json()
+        for name, settings in updates.items():
+            if name in providers:
+                current = providers[name]
+                providers[name] = StubProvider(
+                    name,
+                    settings.get("latency", current.latency_spec),
+                    settings.get("error_rate", current.error_rate),
+                    settings.get("rate_limit", current.rate_limit)
+                )
+        return web.json_response({name: p.snapshot() for name, p in providers.items()})
+
+    app = web.Application()
+    app.router.add_get("/_stats", stats)
+    app.router.add_post("/_config", configure)
+    app.router.add_route("*", "/{provider}/{path:.*}", handle)
+    return app
+
+
+async def start_stub_server(
+    providers: Optional[Dict[str, StubProvider]] = None,
+    host: str = "127.0.0.1",
+    port: int = 0
+) -> Tuple[web.AppRunner, Dict[str, str]]:
+    """تشغيل الخادم داخل العملية الحالية؛ يعيد المشغل وعناوين المزودين"""
+    providers = providers or {name: StubProvider(name) for name in PROVIDERS}
+    runner = web.AppRunner(create_stub_app(providers))
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    bound_port = runner.addresses[0][1]
+    base_urls = {name: f"http://{host}:{bound_port}/{name}" for name in providers}
+    return runner, base_urls
+
+
+def _parse_per_provider(values: List[str], cast) -> Dict[str, Any]:
+    """قراءة قيم بصيغة name=value لمزود واحد أو value لجميع المزودين"""
+    parsed: Dict[str, Any] = {}
+    for value in values or []:
+        if "=" in value:
+            name, _, raw = value.partition("=")
+            parsed[name] = cast(raw)
+        else:
+            parsed.update({name: cast(value) for name in PROVIDERS})
+    return parsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency", action="append", help="[provider=]distribution")
+    parser.add_argument("--error-rate", action="append", help="[provider=]fraction")
+    parser.add_argument("--rate-limit", action="append", help="[provider=]requests per second")
+    args = parser.parse_args()
+
+    latency = _parse_per_provider(args.latency, str)
+    errors = _parse_per_provider(args.error_rate, float)
+    limits = _parse_per_provider(args.rate_limit, float)
+    providers = {
+        name: StubProvider(name, latency.get(name, "fixed:0"), errors.get(name, 0.0), limits.get(name))
+        for name in PROVIDERS
+    }
+    for name in PROVIDERS:
+        print(f"{name.upper()}_BASE_URL=http://{args.host}:{args.port}/{name}")
+    web.run_app(create_stub_app(providers), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,7 @@ Enhanced configuration for MCP (Model Context Protocol) and A2A (Agent-to-Agent)
 with Supabase, Git, Security, and advanced features
 """
 
+import logging
 import os
 from typing import Dict, List
 
@@ -21,7 +22,7 @@ SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY") or os.getenv(
 
 # Auto-generate Supabase DATABASE_URL if Supabase is configured
 # Log the available Supabase configuration for debugging
-print(f"Supabase Config - URL: {'Available' if SUPABASE_URL else 'Missing'}, KEY: {'Available' if SUPABASE_KEY else 'Missing'}, SERVICE_KEY: {'Available' if SUPABASE_SERVICE_ROLE_KEY else 'Missing'}")
+logging.getLogger(__name__).info(f"Supabase Config - URL: {'Available' if SUPABASE_URL else 'Missing'}, KEY: {'Available' if SUPABASE_KEY else 'Missing'}, SERVICE_KEY: {'Available' if SUPABASE_SERVICE_ROLE_KEY else 'Missing'}")
 if SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY:
     # Clean up the service role key (remove quotes and comments if present)
     clean_key = SUPABASE_SERVICE_ROLE_KEY.strip().replace('"', '').split('#')[0].strip()
@@ -68,6 +69,20 @@ A2A_AUTH_ENABLED = os.getenv("A2A_AUTH_ENABLED", "true").lower() == "true"
 A2A_MESSAGE_TTL = int(os.getenv("A2A_MESSAGE_TTL", 3600))  # 1 hour
 A2A_MAX_RETRIES = int(os.getenv("A2A_MAX_RETRIES", 3))
 A2A_RETRY_DELAY = int(os.getenv("A2A_RETRY_DELAY", 5))  # seconds
+A2A_MESSAGE_TRACKER_SIZE = int(os.getenv("A2A_MESSAGE_TRACKER_SIZE", 1000))  # messages kept for status/stats
+A2A_BROADCAST_CONCURRENCY = int(os.getenv("A2A_BROADCAST_CONCURRENCY", 10))  # parallel sends per broadcast
+A2A_AGENT_TIMEOUT = float(os.getenv("A2A_AGENT_TIMEOUT", 10))  # seconds per agent in a broadcast
+A2A_REMOTE_TRANSPORT = os.getenv("A2A_REMOTE_TRANSPORT", "websocket")  # "websocket" (batched) or "http"
+A2A_BATCH_WINDOW_MS = float(os.getenv("A2A_BATCH_WINDOW_MS", 2))  # coalescing window per remote agent
+A2A_BATCH_MAX_MESSAGES = int(os.getenv("A2A_BATCH_MAX_MESSAGES", 100))  # flush a frame early at this size
+A2A_QUEUE_CONCURRENCY = int(os.getenv("A2A_QUEUE_CONCURRENCY", 20))  # parallel durable deliveries per worker
+A2A_QUEUE_DELIVERY_TIMEOUT = float(os.getenv("A2A_QUEUE_DELIVERY_TIMEOUT", 30))  # seconds before a durable delivery is retried
+A2A_QUEUE_VISIBILITY_TIMEOUT = float(os.getenv("A2A_QUEUE_VISIBILITY_TIMEOUT", 90))  # idle pending entries reclaimed after this (>= 2x delivery timeout)
+A2A_DEAD_LETTER_MAXLEN = int(os.getenv("A2A_DEAD_LETTER_MAXLEN", 10000))  # dead-letter stream cap
+A2A_COMMUNICATION_LOG_MAX = int(os.getenv("A2A_COMMUNICATION_LOG_MAX", 1000))  # entries kept per agent log
+A2A_REDIS_BATCH_SIZE = int(os.getenv("A2A_REDIS_BATCH_SIZE", 100))  # commands per pipeline
+A2A_REDIS_FLUSH_MS = float(os.getenv("A2A_REDIS_FLUSH_MS", 50))  # max delay before a partial batch is sent
+A2A_LOAD_EWMA_ALPHA = float(os.getenv("A2A_LOAD_EWMA_ALPHA", 0.2))  # weight of the newest latency/error sample
 
 # RapidAPI Configuration for SEO Audit
 RAPIDAPI_KEY = os.getenv("RAPIDAPI_KEY")
@@ -95,6 +110,58 @@ AWARIO_WEBHOOK_URL = os.getenv("AWARIO_WEBHOOK_URL")
 MENTION_API_KEY = os.getenv("MENTION_API_KEY")
 MENTION_ACCOUNT_ID = os.getenv("MENTION_ACCOUNT_ID")
 
+# Provider base URLs, overridable to point at benchmarks/provider_stub_server.py
+SERANKING_BASE_URL = os.getenv("SERANKING_BASE_URL", "https://api4.seranking.com/v3")
+AWARIO_BASE_URL = os.getenv("AWARIO_BASE_URL", "https://awario.com/api/v1")
+MENTION_BASE_URL = os.getenv("MENTION_BASE_URL", "https://web.mention.com/api/accounts")
+
+# Provider rate limits (requests per second, shared by all workers via Redis)
+SERANKING_RATE_LIMIT = float(os.getenv("SERANKING_RATE_LIMIT", 5))
+AWARIO_RATE_LIMIT = float(os.getenv("AWARIO_RATE_LIMIT", 2))
+MENTION_RATE_LIMIT = float(os.getenv("MENTION_RATE_LIMIT", 2))
+PROVIDER_RATE_LIMIT_MAX_WAIT = float(os.getenv("PROVIDER_RATE_LIMIT_MAX_WAIT", 10))  # seconds queued before failing
+
+# SE Ranking keyword micro-batching
+SERANKING_BATCH_WINDOW_MS = int(os.getenv("SERANKING_BATCH_WINDOW_MS", 50))
+SERANKING_MAX_BATCH_SIZE = int(os.getenv("SERANKING_MAX_BATCH_SIZE", 100))  # vendor max keywords per call
+SERANKING_KEYWORD_TTL = int(os.getenv("SERANKING_KEYWORD_TTL", 3600))  # per-keyword result cache
+
+# Comprehensive analysis fan-out budget
+PROVIDER_DEADLINE_SECONDS = float(os.getenv("PROVIDER_DEADLINE_SECONDS", 8))  # per provider call
+PROVIDER_HEDGING_ENABLED = os.getenv("PROVIDER_HEDGING_ENABLED", "false").lower() == "true"
+
+# Background refresh of tracked brands' analysis before cache expiry
+ANALYSIS_REFRESH_INTERVAL = float(os.getenv("ANALYSIS_REFRESH_INTERVAL", 30))  # seconds between ticks
+ANALYSIS_REFRESH_AHEAD = float(os.getenv("ANALYSIS_REFRESH_AHEAD", 0.8))  # fraction of CACHE_TTL
+ANALYSIS_REFRESH_CONCURRENCY = int(os.getenv("ANALYSIS_REFRESH_CONCURRENCY", 2))
+ANALYSIS_REFRESH_MAX_TRACKED = int(os.getenv("ANALYSIS_REFRESH_MAX_TRACKED", 500))
+
+# Incremental mention polling and duplicate suppression
+MENTION_POLL_INTERVAL = float(os.getenv("MENTION_POLL_INTERVAL", 60))  # seconds
+MENTION_SEEN_CAPACITY = int(os.getenv("MENTION_SEEN_CAPACITY", 100000))  # IDs kept per worker
+MENTION_SEEN_TTL = int(os.getenv("MENTION_SEEN_TTL", 7 * 86400))  # shared seen-ID expiry in Redis
+# Polled from startup: comma-separated provider:topic[:account], e.g. "awario:acme,mention:inbox"
+MENTION_TRACKED_TOPICS = [t.strip() for t in os.getenv("MENTION_TRACKED_TOPICS", "").split(",") if t.strip()]
+
+# Webhook ingestion queue (Redis Stream, in-memory when Redis is down)
+WEBHOOK_BATCH_SIZE = int(os.getenv("WEBHOOK_BATCH_SIZE", 200))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", 10000))  # in-memory stand-in only
+WEBHOOK_STREAM_MAXLEN = int(os.getenv("WEBHOOK_STREAM_MAXLEN", 100000))  # backlog cap, 503 above it
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", 5))  # deliveries before an entry is dead-lettered
+
+# Mention notifications collapsed per topic into digest frames (0 disables)
+MENTION_DIGEST_WINDOW_MS = int(os.getenv("MENTION_DIGEST_WINDOW_MS", 500))
+MENTION_DIGEST_SAMPLES = int(os.getenv("MENTION_DIGEST_SAMPLES", 3))
+
+# Rolling per-brand sentiment series built from the mention stream
+SENTIMENT_SNAPSHOT_PATH = os.getenv("SENTIMENT_SNAPSHOT_PATH", "data/sentiment_snapshot.json")  # one file per worker pid
+SENTIMENT_SNAPSHOT_INTERVAL = float(os.getenv("SENTIMENT_SNAPSHOT_INTERVAL", 300))  # seconds
+
+# Per-worker search index over recent mentions (kept in sync through Redis)
+MENTION_INDEX_MEMORY_MB = int(os.getenv("MENTION_INDEX_MEMORY_MB", 64))
+MENTION_INDEX_MAX_AGE = int(os.getenv("MENTION_INDEX_MAX_AGE", 7 * 86400))  # seconds
+MENTION_INDEX_FEED_MAXLEN = int(os.getenv("MENTION_INDEX_FEED_MAXLEN", 50000))  # Redis feed that keeps every worker's index complete
+
 # Social Media API Keys
 FACEBOOK_ACCESS_TOKEN = os.getenv("FACEBOOK_ACCESS_TOKEN")
 INSTAGRAM_ACCESS_TOKEN = os.getenv("INSTAGRAM_ACCESS_TOKEN")
@@ -124,6 +191,31 @@ CACHE_TTL = int(os.getenv("CACHE_TTL", 3600))  # 1 hour
 REQUEST_TIMEOUT = int(os.getenv("REQUEST_TIMEOUT", 30))
 RATE_LIMIT_PER_MINUTE = int(os.getenv("RATE_LIMIT_PER_MINUTE", 60))
 
+# Startup: per-component time limits; optional integrations (Supabase,
+# database, git) may finish after the app starts serving
+STARTUP_COMPONENT_TIMEOUT = float(os.getenv("STARTUP_COMPONENT_TIMEOUT", 10))  # seconds
+STARTUP_REDIS_TIMEOUT = float(os.getenv("STARTUP_REDIS_TIMEOUT", 3))  # seconds; A2A and providers wait on it
+STARTUP_OPTIONAL_IN_BACKGROUND = os.getenv("STARTUP_OPTIONAL_IN_BACKGROUND", "true").lower() == "true"
+
+# Background dependency health probes (served from a cached snapshot)
+HEALTH_PROBE_INTERVAL = float(os.getenv("HEALTH_PROBE_INTERVAL", 15))  # seconds between rounds
+HEALTH_PROBE_TIMEOUT = float(os.getenv("HEALTH_PROBE_TIMEOUT", 3))  # seconds per probe
+HEALTH_PROBE_HISTORY = int(os.getenv("HEALTH_PROBE_HISTORY", 100))  # latencies kept for percentiles
+# Configured dependencies that must answer for /health/ready to pass
+HEALTH_CRITICAL_DEPENDENCIES = [d.strip() for d in os.getenv("HEALTH_CRITICAL_DEPENDENCIES", "redis,postgres").split(",") if d.strip()]
+LLM_HEALTH_URL = os.getenv("LLM_HEALTH_URL", "https://api.openai.com/v1/models")
+
+# Providers cache (bounded TTL-LRU with stale-while-revalidate)
+PROVIDERS_CACHE_MAX_ENTRIES = int(os.getenv("PROVIDERS_CACHE_MAX_ENTRIES", 1024))
+PROVIDERS_CACHE_STALE_TTL = int(os.getenv("PROVIDERS_CACHE_STALE_TTL", 600))  # 10 minutes
+
+# Shared HTTP pool for marketing providers
+PROVIDER_HTTP_MAX_CONNECTIONS = int(os.getenv("PROVIDER_HTTP_MAX_CONNECTIONS", 100))
+PROVIDER_HTTP_MAX_PER_HOST = int(os.getenv("PROVIDER_HTTP_MAX_PER_HOST", 10))
+PROVIDER_HTTP_DNS_TTL = int(os.getenv("PROVIDER_HTTP_DNS_TTL", 300))  # seconds
+PROVIDER_HTTP_KEEPALIVE = float(os.getenv("PROVIDER_HTTP_KEEPALIVE", 30))  # seconds
+PROVIDER_HTTP_CONNECT_TIMEOUT = float(os.getenv("PROVIDER_HTTP_CONNECT_TIMEOUT", 5))  # seconds
+
 # Enhanced Agent configurations with MCP capabilities
 AGENTS_CONFIG = [
     {
@@ -0,0 +1,166 @@
+"""
+Dependency Health Prober
+فحص دوري لصحة الاعتماديات الخارجية في الخلفية
+
+Probes registered dependencies (Supabase, Postgres, Redis, the LLM API,
+marketing providers) concurrently on a fixed interval, each with its own
+timeout, and keeps recent latencies and errors per dependency. After every
+round the snapshot is rebuilt once, so health endpoints return it in
+constant time instead of touching any dependency, and readiness is derived
+from the same snapshot: ready once every critical dependency answered its
+latest probe.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+Probe = Callable[[], Awaitable[Any]]
+
+
+def _percentile(ordered: List[float], q: float) -> float:
+    return ordered[min(int(len(ordered) * q), len(ordered) - 1)]
+
+
+class DependencyHealth:
+    """نتائج الفحوص الأخيرة لاعتمادية واحدة"""
+
+    def __init__(self, name: str, probe: Probe, critical: bool, history: int):
+        self.name = name
+        self.probe = probe
+        self.critical = critical
+        self.latencies: deque = deque(maxlen=history)
+        self.outcomes: deque = deque(maxlen=history)
+        self.errors: deque = deque(maxlen=10)
+        self.checks = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.last_ok: Optional[bool] = None
+        self.last_checked: Optional[str] = None
+
+    def record(self, latency: float, error: Optional[str] = None):
+        self.checks += 1
+        self.last_checked = datetime.now().isoformat()
+        self.last_ok = error is None
+        self.outcomes.append(self.last_ok)
+        if error is None:
+            self.latencies.append(latency)
+            self.consecutive_failures = 0
+        else:
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.errors.append({"at": self.last_checked, "error": error})
+
+    def snapshot(self) -> Dict[str, Any]:
+        if self.last_ok is None:
+            status = "pending"
+        elif not self.last_ok:
+            status = "down"
+        elif self.outcomes.count(False) * 10 > len(self.outcomes):
+            status = "degraded"  # answering now, but failed over 10% of recent probes
+        else:
+            status = "up"
+        ordered = sorted(self.latencies)
+        return {
+            "status": status,
+            "critical": self.critical,
+            "latency_ms": {
+                "last": round(self.latencies[-1] * 1000, 2),
+                "p50": round(_percentile(ordered, 0.5) * 1000, 2),
+                "p95": round(_percentile(ordered, 0.95) * 1000, 2),
+                "p99": round(_percentile(ordered, 0.99) * 1000, 2)
+            } if ordered else None,
+            "checks": self.checks,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "last_checked": self.last_checked,
+            "recent_errors": list(self.errors)
+        }
+
+
+class HealthProber:
+    """يفحص الاعتماديات دورياً ويحتفظ بلقطة جاهزة لنقاط الصحة"""
+
+    def __init__(self, interval: float = 15, timeout: float = 3, history: int = 100):
+        self.interval = interval
+        self.timeout = timeout
+        self.history = history
+        self.dependencies: Dict[str, DependencyHealth] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._snapshot: Dict[str, Any] = {"status": "starting", "ready": False, "dependencies": {}}
+        self.rounds = 0
+
+    def register(self, name: str, probe: Probe, critical: bool = False):
+        """إضافة اعتمادية؛ الفحص ينجح ما لم يرفع استثناء"""
+        self.dependencies[name] = DependencyHealth(name, probe, critical, self.history)
+
+    async def _check(self, dependency: DependencyHealth):
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(dependency.probe(), self.timeout)
+            dependency.record(time.perf_counter() - started)
+        except asyncio.TimeoutError:
+            dependency.record(time.perf_counter() - started, f"timeout after {self.timeout}s")
+        except Exception as e:
+            dependency.record(time.perf_counter() - started, f"{type(e).__name__}: {str(e)[:200]}")
+
+    async def probe_all(self):
+        """جولة فحص واحدة لكل الاعتماديات بالتوازي ثم تحديث اللقطة"""
+        await asyncio.gather(*(self._check(d) for d in self.dependencies.values()))
+        self.rounds += 1
+        self._rebuild()
+
+    def _rebuild(self):
+        dependencies = {name: d.snapshot() for name, d in self.dependencies.items()}
+        critical_down = [
+            name for name, d in dependencies.items()
+            if d["critical"] and d["status"] in ("down", "pending")
+        ]
+        if critical_down:
+            status = "unhealthy"
+        elif any(d["status"] in ("down", "degraded") for d in dependencies.values()):
+            status = "degraded"
+        else:
+            status = "healthy"
+        self._snapshot = {
+            "status": status,
+            "ready": self.rounds > 0 and not critical_down,
+            "not_ready_reasons": critical_down,
+            "checked_at": datetime.now().isoformat(),
+            "rounds": self.rounds,
+            "interval_s": self.interval,
+            "dependencies": dependencies
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        """آخر لقطة محسوبة (لا تلمس أي اعتمادية)"""
+        return self._snapshot
+
+    def is_ready(self) -> bool:
+        return self._snapshot["ready"]
+
+    async def _run(self):
+        while True:
+            try:
+                await self.probe_all()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Health probe round failed: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Health prober started for {', '.join(self.dependencies) or 'no dependencies'}")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
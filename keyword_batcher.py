@@ -0,0 +1,180 @@
+"""
+Keyword Micro-Batching
+تجميع طلبات الكلمات المفتاحية
+
+Collects keyword lookups from concurrent callers over a short window,
+dedupes them, splits them into vendor-sized batches and hands each result back
+to every waiting caller. A per-keyword TTL cache sits behind it so popular
+Arabic keywords shared by many users are fetched once.
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from provider_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# (keywords, location) -> {keyword: data}
+BatchFetcher = Callable[[List[str], str], Awaitable[Dict[str, Any]]]
+
+
+class KeywordBatcher:
+    """مجمّع طلبات الكلمات المفتاحية عبر الطلبات المتزامنة"""
+
+    def __init__(
+        self,
+        fetch_batch: BatchFetcher,
+        window: float = 0.05,
+        max_batch_size: int = 100,
+        result_ttl: float = 3600,
+        max_cached: int = 10000
+    ):
+        self.fetch_batch = fetch_batch
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.results = TTLCache(max_entries=max_cached, ttl=result_ttl, stale_ttl=0, redis_prefix="keyword_data")
+        # location -> {keyword: future shared by every caller waiting on it}
+        self._pending: Dict[str, Dict[str, asyncio.Future]] = {}
+        # future -> callers still waiting on it; a pending keyword is dropped
+        # only when the last of them is cancelled
+        self._waiters: Dict[asyncio.Future, int] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._batches: Set[asyncio.Task] = set()
+        self.stats = {
+            "lookups": 0,
+            "keywords_requested": 0,
+            "cache_hits": 0,
+            "deduplicated": 0,
+            "batches_sent": 0,
+            "keywords_sent": 0,
+            "batch_errors": 0,
+            "abandoned": 0
+        }
+
+    @staticmethod
+    def _result_key(location: str, keyword: str) -> str:
+        return f"{location}:{keyword}"
+
+    async def lookup(self, keywords: List[str], location: str = "SA") -> Dict[str, Any]:
+        """إرجاع بيانات كل كلمة؛ الكلمات غير المخزنة تنضم للدفعة الحالية"""
+        self.stats["lookups"] += 1
+        results: Dict[str, Any] = {}
+        waiting: Dict[str, asyncio.Future] = {}
+
+        unique = list(dict.fromkeys(k.strip() for k in keywords if k and k.strip()))
+        self.stats["keywords_requested"] += len(unique)
+        # One round trip for all keywords (MGET) instead of one GET each
+        cached = await self.results.get_many([self._result_key(location, k) for k in unique])
+        for keyword in unique:
+            value = cached.get(self._result_key(location, keyword))
+            if value is not None:
+                self.stats["cache_hits"] += 1
+                results[keyword] = value
+                continue
+            waiting[keyword] = self._enqueue(keyword, location)
+
+        if waiting:
+            # Shielded: a caller that is cancelled (e.g. by an aggregator
+            # deadline) must not cancel the future other callers share
+            try:
+                done = await asyncio.gather(
+                    *(asyncio.shield(future) for future in waiting.values()), return_exceptions=True
+                )
+            finally:
+                self._release(waiting, location)
+            for keyword, value in zip(waiting, done):
+                if isinstance(value, BaseException):
+                    raise value
+                results[keyword] = value
+        return results
+
+    def _release(self, waiting: Dict[str, asyncio.Future], location: str):
+        """إنهاء انتظار المستدعي؛ الكلمة التي لم تُرسل بعد وبلا منتظرين تُحذف"""
+        pending = self._pending.get(location, {})
+        for keyword, future in waiting.items():
+            left = self._waiters.get(future, 1) - 1
+            if left > 0:
+                self._waiters[future] = left
+                continue
+            self._waiters.pop(future, None)
+            if future.done():
+                continue
+            # Already in a sent batch: let it finish so the result is cached
+            if pending.get(keyword) is future:
+                del pending[keyword]
+                future.cancel()
+                self.stats["abandoned"] += 1
+        if location in self._pending and not pending:
+            del self._pending[location]
+            timer = self._timers.pop(location, None)
+            if timer:
+                timer.cancel()
+
+    def _enqueue(self, keyword: str, location: str) -> asyncio.Future:
+        pending = self._pending.setdefault(location, {})
+        if keyword in pending:
+            self.stats["deduplicated"] += 1
+            future = pending[keyword]
+            self._waiters[future] = self._waiters.get(future, 0) + 1
+            return future
+
+        future = asyncio.get_running_loop().create_future()
+        pending[keyword] = future
+        self._waiters[future] = 1
+        if len(pending) >= self.max_batch_size:
+            self._flush(location)
+        elif location not in self._timers:
+            self._timers[location] = asyncio.get_running_loop().call_later(
+                self.window, self._flush, location
+            )
+        return future
+
+    def _flush(self, location: str):
+        """إرسال الكلمات المعلقة على دفعات بحجم حد المزود"""
+        timer = self._timers.pop(location, None)
+        if timer:
+            timer.cancel()
+        pending = self._pending.pop(location, {})
+        keywords = list(pending)
+        for start in range(0, len(keywords), self.max_batch_size):
+            chunk = {k: pending[k] for k in keywords[start:start + self.max_batch_size]}
+            task = asyncio.create_task(self._send(chunk, location))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _send(self, chunk: Dict[str, asyncio.Future], location: str):
+        self.stats["batches_sent"] += 1
+        self.stats["keywords_sent"] += len(chunk)
+        try:
+            data = await self.fetch_batch(list(chunk), location)
+        except Exception as e:
+            self.stats["batch_errors"] += 1
+            logger.error(f"Keyword batch of {len(chunk)} failed: {str(e)}")
+            for future in chunk.values():
+                if not future.done():
+                    future.set_exception(e)
+                    # Callers that went away must not leave an unretrieved exception
+                    future.exception()
+            return
+
+        # Callers get their results before the cache write round trip
+        found: Dict[str, Any] = {}
+        for keyword, future in chunk.items():
+            value: Optional[Any] = data.get(keyword)
+            if value is not None:
+                found[self._result_key(location, keyword)] = value
+            if not future.done():
+                future.set_result(value)
+        await self.results.set_many(found)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """إحصائيات التجميع والتخزين"""
+        sent = self.stats["keywords_sent"]
+        return {
+            **self.stats,
+            "avg_batch_size": round(sent / self.stats["batches_sent"], 2) if self.stats["batches_sent"] else 0.0,
+            "pending": sum(len(p) for p in self._pending.values()),
+            "cached_keywords": len(self.results)
+        }
@@ -4,23 +4,31 @@ Enhanced Main FastAPI Application with MCP & A2A Protocol Integration
 التطبيق الرئيسي المحسن مع تكامل بروتوكولات MCP و A2A
 """
 
+import asyncio
+import hmac
 import logging
 import os
 from datetime import datetime
-from fastapi import FastAPI, WebSocket, HTTPException
+from typing import Optional
+from fastapi import FastAPI, WebSocket, HTTPException, Request, Header, Depends
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 
 # Import enhanced configurations and managers
 from config import (
     APP_VERSION, APP_NAME, APP_DESCRIPTION, DEBUG,
-    ENHANCED_PROTOCOLS_AVAILABLE, FEATURES, SECURITY_CONFIG, LOGGING_CONFIG
+    ENHANCED_PROTOCOLS_AVAILABLE, FEATURES, SECURITY_CONFIG, LOGGING_CONFIG,
+    WEBHOOK_BATCH_SIZE, WEBHOOK_QUEUE_SIZE, WEBHOOK_STREAM_MAXLEN, WEBHOOK_MAX_ATTEMPTS, JWT_SECRET_KEY
 )
-from websocket_manager import handle_websocket_connection, manager
+from websocket_manager import handle_websocket_connection, manager, mention_digest, set_companion
+from agents import UnifiedMorvoCompanion
 from models import AwarioWebhookData, ChatRequest
+from providers import providers_manager
+from webhook_pipeline import WebhookPipeline, WebhookQueueFull, awario_event_data
 
 # Import modular protocols
-from protocols import EnhancedProtocolManager
+from protocols import EnhancedProtocolManager, verify_jwt_token
 
 # Import route modules
 from routes.chat import router as chat_router
@@ -37,6 +45,20 @@ logger = logging.getLogger(__name__)
 # Initialize global protocol manager
 protocol_manager = None
 
+async def forward_polled_mentions():
+    """بث الإشارات الجديدة من الاستطلاع لعملاء WebSocket (الـ webhooks تبث إشاراتها بنفسها)"""
+    async for mention in providers_manager.mention_ingestor.stream():
+        if mention.get("via") == "webhook":
+            continue
+        try:
+            await mention_digest.publish({
+                "type": "new_mention",
+                "source": mention["provider"],
+                "data": {k: v for k, v in mention.items() if k not in ("provider", "via")}
+            })
+        except Exception as e:
+            logger.error(f"خطأ في بث إشارة مستطلعة: {e}")
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """إدارة دورة حياة التطبيق المحسنة مع بروتوكولات MCP و A2A"""
@@ -67,6 +89,35 @@ async def lifespan(app: FastAPI):
         logger.warning("⚠️ البروتوكولات المحسنة غير متاحة - متابعة التشغيل في الوضع الأساسي")
         app.state.protocol_manager = None
     
+    # Shared companion for every WebSocket connection in this worker, on the
+    # protocol manager's Supabase client instead of a second one of its own
+    pm = app.state.protocol_manager
+    supabase_pending = bool(pm) and pm.supabase is None and pm.supabase_pending()
+    app.state.companion = UnifiedMorvoCompanion(
+        pm.supabase if pm else None,
+        load_system_prompt=False,
+        create_supabase_client=not supabase_pending
+    )
+    if supabase_pending:
+        # Still connecting in the background: attach it (and reload the prompt) when ready
+        pm.on_supabase_ready(app.state.companion.attach_supabase)
+    await app.state.companion.ensure_system_prompt()
+    set_companion(app.state.companion)
+    logger.info("🤖 تم تهيئة رفيق مورفو المشترك")
+    
+    # Webhooks are acknowledged immediately and processed by this consumer
+    app.state.webhook_pipeline = WebhookPipeline(
+        protocol_manager.redis_client if app.state.protocol_manager else None,
+        broadcast=mention_digest.publish,
+        ingestor=providers_manager.mention_ingestor,
+        batch_size=WEBHOOK_BATCH_SIZE,
+        queue_size=WEBHOOK_QUEUE_SIZE,
+        stream_max_len=WEBHOOK_STREAM_MAXLEN,
+        max_attempts=WEBHOOK_MAX_ATTEMPTS
+    )
+    await app.state.webhook_pipeline.start()
+    app.state.mention_forwarder = asyncio.create_task(forward_polled_mentions())
+    
     # Log enabled features
     enabled_features = [feature for feature, enabled in FEATURES.items() if enabled]
     logger.info(f"🎯 الميزات المفعلة: {', '.join(enabled_features)}")
@@ -75,6 +126,10 @@ async def lifespan(app: FastAPI):
     
     # Shutdown protocols
     logger.info("🛑 إيقاف Morvo AI...")
+    app.state.mention_forwarder.cancel()
+    await asyncio.gather(app.state.mention_forwarder, return_exceptions=True)
+    await app.state.webhook_pipeline.stop()
+    await mention_digest.flush_all()
     if protocol_manager:
         try:
             await protocol_manager.shutdown()
@@ -170,7 +225,9 @@ async def detailed_health_check():
             {"id": "M5", "name": "محلل البيانات", "status": "active"}
         ],
         "websocket_connections": manager.get_connection_count(),
-        "features": FEATURES
+        "features": FEATURES,
+        "webhooks": await app.state.webhook_pipeline.get_stats(),
+        "mention_digest": mention_digest.get_stats()
     }
     
     # Add enhanced protocol health if available
@@ -186,6 +243,22 @@ async def detailed_health_check():
     
     return base_health
 
+@app.get("/health/ready")
+async def readiness_check():
+    """جاهزية استقبال الطلبات حسب آخر فحص للاعتماديات الحرجة"""
+    protocol_manager_ = getattr(app.state, 'protocol_manager', None)
+    if not protocol_manager_:
+        # Basic mode has no external dependencies to wait for
+        return {"ready": True, "mode": "basic"}
+    probes = protocol_manager_.health_prober.snapshot()
+    body = {
+        "ready": probes["ready"],
+        "status": probes["status"],
+        "not_ready_reasons": probes.get("not_ready_reasons", []),
+        "checked_at": probes.get("checked_at")
+    }
+    return JSONResponse(status_code=200 if probes["ready"] else 503, content=body)
+
 @app.get("/protocols/status")
 async def protocols_status():
     """حالة البروتوكولات المحسنة"""
@@ -245,6 +318,84 @@ async def a2a_network_status():
         logger.error(f"خطأ في جلب حالة شبكة A2A: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/a2a/queue")
+async def a2a_queue_status(dead_letters: int = 20):
+    """حالة طابور التسليم الدائم وأحدث الرسائل الميتة"""
+    queue = _a2a_handler().durable_queue
+    return {
+        "stats": queue.get_stats(),
+        "dead_letters": await queue.dead_letters(min(dead_letters, 200))
+    }
+
+def _a2a_handler():
+    if not getattr(app.state, 'protocol_manager', None) or not app.state.protocol_manager.a2a_handler:
+        raise HTTPException(status_code=503, detail="بروتوكول A2A غير متاح")
+    return app.state.protocol_manager.a2a_handler
+
+@app.get("/a2a/capabilities/{capability}")
+async def a2a_capability_agents(capability: str):
+    """الوكلاء المالكون لقدرة ما مع مؤشرات الحمل"""
+    handler = _a2a_handler()
+    return {"capability": capability, "agents": handler.find_agents(capability)}
+
+def _a2a_token_valid(handler, agent_id: str, authorization: Optional[str]) -> bool:
+    """Bearer token: the token registered for this agent or a JWT signed with JWT_SECRET_KEY"""
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return False
+    expected = handler.authentication_tokens.get(agent_id)
+    if expected and hmac.compare_digest(token.encode(), expected.encode()):
+        return True
+    return verify_jwt_token(token, JWT_SECRET_KEY) is not None
+
+def require_a2a_auth(agent_id: str, authorization: Optional[str] = Header(None)):
+    if not _a2a_token_valid(_a2a_handler(), agent_id, authorization):
+        raise HTTPException(status_code=401, detail="مصادقة A2A مطلوبة", headers={"WWW-Authenticate": "Bearer"})
+
+@app.post("/agents/{agent_id}/receive", dependencies=[Depends(require_a2a_auth)])
+async def a2a_receive(agent_id: str, payload: dict):
+    """استقبال رسالة A2A لوكيل يعمل في هذه العملية"""
+    return await _a2a_handler().receive(agent_id, payload)
+
+@app.post("/agents/{agent_id}/receive_batch", dependencies=[Depends(require_a2a_auth)])
+async def a2a_receive_batch(agent_id: str, payload: dict):
+    """استقبال دفعة رسائل A2A (بديل HTTP لاتصال WebSocket)"""
+    return {"replies": await _a2a_handler().receive_batch(agent_id, payload.get("messages", []))}
+
+@app.websocket("/agents/{agent_id}/ws")
+async def a2a_websocket(websocket: WebSocket, agent_id: str):
+    """اتصال A2A دائم: دفعات رسائل وردود مطابقة بمعرف الرسالة"""
+    try:
+        handler = _a2a_handler()
+    except HTTPException:
+        await websocket.close(code=1013)
+        return
+    if not _a2a_token_valid(handler, agent_id, websocket.headers.get("authorization")):
+        # Closing before accept rejects the handshake (HTTP 403)
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+
+    async def reply(messages: list):
+        replies = await handler.receive_batch(agent_id, messages)
+        await websocket.send_json({"type": "replies", "replies": replies})
+
+    # Frames are answered concurrently so one slow batch doesn't hold the socket
+    pending = set()
+    try:
+        while True:
+            frame = await websocket.receive_json()
+            if frame.get("type") != "batch":
+                continue
+            task = asyncio.create_task(reply(frame.get("messages", [])))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+    except Exception as e:
+        logger.debug(f"A2A WebSocket for {agent_id} closed: {e}")
+    finally:
+        for task in pending:
+            task.cancel()
+
 @app.post("/chat")
 async def chat_endpoint(request: ChatRequest):
     """نقطة نهاية الدردشة المحسنة مع MCP و A2A"""
@@ -286,77 +437,114 @@ async def websocket_endpoint(websocket: WebSocket, user_id: str):
     await handle_websocket_connection(websocket, user_id)
 
 # Enhanced webhook endpoints
-@app.post("/webhooks/awario")
-async def awario_webhook(payload: AwarioWebhookData):
-    """استقبال webhook من Awario للإشارات الجديدة"""
+async def _enqueue_webhook(provider: str, mention_id: str, data: dict) -> JSONResponse:
+    """إضافة الإشارة لطابور المعالجة والرد فوراً بـ 202"""
     try:
-        # Store in enhanced protocols if available
-        if hasattr(app.state, 'protocol_manager') and app.state.protocol_manager:
-            try:
-                # Cache the mention data
-                await app.state.protocol_manager.redis_client.hset(
-                    "mentions:awario",
-                    payload.mention_id,
-                    {
-                        "content": payload.content,
-                        "sentiment": payload.sentiment,
-                        "timestamp": payload.timestamp.isoformat()
-                    }
-                )
-                logger.info(f"تم حفظ إشارة Awario في التخزين المؤقت: {payload.mention_id}")
-            except Exception as e:
-                logger.warning(f"فشل في حفظ إشارة Awario: {e}")
-        
-        # بث الإشارة الجديدة لجميع المتصلين
-        await manager.broadcast({
-            "type": "new_mention",
-            "source": "awario",
-            "data": {
-                "mention_id": payload.mention_id,
-                "content": payload.content,
-                "source": payload.source,
-                "sentiment": payload.sentiment,
-                "author": payload.author,
-                "url": payload.url,
-                "timestamp": payload.timestamp.isoformat()
-            }
-        })
-        
-        return {"status": "received", "message": "تم استقبال الإشارة وبثها"}
-        
+        await app.state.webhook_pipeline.enqueue(provider, mention_id, data)
+    except WebhookQueueFull:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "busy", "message": "الطابور ممتلئ، أعد المحاولة لاحقاً"},
+            headers={"Retry-After": "5"}
+        )
     except Exception as e:
-        logger.error(f"خطأ في webhook Awario: {e}")
+        logger.error(f"خطأ في webhook {provider}: {e}")
         raise HTTPException(status_code=500, detail="خطأ في معالجة webhook")
+    return JSONResponse(status_code=202, content={"status": "accepted", "mention_id": mention_id})
 
-@app.post("/webhooks/mention")
+@app.post("/webhooks/awario", status_code=202)
+async def awario_webhook(payload: AwarioWebhookData):
+    """استقبال webhook من Awario للإشارات الجديدة"""
+    return await _enqueue_webhook("awario", payload.mention_id, awario_event_data(payload))
+
+@app.post("/webhooks/mention", status_code=202)
 async def mention_webhook(payload: dict):
     """استقبال webhook من Mention"""
+    mention_id = payload.get("id")
+    if mention_id is None:
+        raise HTTPException(status_code=422, detail="معرف الإشارة (id) مطلوب")
+    return await _enqueue_webhook("mention", str(mention_id), payload)
+
+@app.post("/webhooks/{provider}/bulk", status_code=202)
+async def bulk_mentions_webhook(provider: str, request: Request):
+    """استقبال دفعة إشارات بصيغة NDJSON (سطر JSON لكل إشارة)"""
+    if provider not in ("awario", "mention"):
+        raise HTTPException(status_code=404, detail="مزود غير معروف")
     try:
-        # Store in enhanced protocols if available
-        if hasattr(app.state, 'protocol_manager') and app.state.protocol_manager:
-            try:
-                mention_id = payload.get("id", "unknown")
-                await app.state.protocol_manager.redis_client.hset(
-                    "mentions:mention",
-                    mention_id,
-                    payload
-                )
-                logger.info(f"تم حفظ إشارة Mention في التخزين المؤقت: {mention_id}")
-            except Exception as e:
-                logger.warning(f"فشل في حفظ إشارة Mention: {e}")
-        
-        # Broadcast the new mention
-        await manager.broadcast({
-            "type": "new_mention",
-            "source": "mention",
-            "data": payload
-        })
-        
-        return {"status": "received", "message": "تم استقبال إشارة Mention"}
-        
+        summary = await app.state.webhook_pipeline.ingest_ndjson(provider, request.stream())
+    except ValueError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
-        logger.error(f"خطأ في webhook Mention: {e}")
+        logger.error(f"خطأ في webhook {provider} المجمع: {e}")
         raise HTTPException(status_code=500, detail="خطأ في معالجة webhook")
+    if summary["queue_full"]:
+        return JSONResponse(status_code=503, content=summary, headers={"Retry-After": "5"})
+    return JSONResponse(status_code=202, content={"status": "accepted", **summary})
+
+@app.get("/sentiment/{brand}")
+async def brand_sentiment(brand: str, resolution: str = "hour", points: int = 24):
+    """السلسلة الزمنية للمشاعر وحجم الإشارات لعلامة تجارية"""
+    from sentiment_store import RESOLUTIONS
+    if resolution not in RESOLUTIONS:
+        raise HTTPException(status_code=422, detail=f"الدقة يجب أن تكون: {', '.join(RESOLUTIONS)}")
+    step, size = RESOLUTIONS[resolution]
+    points = max(1, min(points, size))
+    store = providers_manager.sentiment_store
+    return {
+        "brand": brand,
+        "resolution": resolution,
+        "breakdown": store.breakdown(brand, step * points),
+        "series": store.range(brand, resolution, points)
+    }
+
+@app.get("/mentions/search")
+async def search_mentions(
+    q: str,
+    brand: str = None,
+    since: datetime = None,
+    until: datetime = None,
+    limit: int = 50
+):
+    """بحث نصي في الإشارات الحديثة (الكلمة المنتهية بـ * بحث بالبادئة)"""
+    results = providers_manager.mention_index.search(
+        q,
+        brand=brand,
+        since=since.timestamp() if since else None,
+        until=until.timestamp() if until else None,
+        limit=max(1, min(limit, 500))
+    )
+    return {"query": q, "count": len(results), "mentions": results}
+
+@app.get("/mentions/tracked")
+async def list_tracked_mentions():
+    """الحسابات/المواضيع التي تُستطلع إشاراتها دورياً"""
+    targets = providers_manager.mention_ingestor.all_targets()
+    return {"targets": [{"provider": p, "account": a, "topic": t} for p, a, t in targets]}
+
+@app.post("/mentions/tracked", status_code=201)
+async def track_mentions(payload: dict):
+    """إضافة موضوع للاستطلاع الدوري: {"provider": "awario", "topic": "acme"}"""
+    try:
+        await providers_manager.mention_ingestor.add_target(
+            payload.get("provider", ""), payload.get("topic") or "inbox", payload.get("account")
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return {"status": "tracked"}
+
+@app.delete("/mentions/tracked")
+async def untrack_mentions(provider: str, topic: str = "inbox", account: str = None):
+    """إيقاف استطلاع موضوع"""
+    await providers_manager.mention_ingestor.remove_target(provider, topic, account)
+    return {"status": "untracked"}
+
+@app.get("/mentions/digests/{digest_id}")
+async def get_mention_digest(digest_id: str):
+    """التفاصيل الكاملة لملخص إشارات"""
+    mentions = mention_digest.get_digest(digest_id)
+    if mentions is None:
+        raise HTTPException(status_code=404, detail="الملخص غير موجود أو انتهت صلاحيته")
+    return {"digest_id": digest_id, "count": len(mentions), "mentions": mentions}
 
 # تشغيل التطبيق
 if __name__ == "__main__":
@@ -24,14 +24,16 @@ except ImportError:
 class MCPConnector:
     """موصل بروتوكول سياق النماذج لمورفو"""
     
-    def __init__(self):
-        self.supabase_client = None
+    def __init__(self, supabase_client: Optional[Any] = None):
+        self.supabase_client = supabase_client
         self._initialize_connector()
     
     def _initialize_connector(self):
         """تهيئة موصل MCP"""
         try:
-            if SUPABASE_AVAILABLE:
+            if self.supabase_client is not None:
+                logger.info("✅ MCP Connector initialized with shared Supabase client")
+            elif SUPABASE_AVAILABLE:
                 url = os.getenv('SUPABASE_URL')
                 key = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
                 if url and key:
@@ -122,9 +124,9 @@ class MCPConnector:
 # Singleton instance
 _mcp_connector = None
 
-def get_mcp_connector() -> MCPConnector:
+def get_mcp_connector(supabase_client: Optional[Any] = None) -> MCPConnector:
     """الحصول على نسخة وحيدة من موصل MCP"""
     global _mcp_connector
     if _mcp_connector is None:
-        _mcp_connector = MCPConnector()
+        _mcp_connector = MCPConnector(supabase_client)
     return _mcp_connector
@@ -0,0 +1,124 @@
+"""
+Mention Digest Aggregation
+تجميع إشعارات الإشارات في ملخصات
+
+Collapses bursts of new_mention frames for the same topic into one
+mention_digest frame per aggregation window (counts, sentiment breakdown and
+a few samples). A window holding a single mention is sent unchanged as the
+usual new_mention frame. Full digest contents are kept for a while so
+clients can fetch them on demand by digest_id.
+"""
+
+import asyncio
+import logging
+import uuid
+from collections import Counter, OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class MentionDigestAggregator:
+    """نافذة تجميع لكل موضوع تحوّل دفعات الإشارات إلى إطار واحد"""
+
+    def __init__(
+        self,
+        broadcast: Callable[[Dict[str, Any]], Awaitable[None]],
+        window: float = 0.5,
+        sample_size: int = 3,
+        max_digests: int = 1000
+    ):
+        self.broadcast = broadcast
+        self.window = window
+        self.sample_size = sample_size
+        self.max_digests = max_digests
+        # topic -> mention frames collected in the current window
+        self._windows: Dict[str, List[Dict[str, Any]]] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._flushes: Set[asyncio.Task] = set()
+        # digest_id -> full mentions, for on-demand detail
+        self._digests: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+        self.stats = {"mentions_in": 0, "frames_out": 0, "singles_out": 0, "digests_out": 0}
+
+    @staticmethod
+    def topic_of(frame: Dict[str, Any]) -> str:
+        """مفتاح التجميع: المصدر + العلامة + الكلمة المتتبعة (فلا تختلط علامتان)"""
+        data = frame.get("data") or {}
+        brand = data.get("brand") or "-"
+        keyword = data.get("topic") or data.get("keyword") or data.get("alert_id") or "all"
+        return f"{frame.get('source', 'unknown')}:{brand}:{keyword}"
+
+    async def publish(self, frame: Dict[str, Any]):
+        """بديل مباشر لـ broadcast: إطارات new_mention تُجمع والباقي يُمرر"""
+        if frame.get("type") != "new_mention" or self.window <= 0:
+            await self._send(frame)
+            return
+
+        self.stats["mentions_in"] += 1
+        topic = self.topic_of(frame)
+        self._windows.setdefault(topic, []).append(frame)
+        if topic not in self._timers:
+            self._timers[topic] = asyncio.get_running_loop().call_later(self.window, self._schedule_flush, topic)
+
+    def _schedule_flush(self, topic: str):
+        self._timers.pop(topic, None)
+        task = asyncio.create_task(self._flush(topic))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _send(self, frame: Dict[str, Any]):
+        self.stats["frames_out"] += 1
+        try:
+            await self.broadcast(frame)
+        except Exception as e:
+            logger.error(f"Mention frame broadcast failed: {str(e)}")
+
+    def build_digest(self, topic: str, frames: List[Dict[str, Any]]) -> Dict[str, Any]:
+        mentions = [frame.get("data") or {} for frame in frames]
+        digest_id = uuid.uuid4().hex
+        self._digests[digest_id] = mentions
+        while len(self._digests) > self.max_digests:
+            self._digests.popitem(last=False)
+        return {
+            "type": "mention_digest",
+            "digest_id": digest_id,
+            "topic": topic,
+            "source": frames[0].get("source"),
+            "brand": mentions[0].get("brand"),
+            "count": len(mentions),
+            "sentiment": dict(Counter(m.get("sentiment", "unknown") for m in mentions)),
+            "samples": mentions[:self.sample_size],
+            "window_ms": int(self.window * 1000),
+            "timestamp": datetime.now(timezone.utc).isoformat()
+        }
+
+    async def _flush(self, topic: str):
+        frames = self._windows.pop(topic, [])
+        if not frames:
+            return
+        if len(frames) == 1:
+            self.stats["singles_out"] += 1
+            await self._send(frames[0])
+            return
+        self.stats["digests_out"] += 1
+        await self._send(self.build_digest(topic, frames))
+
+    async def flush_all(self):
+        """إرسال كل النوافذ المفتوحة فوراً (عند الإيقاف)"""
+        for topic in list(self._timers):
+            self._timers.pop(topic).cancel()
+        await asyncio.gather(*(self._flush(topic) for topic in list(self._windows)))
+
+    def get_digest(self, digest_id: str) -> Optional[List[Dict[str, Any]]]:
+        """التفاصيل الكاملة لملخص سابق"""
+        return self._digests.get(digest_id)
+
+    def get_stats(self) -> Dict[str, Any]:
+        mentions = self.stats["mentions_in"]
+        mention_frames = self.stats["singles_out"] + self.stats["digests_out"]
+        return {
+            **self.stats,
+            "open_windows": len(self._windows),
+            "frames_per_mention": round(mention_frames / mentions, 3) if mentions else 0.0
+        }
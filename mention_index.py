@@ -0,0 +1,275 @@
+"""
+Mention Search Index
+فهرس بحث عكسي للإشارات مع تطبيع النص العربي
+
+In-process inverted index over mention text, updated from the ingestion
+stream. Arabic text is normalized (alef/hamza variants, taa marbuta, alef
+maqsura, diacritics, tatweel) at both index and query time. Supports term
+and prefix queries with brand and time filters. Memory is bounded by an
+approximate byte budget and a maximum age; the mentions with the oldest
+timestamps are evicted first.
+
+Each mention is committed by exactly one worker, so with Redis attached the
+committing worker also appends it to a capped feed stream that every worker
+tails; all indexes then hold the same mentions. Without Redis the index only
+sees this worker's mentions.
+"""
+
+import asyncio
+import bisect
+import heapq
+import json
+import logging
+import re
+import sys
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+_DIACRITICS = re.compile("[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed]")
+_TATWEEL = "\u0640"
+_CHAR_MAP = str.maketrans({
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا",
+    "ى": "ي", "ئ": "ي",
+    "ؤ": "و",
+    "ة": "ه"
+})
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def normalize_arabic(text: str) -> str:
+    """توحيد أشكال الحروف وإزالة التشكيل والتطويل"""
+    text = _DIACRITICS.sub("", text).replace(_TATWEEL, "")
+    return text.translate(_CHAR_MAP).lower()
+
+
+def tokenize(text: str, min_length: int = 2) -> List[str]:
+    return [t for t in _TOKEN.findall(normalize_arabic(text)) if len(t) >= min_length]
+
+
+class IndexedMention:
+    __slots__ = ("key", "ts", "brand", "provider", "mention", "terms", "size")
+
+    def __init__(self, key: str, ts: float, brand: Optional[str], provider: str, mention: Dict[str, Any], terms: Set[str]):
+        self.key = key
+        self.ts = ts
+        self.brand = brand
+        self.provider = provider
+        self.mention = mention
+        self.terms = terms
+        # Rough footprint: stored mention text plus one posting entry per term
+        self.size = sys.getsizeof(str(mention)) + sum(sys.getsizeof(t) + 64 for t in terms)
+
+
+class MentionIndex:
+    """فهرس عكسي محدود الذاكرة للإشارات الحديثة"""
+
+    def __init__(
+        self,
+        memory_budget: int = 64 * 1024 * 1024,
+        max_age: float = 7 * 86400,
+        feed_key: str = "mention_index_feed",
+        feed_max_len: int = 50000
+    ):
+        self.memory_budget = memory_budget
+        self.max_age = max_age
+        self.docs: Dict[str, IndexedMention] = {}
+        self.postings: Dict[str, Set[str]] = {}
+        # Kept sorted as terms come and go, for prefix queries
+        self._sorted_terms: List[str] = []
+        # (mention timestamp, key): late or backfilled mentions still evict in age order
+        self._by_age: List[Tuple[float, str]] = []
+        self.memory_used = 0
+        # Cross-worker feed (Redis Stream), attached by ProvidersManager
+        self.redis_client: Optional[Any] = None
+        self.feed_key = feed_key
+        self.feed_max_len = feed_max_len
+        # Random per boot: a restarted container keeps its hostname and PID 1,
+        # and must not skip the mentions it published before the restart
+        self._origin = uuid.uuid4().hex
+        # Start from the oldest retained entry so a new worker backfills
+        self._feed_id = "0-0"
+        self._feed_task: Optional[asyncio.Task] = None
+        self.stats = {"indexed": 0, "evicted": 0, "queries": 0, "feed_published": 0, "feed_received": 0}
+
+    @staticmethod
+    def _timestamp(mention: Dict[str, Any]) -> float:
+        value = mention.get("timestamp")
+        if value:
+            try:
+                return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+            except ValueError:
+                pass
+        return time.time()
+
+    def add(self, mention: Dict[str, Any]):
+        """فهرسة إشارة جديدة من تدفق الاستيعاب"""
+        text = mention.get("content") or mention.get("text") or ""
+        if not text or mention.get("id") is None:
+            return
+        provider = mention.get("provider", "unknown")
+        key = f"{provider}:{mention['id']}"
+        if key in self.docs:
+            return
+        ts = self._timestamp(mention)
+        if ts < time.time() - self.max_age:
+            return
+        brand = mention.get("brand") or mention.get("topic")
+        doc = IndexedMention(
+            key, ts, brand.strip().lower() if brand else None,
+            provider, mention, set(tokenize(text))
+        )
+        self.docs[key] = doc
+        heapq.heappush(self._by_age, (ts, key))
+        for term in doc.terms:
+            posting = self.postings.get(term)
+            if posting is None:
+                self.postings[term] = posting = set()
+                bisect.insort(self._sorted_terms, term)
+            posting.add(key)
+        self.memory_used += doc.size
+        self.stats["indexed"] += 1
+        self._evict()
+
+    def _remove(self, key: str):
+        doc = self.docs.pop(key, None)
+        if doc is None:
+            return
+        for term in doc.terms:
+            posting = self.postings.get(term)
+            if posting is not None:
+                posting.discard(key)
+                if not posting:
+                    del self.postings[term]
+                    del self._sorted_terms[bisect.bisect_left(self._sorted_terms, term)]
+        self.memory_used -= doc.size
+        self.stats["evicted"] += 1
+
+    def _evict(self):
+        cutoff = time.time() - self.max_age
+        while self._by_age:
+            ts, key = self._by_age[0]
+            if self.memory_used <= self.memory_budget and ts >= cutoff:
+                break
+            heapq.heappop(self._by_age)
+            self._remove(key)
+
+    def _prefix_keys(self, prefix: str) -> Set[str]:
+        keys: Set[str] = set()
+        start = bisect.bisect_left(self._sorted_terms, prefix)
+        for term in self._sorted_terms[start:]:
+            if not term.startswith(prefix):
+                break
+            keys |= self.postings.get(term, set())
+        return keys
+
+    def search(
+        self,
+        query: str,
+        brand: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        limit: int = 50
+    ) -> List[Dict[str, Any]]:
+        """بحث بكل الكلمات (AND)؛ الكلمة المنتهية بـ * تُعامل كبادئة"""
+        self.stats["queries"] += 1
+        self._evict()
+        candidates: List[Set[str]] = []
+        for raw in query.split():
+            prefix = raw.endswith("*")
+            terms = tokenize(raw.rstrip("*"), min_length=1)
+            for i, term in enumerate(terms):
+                if prefix and i == len(terms) - 1:
+                    candidates.append(self._prefix_keys(term))
+                else:
+                    candidates.append(self.postings.get(term, set()))
+        if not candidates:
+            return []
+
+        candidates.sort(key=len)
+        keys = set(candidates[0])
+        for other in candidates[1:]:
+            keys &= other
+            if not keys:
+                return []
+
+        brand_key = brand.strip().lower() if brand else None
+        hits = []
+        for key in keys:
+            doc = self.docs[key]
+            if brand_key and doc.brand != brand_key:
+                continue
+            if since is not None and doc.ts < since:
+                continue
+            if until is not None and doc.ts > until:
+                continue
+            hits.append(doc)
+        hits.sort(key=lambda d: d.ts, reverse=True)
+        return [d.mention for d in hits[:limit]]
+
+    # ---- cross-worker feed ----
+
+    async def publish(self, mentions: List[Dict[str, Any]]):
+        """فهرسة إشارات هذا العامل ومشاركتها مع بقية العمال عبر Redis"""
+        for mention in mentions:
+            self.add(mention)
+        if not mentions or not self.redis_client:
+            return
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            for mention in mentions:
+                pipe.xadd(
+                    self.feed_key,
+                    {"origin": self._origin, "mention": json.dumps(mention, ensure_ascii=False, default=str)},
+                    maxlen=self.feed_max_len,
+                    approximate=True
+                )
+            await pipe.execute()
+            self.stats["feed_published"] += len(mentions)
+        except Exception as e:
+            logger.warning(f"Mention index feed publish failed, indexed locally only: {str(e)}")
+
+    async def _follow(self):
+        while True:
+            try:
+                entries = await self.redis_client.xread({self.feed_key: self._feed_id}, count=500, block=1000)
+                for _, messages in entries or []:
+                    for entry_id, fields in messages:
+                        self._feed_id = entry_id
+                        origin = fields.get(b"origin", fields.get("origin"))
+                        if isinstance(origin, bytes):
+                            origin = origin.decode()
+                        if origin == self._origin:
+                            continue
+                        raw = fields.get(b"mention", fields.get("mention"))
+                        if raw:
+                            self.stats["feed_received"] += 1
+                            self.add(json.loads(raw))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Mention index feed read failed: {str(e)}")
+                await asyncio.sleep(1)
+
+    def start(self):
+        if self.redis_client and (self._feed_task is None or self._feed_task.done()):
+            self._feed_task = asyncio.create_task(self._follow())
+
+    async def stop(self):
+        if self._feed_task:
+            self._feed_task.cancel()
+            await asyncio.gather(self._feed_task, return_exceptions=True)
+            self._feed_task = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "shared": self.redis_client is not None,
+            "documents": len(self.docs),
+            "terms": len(self.postings),
+            "memory_used_mb": round(self.memory_used / (1024 * 1024), 2),
+            "memory_budget_mb": round(self.memory_budget / (1024 * 1024), 2)
+        }
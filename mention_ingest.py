@@ -0,0 +1,374 @@
+"""
+Incremental Mention Ingestion
+الاستيعاب التدريجي للإشارات من Awario و Mention
+
+Polls each tracked account/topic from its stored cursor instead of
+re-downloading the whole window, drops mentions already seen (via polling or
+the webhooks) with a bounded exact set, and pushes only new mentions to
+subscribed consumers as a stream. Cursors and seen IDs live in Redis when it
+is attached so every worker shares them, with in-memory fallbacks otherwise.
+Targets come from MENTION_TRACKED_TOPICS at startup and from the
+/mentions/tracked API; API targets are kept in Redis so every worker knows
+them. Each round a worker polls a target only after taking its Redis lock
+(SET NX EX poll_interval), so a target is polled by one worker per interval.
+"""
+
+import asyncio
+import json
+import logging
+import socket
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+CURSORS_KEY = "mention_cursors"
+TARGETS_KEY = "mention_targets"
+POLL_LOCK_PREFIX = "mention_poll_lock"
+PROVIDERS = ("awario", "mention")
+
+Target = Tuple[str, Optional[str], str]
+
+
+class SeenMentionSet:
+    """مجموعة محدودة لمعرفات الإشارات المستلمة (LRU محلي + Redis اختياري)"""
+
+    def __init__(self, capacity: int = 100000, ttl: int = 7 * 86400, redis_client: Optional[Any] = None):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.redis_client = redis_client
+        self._ids: "OrderedDict[str, None]" = OrderedDict()
+
+    def _remember(self, key: str):
+        self._ids[key] = None
+        self._ids.move_to_end(key)
+        while len(self._ids) > self.capacity:
+            self._ids.popitem(last=False)
+
+    async def check(self, keys: List[str]) -> List[bool]:
+        """True لكل معرف لم يُشاهد بعد، دون تسجيله (يُسجل لاحقاً بـ filter_new)"""
+        flags = [key not in self._ids for key in keys]
+        unknown = [i for i, new in enumerate(flags) if new]
+
+        if unknown and self.redis_client:
+            try:
+                pipe = self.redis_client.pipeline(transaction=False)
+                for i in unknown:
+                    pipe.exists(f"mention_seen:{keys[i]}")
+                for i, exists in zip(unknown, await pipe.execute()):
+                    flags[i] = not exists
+            except Exception as e:
+                logger.warning(f"Seen-mention check fell back to local set: {str(e)}")
+
+        seen_in_batch: Set[str] = set()
+        for i, key in enumerate(keys):
+            if key in seen_in_batch:
+                flags[i] = False
+            seen_in_batch.add(key)
+        return flags
+
+    async def filter_new(self, keys: List[str]) -> List[bool]:
+        """True لكل معرف لم يُشاهد من قبل؛ يُسجل المعرفات الجديدة"""
+        flags = [key not in self._ids for key in keys]
+        unknown = [i for i, new in enumerate(flags) if new]
+
+        if unknown and self.redis_client:
+            try:
+                # SET NX is atomic across workers: only the first one claims an ID
+                pipe = self.redis_client.pipeline()
+                for i in unknown:
+                    pipe.set(f"mention_seen:{keys[i]}", "1", nx=True, ex=self.ttl)
+                claimed = await pipe.execute()
+                for i, ok in zip(unknown, claimed):
+                    flags[i] = bool(ok)
+            except Exception as e:
+                logger.warning(f"Seen-mention check fell back to local set: {str(e)}")
+
+        for key in keys:
+            self._remember(key)
+        # Duplicates inside one batch count once
+        seen_in_batch: Set[str] = set()
+        for i, key in enumerate(keys):
+            if key in seen_in_batch:
+                flags[i] = False
+            seen_in_batch.add(key)
+        return flags
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+
+class MentionCursorStore:
+    """مؤشرات آخر جلب لكل مزود/حساب/موضوع"""
+
+    def __init__(self, redis_client: Optional[Any] = None):
+        self.redis_client = redis_client
+        self._cursors: Dict[str, Dict[str, Any]] = {}
+
+    @staticmethod
+    def field(provider: str, account: Optional[str], topic: str) -> str:
+        return f"{provider}:{account or 'default'}:{topic}"
+
+    async def get(self, field: str) -> Optional[Dict[str, Any]]:
+        if self.redis_client:
+            try:
+                raw = await self.redis_client.hget(CURSORS_KEY, field)
+                if raw:
+                    return json.loads(raw)
+            except Exception as e:
+                logger.warning(f"Mention cursor read failed: {str(e)}")
+        return self._cursors.get(field)
+
+    async def set(self, field: str, cursor: Dict[str, Any]):
+        self._cursors[field] = cursor
+        if self.redis_client:
+            try:
+                await self.redis_client.hset(CURSORS_KEY, field, json.dumps(cursor))
+            except Exception as e:
+                logger.warning(f"Mention cursor write failed: {str(e)}")
+
+
+class MentionIngestor:
+    """استطلاع تدريجي للإشارات وبث الجديد منها للمستهلكين"""
+
+    def __init__(
+        self,
+        providers_manager: Any,
+        poll_interval: float = 60.0,
+        seen_capacity: int = 100000,
+        seen_ttl: int = 7 * 86400,
+        subscriber_queue_size: int = 1000,
+        sentiment_store: Optional[Any] = None,
+        mention_index: Optional[Any] = None
+    ):
+        self.providers = providers_manager
+        # sentiment_store.BrandSentimentStore fed with every new mention
+        self.sentiment_store = sentiment_store
+        # mention_index.MentionIndex for text search over recent mentions
+        self.mention_index = mention_index
+        self.poll_interval = poll_interval
+        self.subscriber_queue_size = subscriber_queue_size
+        self.seen = SeenMentionSet(seen_capacity, seen_ttl)
+        self.cursors = MentionCursorStore()
+        # (provider, account, topic) targets polled by the background loop
+        self.targets: Set[Target] = set()
+        # Targets added through the API, re-read from Redis every round
+        self._shared_targets: Set[Target] = set()
+        self.redis_client: Optional[Any] = None
+        self._worker_id = f"{socket.gethostname()}:{uuid.uuid4().hex[:8]}"
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._loop_task: Optional[asyncio.Task] = None
+        self.stats = {
+            "polls": 0,
+            "polls_skipped_locked": 0,
+            "poll_errors": 0,
+            "received": 0,
+            "new": 0,
+            "duplicates": 0,
+            "dropped_slow_consumer": 0
+        }
+
+    def attach_redis(self, redis_client: Optional[Any]):
+        self.redis_client = redis_client
+        self.seen.redis_client = redis_client
+        self.cursors.redis_client = redis_client
+
+    def track(self, provider: str, topic: str, account: Optional[str] = None):
+        """إضافة حساب/موضوع إلى الاستطلاع الدوري (لهذا العامل)"""
+        if provider not in PROVIDERS:
+            raise ValueError(f"Unknown mention provider: {provider}")
+        self.targets.add((provider, account, topic))
+
+    def untrack(self, provider: str, topic: str, account: Optional[str] = None):
+        self.targets.discard((provider, account, topic))
+
+    def track_from_config(self, entries: List[str]):
+        """أهداف بصيغة provider:topic[:account] (مثل awario:acme)"""
+        for entry in entries:
+            provider, _, rest = entry.partition(":")
+            topic, _, account = rest.partition(":")
+            try:
+                self.track(provider.strip(), topic.strip() or "inbox", account.strip() or None)
+            except ValueError as e:
+                logger.warning(f"Ignoring tracked mention topic {entry!r}: {str(e)}")
+
+    async def add_target(self, provider: str, topic: str, account: Optional[str] = None):
+        """تتبع هدف في كل العمال (عبر Redis) أو في هذا العامل فقط بدونه"""
+        self.track(provider, topic, account)
+        if self.redis_client:
+            await self.redis_client.sadd(TARGETS_KEY, json.dumps([provider, account, topic]))
+
+    async def remove_target(self, provider: str, topic: str, account: Optional[str] = None):
+        self.untrack(provider, topic, account)
+        self._shared_targets.discard((provider, account, topic))
+        if self.redis_client:
+            await self.redis_client.srem(TARGETS_KEY, json.dumps([provider, account, topic]))
+
+    async def _sync_targets(self):
+        if not self.redis_client:
+            return
+        try:
+            members = await self.redis_client.smembers(TARGETS_KEY)
+            self._shared_targets = {tuple(json.loads(member)) for member in members}
+        except Exception as e:
+            logger.warning(f"Mention target sync failed, using the last known set: {str(e)}")
+
+    def all_targets(self) -> List[Target]:
+        return sorted(self.targets | self._shared_targets, key=lambda t: (t[0], t[1] or "", t[2]))
+
+    # ---- consumers ----
+
+    def subscribe(self) -> asyncio.Queue:
+        """طابور يستقبل الإشارات الجديدة فقط"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.subscriber_queue_size)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    async def stream(self) -> AsyncIterator[Dict[str, Any]]:
+        """تدفق الإشارات الجديدة كمكرر غير متزامن"""
+        queue = self.subscribe()
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self.unsubscribe(queue)
+
+    def _publish(self, mention: Dict[str, Any]):
+        for queue in self._subscribers:
+            if queue.full():
+                # A slow consumer loses its oldest mention rather than blocking ingestion
+                queue.get_nowait()
+                self.stats["dropped_slow_consumer"] += 1
+            queue.put_nowait(mention)
+
+    # ---- ingestion ----
+
+    async def ingest(self, provider: str, mentions: List[Dict[str, Any]], via: str = "poll") -> List[Dict[str, Any]]:
+        """تصفية المكرر ونشر الإشارات الجديدة (تُستدعى من الاستطلاع)"""
+        mentions = [m for m in mentions if m.get("id") is not None]
+        if not mentions:
+            return []
+        self.stats["received"] += len(mentions)
+        return await self.commit(provider, mentions, via)
+
+    async def filter_unseen(self, provider: str, mentions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """الإشارات التي لم تُشاهد بعد، دون تسجيلها كمشاهدة
+
+        للمستهلكين الذين يعيدون المحاولة (webhooks): تُسجل بـ commit بعد نجاح
+        البث والإقرار، فلا تُعامل دفعة فاشلة أعيدت قراءتها كمكررة.
+        """
+        mentions = [m for m in mentions if m.get("id") is not None]
+        if not mentions:
+            return []
+        self.stats["received"] += len(mentions)
+        flags = await self.seen.check([f"{provider}:{m['id']}" for m in mentions])
+        self.stats["duplicates"] += flags.count(False)
+        return [m for m, new in zip(mentions, flags) if new]
+
+    async def commit(self, provider: str, mentions: List[Dict[str, Any]], via: str = "poll") -> List[Dict[str, Any]]:
+        """تسجيل الإشارات كمشاهدة وتغذية المستهلكين بما فاز به هذا العامل"""
+        flags = await self.seen.filter_new([f"{provider}:{m['id']}" for m in mentions])
+
+        fresh = []
+        for mention, new in zip(mentions, flags):
+            if not new:
+                self.stats["duplicates"] += 1
+                continue
+            event = {**mention, "provider": provider, "via": via}
+            fresh.append(event)
+            if self.sentiment_store:
+                self.sentiment_store.record_mention(event)
+            self._publish(event)
+        if self.mention_index:
+            await self.mention_index.publish(fresh)
+        self.stats["new"] += len(fresh)
+        return fresh
+
+    async def poll(self, provider: str, topic: str, account: Optional[str] = None) -> List[Dict[str, Any]]:
+        """جلب ما بعد المؤشر المخزن لهدف واحد"""
+        field = self.cursors.field(provider, account, topic)
+        cursor = await self.cursors.get(field) or {}
+        since_id = cursor.get("since_id")
+        self.stats["polls"] += 1
+
+        if provider == "awario":
+            response = await self.providers.awario.monitor_mentions([topic], since_id=since_id)
+        elif provider == "mention":
+            response = await self.providers.mention.get_inbox_mentions(since_id=since_id)
+        else:
+            raise ValueError(f"Unknown mention provider: {provider}")
+
+        mentions = response.get("mentions", []) if isinstance(response, dict) else []
+        if provider == "awario":
+            # The tracked keyword is the brand for the sentiment series
+            mentions = [{"topic": topic, **m} for m in mentions]
+        fresh = await self.ingest(provider, mentions)
+
+        next_cursor = response.get("cursor") if isinstance(response, dict) else None
+        if next_cursor is None and mentions:
+            next_cursor = mentions[-1].get("id")
+        if next_cursor is not None and next_cursor != since_id:
+            await self.cursors.set(field, {"since_id": next_cursor, "updated_at": time.time()})
+        return fresh
+
+    async def _claim(self, provider: str, topic: str, account: Optional[str]) -> bool:
+        """قفل الهدف لهذه الجولة حتى لا يستطلعه أكثر من عامل"""
+        if not self.redis_client:
+            return True
+        key = f"{POLL_LOCK_PREFIX}:{self.cursors.field(provider, account, topic)}"
+        try:
+            # Held for the whole interval, not released: the other workers skip this round
+            return bool(await self.redis_client.set(key, self._worker_id, nx=True, ex=max(1, int(self.poll_interval))))
+        except Exception as e:
+            logger.warning(f"Mention poll lock unavailable for {key}, polling anyway: {str(e)}")
+            return True
+
+    async def poll_all(self):
+        await self._sync_targets()
+        candidates = self.all_targets()
+        claimed = await asyncio.gather(*(self._claim(p, t, a) for p, a, t in candidates))
+        targets = [target for target, ok in zip(candidates, claimed) if ok]
+        self.stats["polls_skipped_locked"] += len(candidates) - len(targets)
+        outcomes = await asyncio.gather(
+            *(self.poll(provider, topic, account) for provider, account, topic in targets),
+            return_exceptions=True
+        )
+        for (provider, account, topic), outcome in zip(targets, outcomes):
+            if isinstance(outcome, BaseException):
+                self.stats["poll_errors"] += 1
+                logger.warning(f"Mention poll failed for {provider}/{topic}: {str(outcome)}")
+
+    async def _run(self):
+        while True:
+            try:
+                await self.poll_all()
+            except Exception as e:
+                logger.error(f"Mention poll loop failed: {str(e)}")
+            await asyncio.sleep(self.poll_interval)
+
+    def start(self):
+        if self._loop_task is None or self._loop_task.done():
+            self._loop_task = asyncio.create_task(self._run())
+            logger.info(f"Mention ingestion started (interval={self.poll_interval}s)")
+
+    async def stop(self):
+        if self._loop_task:
+            self._loop_task.cancel()
+            await asyncio.gather(self._loop_task, return_exceptions=True)
+            self._loop_task = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """إحصائيات الاستيعاب ونسبة المكرر"""
+        received = self.stats["received"]
+        return {
+            **self.stats,
+            "duplicate_ratio": round(self.stats["duplicates"] / received, 3) if received else 0.0,
+            "seen_ids": len(self.seen),
+            "targets": len(self.targets | self._shared_targets),
+            "subscribers": len(self._subscribers)
+        }
@@ -0,0 +1,31 @@
+-- Migration: 03_record_conversation_turn.sql
+-- Records a full companion turn (user message, assistant reply, conversation
+-- timestamp) in a single transaction so the WebSocket handler needs one round trip.
+
+CREATE OR REPLACE FUNCTION public.record_conversation_turn(
+    p_conversation_id UUID,
+    p_user_id UUID,
+    p_user_content TEXT,
+    p_assistant_content TEXT,
+    p_user_created_at TIMESTAMPTZ DEFAULT now(),
+    p_assistant_created_at TIMESTAMPTZ DEFAULT now(),
+    p_metadata JSONB DEFAULT NULL
+)
+RETURNS VOID AS $$
+BEGIN
+    -- Make sure the conversation exists before the messages reference it
+    INSERT INTO public.conversations (id, user_id, last_message_at)
+    VALUES (p_conversation_id, p_user_id, p_assistant_created_at)
+    ON CONFLICT (id) DO UPDATE
+        SET last_message_at = GREATEST(public.conversations.last_message_at, EXCLUDED.last_message_at),
+            updated_at = now();
+
+    INSERT INTO public.messages (conversation_id, role, content, metadata, created_at)
+    VALUES
+        (p_conversation_id, 'user', p_user_content, p_metadata, p_user_created_at),
+        (p_conversation_id, 'assistant', p_assistant_content, p_metadata, p_assistant_created_at);
+END;
+$$ LANGUAGE plpgsql SECURITY INVOKER;
+
+-- Add comment
+COMMENT ON FUNCTION public.record_conversation_turn IS 'Atomically persists one user/assistant turn of the unified مورفو companion';
@@ -55,6 +55,7 @@ class AwarioWebhookData(BaseModel):
     author: str
     url: str
     timestamp: datetime
+    brand: Optional[str] = None  # Awario alert name; feeds the per-brand sentiment series
 
 # Response models
 class HealthResponse(BaseModel):
@@ -23,14 +23,34 @@ from .utils import (
     MessageValidator
 )
 
-# Optional MCP imports - handle gracefully if MCP is not available
-try:
-    from .mcp_server import mcp_server, setup_enhanced_mcp_server
-    MCP_AVAILABLE = True
-except ImportError:
-    mcp_server = None
-    setup_enhanced_mcp_server = None
-    MCP_AVAILABLE = False
+# MCP is optional and slow to import: located here, loaded on first access
+import importlib
+import importlib.util
+
+MCP_AVAILABLE = importlib.util.find_spec("mcp") is not None
+
+
+def get_mcp_server():
+    """خادم MCP المشترك، يُحمّل عند أول طلب (None إن لم تتوفر حزمة mcp)
+
+    A function rather than a lazy "mcp_server" attribute, which would shadow
+    the protocols.mcp_server submodule once it is imported.
+    """
+    try:
+        from .mcp_server import mcp_server
+    except ImportError:
+        return None
+    return mcp_server
+
+
+def __getattr__(name):
+    if name == "setup_enhanced_mcp_server":
+        try:
+            from .mcp_server import setup_enhanced_mcp_server
+        except ImportError:
+            return None
+        return setup_enhanced_mcp_server
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 __version__ = "2.0.0"
 __author__ = "Morvo AI Team"
@@ -48,12 +68,13 @@ __all__ = [
     'format_resource_uri',
     'parse_resource_uri',
     'MessageValidator',
-    'MCP_AVAILABLE'
+    'MCP_AVAILABLE',
+    'get_mcp_server'
 ]
 
 # Add MCP components to exports if available
 if MCP_AVAILABLE:
-    __all__.extend(['mcp_server', 'setup_enhanced_mcp_server'])
+    __all__.append('setup_enhanced_mcp_server')
 
 # Initialize logging for the package
 import logging
@@ -5,9 +5,11 @@ Enhanced Agent-to-Agent (A2A) Protocol
 Secure communication between AI agents with authentication and message tracking
 """
 
+import asyncio
 import logging
 import json
-import hashlib
+import time
+import uuid
 from typing import Dict, List, Optional, Any
 from datetime import datetime
 import aiohttp
@@ -20,8 +22,24 @@ except ImportError:
     redis = None
 from fastapi import HTTPException
 
+from config import (
+    A2A_MESSAGE_TRACKER_SIZE, A2A_BROADCAST_CONCURRENCY, A2A_AGENT_TIMEOUT,
+    A2A_REMOTE_TRANSPORT, A2A_BATCH_WINDOW_MS, A2A_BATCH_MAX_MESSAGES,
+    A2A_MAX_RETRIES, A2A_RETRY_DELAY, A2A_MESSAGE_TTL, A2A_QUEUE_CONCURRENCY, A2A_DEAD_LETTER_MAXLEN,
+    A2A_QUEUE_DELIVERY_TIMEOUT, A2A_QUEUE_VISIBILITY_TIMEOUT,
+    A2A_COMMUNICATION_LOG_MAX, A2A_REDIS_BATCH_SIZE, A2A_REDIS_FLUSH_MS, A2A_LOAD_EWMA_ALPHA
+)
+from .message_tracker import MessageTracker
+from .a2a_queue import DurableA2AQueue
+from .agent_router import CapabilityRouter
+from .redis_batcher import RedisWriteBatcher
+from .a2a_transport import A2ATransportError, BatchingTransport, HTTPTransport, LocalHandler, LocalTransport
+
 logger = logging.getLogger(__name__)
 
+AGENT_REGISTRY_KEY = "a2a:agents"
+AGENT_TTL = 3600  # 1 hour
+
 
 class EnhancedA2AProtocol:
     """Enhanced Agent-to-Agent Protocol Handler with Security"""
@@ -29,12 +47,41 @@ class EnhancedA2AProtocol:
     def __init__(self, session: aiohttp.ClientSession, redis_client: Optional[Any] = None):
         self.session = session
         self.redis_client = redis_client if REDIS_AVAILABLE else None
+        # Registrations and communication logs are pipelined, not awaited per call
+        self.redis_writes = RedisWriteBatcher(
+            self.redis_client, max_batch=A2A_REDIS_BATCH_SIZE, flush_interval=A2A_REDIS_FLUSH_MS / 1000
+        )
         self.endpoints: Dict[str, Dict] = {}
         self.authentication_tokens: Dict[str, str] = {}
         # Additional properties expected by main_new.py
         self.agents: Dict[str, Dict] = {}  # For compatibility with main_new.py
         self.network_id: str = f"morvo_network_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-        self.message_queue: List[Dict] = []  # Message queue for tracking
+        # Bounded, indexed by message id (len() and iteration still work)
+        self.message_queue = MessageTracker(A2A_MESSAGE_TRACKER_SIZE)
+        # Co-located agents skip the HTTP loopback
+        self.http_transport = HTTPTransport(session)
+        self.local_transport = LocalTransport()
+        # capability -> agents, with live load per agent (see route_by_capability)
+        self.router = CapabilityRouter(alpha=A2A_LOAD_EWMA_ALPHA)
+        # Remote agents share one persistent, batching connection each
+        self.batch_transport = BatchingTransport(
+            session, window=A2A_BATCH_WINDOW_MS / 1000, max_batch=A2A_BATCH_MAX_MESSAGES
+        )
+        self.transports = {
+            t.name: t for t in (self.http_transport, self.local_transport, self.batch_transport)
+        }
+        # At-least-once delivery for send_secure_message(durable=True)
+        self.durable_queue = DurableA2AQueue(
+            self._deliver_queued,
+            self.redis_client,
+            max_retries=A2A_MAX_RETRIES,
+            retry_delay=A2A_RETRY_DELAY,
+            ttl=A2A_MESSAGE_TTL,
+            concurrency=A2A_QUEUE_CONCURRENCY,
+            delivery_timeout=A2A_QUEUE_DELIVERY_TIMEOUT,
+            visibility_timeout=A2A_QUEUE_VISIBILITY_TIMEOUT,
+            dead_letter_max_len=A2A_DEAD_LETTER_MAXLEN
+        )
         
     async def register_agent(
         self, 
@@ -42,31 +89,50 @@ class EnhancedA2AProtocol:
         endpoint: str, 
         capabilities: List[str],
         auth_token: Optional[str] = None,
-        metadata: Optional[Dict] = None
+        metadata: Optional[Dict] = None,
+        local: bool = False,
+        handler: Optional[LocalHandler] = None,
+        transport: Optional[str] = None
     ):
-        """تسجيل وكيل محسن مع المصادقة"""
+        """تسجيل وكيل محسن مع المصادقة
+        
+        local/handler: الوكيل يعمل داخل هذه العملية فتُسلم رسائله مباشرة
+        (عبر handler أو صندوق وارد في الذاكرة) بدلاً من HTTP
+        transport: نقل الوكيل البعيد ("websocket" أو "http")، الافتراضي من الإعدادات
+        """
+        local = local or handler is not None
+        if local:
+            transport = LocalTransport.name
+        else:
+            transport = transport or A2A_REMOTE_TRANSPORT
+            if transport not in (HTTPTransport.name, BatchingTransport.name):
+                raise ValueError(f"Unknown A2A transport: {transport}")
         registration_data = {
             "endpoint": endpoint,
             "capabilities": capabilities,
             "last_seen": datetime.now().isoformat(),
             "status": "active",
+            "transport": transport,
             "metadata": metadata or {}
         }
         
+        if local:
+            self.local_transport.register(agent_id, handler)
+        else:
+            self.local_transport.unregister(agent_id)
+        
         if auth_token:
             self.authentication_tokens[agent_id] = auth_token
             
         self.endpoints[agent_id] = registration_data
         # Also store in agents dict for main_new.py compatibility
         self.agents[agent_id] = registration_data
+        self.router.add(agent_id, capabilities)
         
-        # Cache in Redis if available
-        if self.redis_client and REDIS_AVAILABLE:
-            await self.redis_client.setex(
-                f"agent:{agent_id}",
-                3600,  # 1 hour TTL
-                json.dumps(registration_data)
-            )
+        # Cache in Redis if available; the hash lets a new worker load all agents at once
+        serialized = json.dumps(registration_data)
+        self.redis_writes.queue("setex", f"agent:{agent_id}", AGENT_TTL, serialized)
+        self.redis_writes.queue("hset", AGENT_REGISTRY_KEY, agent_id, serialized)
             
         logger.info(f"Enhanced agent {agent_id} registered with endpoint {endpoint}")
         
@@ -75,9 +141,17 @@ class EnhancedA2AProtocol:
         from_agent: str, 
         to_agent: str, 
         message: Dict[str, Any],
-        require_auth: bool = True
+        require_auth: bool = True,
+        durable: bool = False
     ) -> Dict[str, Any]:
-        """إرسال رسالة آمنة بين الوكلاء"""
+        """إرسال رسالة آمنة بين الوكلاء
+        
+        durable: إضافة الرسالة لطابور التسليم الدائم (مع إعادة المحاولة)
+        والرد فوراً بإيصال بدلاً من انتظار الوكيل
+        """
+        if durable:
+            return await self.durable_queue.enqueue(from_agent, to_agent, message, require_auth)
+        message_id = None
         try:
             if to_agent not in self.endpoints:
                 raise HTTPException(status_code=404, detail=f"Agent {to_agent} not found")
@@ -86,91 +160,68 @@ class EnhancedA2AProtocol:
             endpoint = endpoint_data["endpoint"]
             
             # Prepare secure payload
+            timestamp = datetime.now().isoformat()
+            # Random, not derived from the timestamp: batched and concurrent sends
+            # between the same pair share timestamps, and replies are matched by ID
+            message_id = uuid.uuid4().hex
             payload = {
                 "from": from_agent,
                 "to": to_agent,
                 "message": message,
-                "timestamp": datetime.now().isoformat(),
-                "message_id": hashlib.sha256(
-                    f"{from_agent}{to_agent}{datetime.now().isoformat()}".encode()
-                ).hexdigest()[:16]
+                "timestamp": timestamp,
+                "message_id": message_id
             }
             
             # Add to message queue for tracking
-            self.message_queue.append({
-                "id": payload["message_id"],
-                "from": from_agent,
-                "to": to_agent,
-                "timestamp": payload["timestamp"],
-                "status": "pending"
-            })
+            self.message_queue.track(message_id, from_agent, to_agent, timestamp)
             
             headers = {"Content-Type": "application/json"}
             
             # Add authentication if required
             if require_auth and to_agent in self.authentication_tokens:
                 headers["Authorization"] = f"Bearer {self.authentication_tokens[to_agent]}"
+            
+            transport = self.transports[endpoint_data.get("transport", HTTPTransport.name)]
+            self.router.begin(to_agent)
+            sent_at = time.perf_counter()
+            delivered = False
+            try:
+                result = await transport.send(to_agent, endpoint, payload, headers)
+                delivered = True
+            except A2ATransportError as e:
+                self.message_queue.update_status(message_id, "failed")
+                raise HTTPException(status_code=e.status, detail=str(e))
+            finally:
+                # Also runs on cancellation (broadcast timeouts) so in-flight never leaks
+                self.router.end(to_agent, time.perf_counter() - sent_at, delivered)
                 
-            async with self.session.post(
-                f"{endpoint}/receive", 
-                json=payload,
-                headers=headers,
-                timeout=30
-            ) as response:
-                if response.status == 200:
-                    result = await response.json()
-                    
-                    # Update message status in queue
-                    for msg in self.message_queue:
-                        if msg["id"] == payload["message_id"]:
-                            msg["status"] = "delivered"
-                            break
-                    
-                    # Log successful communication
-                    if self.redis_client and REDIS_AVAILABLE:
-                        await self.redis_client.lpush(
-                            f"communication_log:{from_agent}",
-                            json.dumps({
-                                "to": to_agent,
-                                "status": "success",
-                                "timestamp": payload["timestamp"],
-                                "message_id": payload["message_id"]
-                            })
-                        )
-                        
-                    return result
-                else:
-                    # Update message status in queue
-                    for msg in self.message_queue:
-                        if msg.get("id") == payload["message_id"]:
-                            msg["status"] = "failed"
-                            break
-                            
-                    raise HTTPException(
-                        status_code=response.status, 
-                        detail=f"Failed to send message: {response.reason}"
-                    )
+            self.message_queue.update_status(message_id, "delivered")
+            
+            # Log successful communication
+            self._log_communication(from_agent, {
+                "to": to_agent,
+                "status": "success",
+                "timestamp": payload["timestamp"],
+                "message_id": payload["message_id"]
+            })
+                
+            return result
                     
         except Exception as e:
             logger.error(f"A2A secure message failed: {str(e)}")
             
-            # Update message status in queue
-            for msg in self.message_queue:
-                if msg.get("id") == payload.get("message_id"):
-                    msg["status"] = "error"
-                    break
+            # "failed" (non-200) stays as is; anything else is an error
+            record = self.message_queue.get(message_id) if message_id else None
+            if record and record["status"] == "pending":
+                self.message_queue.update_status(message_id, "error")
             
             # Log failed communication
-            if self.redis_client and REDIS_AVAILABLE:
-                await self.redis_client.lpush(
-                    f"communication_log:{from_agent}",
-                    json.dumps({
-                        "to": to_agent,
-                        "status": "error",
-                        "error": str(e),
-                        "timestamp": datetime.now().isoformat()
-                    })
-                )
+            self._log_communication(from_agent, {
+                "to": to_agent,
+                "status": "error",
+                "error": str(e),
+                "timestamp": datetime.now().isoformat()
+            })
                 
             raise HTTPException(status_code=500, detail=str(e))
 
@@ -181,37 +232,184 @@ class EnhancedA2AProtocol:
             "registered_agents": len(self.agents),
             "agents": list(self.agents.keys()),
             "message_queue_size": len(self.message_queue),
+            "messages_by_status": self.message_queue.get_stats()["by_status"],
+            "transports": {
+                name: transport.get_stats() for name, transport in self.transports.items()
+            },
+            "durable_queue": self.durable_queue.get_stats(),
+            "redis_writes": self.redis_writes.get_stats(),
+            "routing": self.router.get_stats(),
             "active_connections": len([a for a in self.agents.values() if a.get("status") == "active"]),
             "last_activity": max([a.get("last_seen", "") for a in self.agents.values()]) if self.agents else None
         }
 
+    def _log_communication(self, agent_id: str, entry: Dict[str, Any]):
+        """سجل اتصالات محدود الطول لكل وكيل"""
+        key = f"communication_log:{agent_id}"
+        self.redis_writes.queue("lpush", key, json.dumps(entry))
+        self.redis_writes.queue("ltrim", key, 0, A2A_COMMUNICATION_LOG_MAX - 1)
+
+    async def load_registry(self) -> int:
+        """استعادة الوكلاء البعيدين المسجلين من Redis بطلب واحد (بدء دافئ)"""
+        if not self.redis_client:
+            return 0
+        try:
+            stored = await self.redis_client.hgetall(AGENT_REGISTRY_KEY)
+        except Exception as e:
+            logger.warning(f"A2A registry warm start skipped: {str(e)}")
+            return 0
+
+        loaded = 0
+        stale: List[Any] = []
+        cutoff = time.time() - AGENT_TTL
+        for agent_id, raw in stored.items():
+            agent_id = agent_id.decode() if isinstance(agent_id, bytes) else agent_id
+            data = json.loads(raw)
+            if datetime.fromisoformat(data["last_seen"]).timestamp() < cutoff:
+                stale.append(agent_id)
+                continue
+            # Local agents belong to the process that registered them
+            if agent_id in self.endpoints or data.get("transport") == LocalTransport.name:
+                continue
+            self.endpoints[agent_id] = data
+            self.agents[agent_id] = data
+            self.router.add(agent_id, data.get("capabilities", []))
+            loaded += 1
+        if stale:
+            self.redis_writes.queue("hdel", AGENT_REGISTRY_KEY, *stale)
+        logger.info(f"A2A registry warm start: {loaded} agents loaded from Redis")
+        return loaded
+
+    def find_agents(self, capability: str) -> List[Dict[str, Any]]:
+        """الوكلاء الذين يملكون قدرة معينة مع حملهم الحالي"""
+        return [
+            {"agent_id": agent_id, **self.router.loads[agent_id].to_dict()}
+            for agent_id in self.router.agents_for(capability)
+        ]
+
+    async def route_by_capability(
+        self,
+        from_agent: str,
+        capability: str,
+        message: Dict[str, Any],
+        require_auth: bool = True,
+        durable: bool = False
+    ) -> Dict[str, Any]:
+        """إرسال رسالة لأخف وكيل حملاً يملك القدرة المطلوبة"""
+        to_agent = self.router.select(capability, exclude={from_agent})
+        if to_agent is None:
+            raise HTTPException(status_code=404, detail=f"No agent provides capability {capability}")
+        result = await self.send_secure_message(from_agent, to_agent, message, require_auth, durable)
+        return {"routed_to": to_agent, "capability": capability, "result": result}
+
+    async def _deliver_queued(self, envelope: Dict[str, Any]) -> Dict[str, Any]:
+        return await self.send_secure_message(
+            envelope["from"], envelope["to"], envelope["message"], envelope["require_auth"]
+        )
+
+    async def receive(self, agent_id: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """استقبال رسالة واردة من شبكة A2A وتسليمها لوكيل محلي"""
+        if payload.get("to", agent_id) != agent_id:
+            raise HTTPException(status_code=400, detail="Message is addressed to another agent")
+        try:
+            return await self.local_transport.send(agent_id, "", payload, {})
+        except A2ATransportError as e:
+            raise HTTPException(status_code=e.status, detail=str(e))
+
+    async def receive_batch(self, agent_id: str, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """استقبال دفعة رسائل؛ رد لكل رسالة مطابق بمعرفها"""
+        async def one(payload: Dict[str, Any]) -> Dict[str, Any]:
+            reply = {"message_id": payload.get("message_id")}
+            try:
+                reply.update(status=200, result=await self.receive(agent_id, payload))
+            except HTTPException as e:
+                reply.update(status=e.status_code, error=str(e.detail))
+            except Exception as e:
+                reply.update(status=500, error=str(e))
+            return reply
+
+        return await asyncio.gather(*(one(payload) for payload in messages))
+
+    async def close(self):
+        """إيقاف طابور التسليم وإغلاق اتصالات النقل الدائمة"""
+        await self.durable_queue.stop()
+        await self.batch_transport.close()
+        await self.redis_writes.flush()
+
     async def cleanup_message_queue(self, max_size: int = 1000):
         """تنظيف قائمة الرسائل للحفاظ على الأداء"""
+        # The tracker is already bounded; this only shrinks it further
         if len(self.message_queue) > max_size:
-            # Keep only the most recent messages
-            self.message_queue = self.message_queue[-max_size:]
+            self.message_queue.trim(max_size)
             logger.info(f"Message queue cleaned up, kept {max_size} recent messages")
 
-    async def broadcast_message(self, from_agent: str, message: Dict[str, Any]) -> Dict[str, Any]:
-        """بث رسالة لجميع الوكلاء المسجلين"""
-        results = {}
+    async def broadcast_message(
+        self, 
+        from_agent: str, 
+        message: Dict[str, Any],
+        concurrency: Optional[int] = None,
+        agent_timeout: Optional[float] = None,
+        quorum: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """بث رسالة لجميع الوكلاء المسجلين بالتوازي مع مهلة لكل وكيل
+        
+        quorum: إنهاء البث بمجرد نجاح هذا العدد من الوكلاء (تُلغى البقية)
+        """
+        started = time.perf_counter()
+        semaphore = asyncio.Semaphore(concurrency or A2A_BROADCAST_CONCURRENCY)
+        timeout = agent_timeout or A2A_AGENT_TIMEOUT
+        targets = [agent_id for agent_id in self.agents if agent_id != from_agent]  # Don't send to self
         
-        for agent_id in self.agents.keys():
-            if agent_id != from_agent:  # Don't send to self
+        async def send(agent_id: str):
+            async with semaphore:
+                agent_started = time.perf_counter()
                 try:
-                    result = await self.send_secure_message(from_agent, agent_id, message)
-                    results[agent_id] = {"status": "success", "result": result}
+                    result = await asyncio.wait_for(
+                        self.send_secure_message(from_agent, agent_id, message), timeout
+                    )
+                    outcome = {"status": "success", "result": result}
+                except asyncio.TimeoutError:
+                    outcome = {"status": "timeout", "error": f"no reply within {timeout}s"}
                 except Exception as e:
-                    results[agent_id] = {"status": "error", "error": str(e)}
+                    outcome = {"status": "error", "error": str(e)}
+                outcome["latency_ms"] = round((time.perf_counter() - agent_started) * 1000, 2)
+                return agent_id, outcome
+        
+        results: Dict[str, Dict[str, Any]] = {}
+        tasks = [asyncio.create_task(send(agent_id)) for agent_id in targets]
+        successful = 0
+        quorum_reached = False
+        try:
+            # Aggregate in completion order rather than registration order
+            for next_done in asyncio.as_completed(tasks):
+                agent_id, outcome = await next_done
+                results[agent_id] = outcome
+                if outcome["status"] == "success":
+                    successful += 1
+                    if quorum and successful >= quorum:
+                        quorum_reached = True
+                        break
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        
+        for agent_id in targets:
+            results.setdefault(agent_id, {"status": "cancelled"})
                     
         return {
-            "broadcast_id": hashlib.sha256(f"{from_agent}{datetime.now().isoformat()}".encode()).hexdigest()[:16],
+            "broadcast_id": uuid.uuid4().hex,
             "from": from_agent,
             "timestamp": datetime.now().isoformat(),
             "results": results,
             "total_sent": len(results),
-            "successful": len([r for r in results.values() if r["status"] == "success"]),
-            "failed": len([r for r in results.values() if r["status"] == "error"])
+            "successful": successful,
+            "failed": len([r for r in results.values() if r["status"] == "error"]),
+            "timed_out": len([r for r in results.values() if r["status"] == "timeout"]),
+            "cancelled": len([r for r in results.values() if r["status"] == "cancelled"]),
+            "quorum": quorum,
+            "quorum_reached": quorum_reached,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)
         }
 
     async def get_agent_status(self, agent_id: str) -> Dict[str, Any]:
@@ -221,12 +419,6 @@ class EnhancedA2AProtocol:
             
         agent_data = self.agents[agent_id]
         
-        # Get recent messages for this agent
-        recent_messages = [
-            msg for msg in self.message_queue[-100:]  # Last 100 messages
-            if msg.get("from") == agent_id or msg.get("to") == agent_id
-        ]
-        
         return {
             "agent_id": agent_id,
             "endpoint": agent_data.get("endpoint"),
@@ -234,9 +426,5 @@ class EnhancedA2AProtocol:
             "status": agent_data.get("status"),
             "last_seen": agent_data.get("last_seen"),
             "metadata": agent_data.get("metadata", {}),
-            "recent_activity": {
-                "messages_sent": len([m for m in recent_messages if m.get("from") == agent_id]),
-                "messages_received": len([m for m in recent_messages if m.get("to") == agent_id]),
-                "last_message": recent_messages[-1] if recent_messages else None
-            }
+            "recent_activity": self.message_queue.agent_stats(agent_id)
         }
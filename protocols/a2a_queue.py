@@ -0,0 +1,391 @@
+"""
+Durable A2A Delivery Queue
+طابور تسليم دائم لرسائل A2A مع إعادة المحاولة
+
+Messages sent in durable mode are appended to a Redis Stream and delivered
+by a consumer group, so delivery is at-least-once: an entry is acknowledged
+only after it was delivered, rescheduled or dead-lettered, and entries left
+pending by a crashed worker are claimed back once they have been idle for
+the visibility timeout. Failed deliveries wait in a sorted set (scored by
+due time) with exponential backoff and go back on the stream when due;
+after A2A_MAX_RETRIES attempts, or once older than A2A_MESSAGE_TTL, they go
+to a dead-letter stream. InMemoryA2AStream mimics the same operations for
+tests and for running without Redis.
+"""
+
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import os
+import socket
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+STREAM_KEY = "a2a:messages"
+CONSUMER_GROUP = "a2a_delivery"
+RETRY_KEY = "a2a:retry"
+DEAD_LETTER_KEY = "a2a:dead_letter"
+
+# (stream entry id, envelope)
+QueuedMessage = Tuple[str, Dict[str, Any]]
+Deliver = Callable[[Dict[str, Any]], Awaitable[Any]]
+
+
+def _decode(value: Any) -> Any:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class InMemoryA2AStream:
+    """بديل محلي غير دائم يحاكي Stream ومجموعة مستهلكين"""
+
+    backend = "memory"
+
+    def __init__(self, dead_letter_max_len: int = 1000):
+        self._ids = itertools.count(1)
+        self._ready: deque = deque()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        # Delivered but not acknowledged: id -> claimed at (monotonic)
+        self._pending: "OrderedDict[str, float]" = OrderedDict()
+        self._retry: List[Tuple[float, int, Dict[str, Any]]] = []
+        self._dead: deque = deque(maxlen=dead_letter_max_len)
+        self._available = asyncio.Event()
+
+    async def setup(self):
+        pass
+
+    async def add(self, envelope: Dict[str, Any]) -> str:
+        entry_id = str(next(self._ids))
+        self._entries[entry_id] = envelope
+        self._ready.append(entry_id)
+        self._available.set()
+        return entry_id
+
+    async def read(self, count: int, block_ms: int) -> List[QueuedMessage]:
+        if not self._ready:
+            self._available.clear()
+            try:
+                await asyncio.wait_for(self._available.wait(), timeout=block_ms / 1000)
+            except asyncio.TimeoutError:
+                return []
+        batch: List[QueuedMessage] = []
+        now = time.monotonic()
+        while self._ready and len(batch) < count:
+            entry_id = self._ready.popleft()
+            self._pending[entry_id] = now
+            batch.append((entry_id, self._entries[entry_id]))
+        return batch
+
+    async def claim_stale(self, min_idle_ms: int, count: int) -> List[QueuedMessage]:
+        cutoff = time.monotonic() - min_idle_ms / 1000
+        claimed: List[QueuedMessage] = []
+        for entry_id, claimed_at in list(self._pending.items()):
+            if claimed_at > cutoff or len(claimed) >= count:
+                break
+            self._pending.move_to_end(entry_id)
+            self._pending[entry_id] = time.monotonic()
+            claimed.append((entry_id, self._entries[entry_id]))
+        return claimed
+
+    async def ack(self, entry_ids: List[str]):
+        for entry_id in entry_ids:
+            if self._pending.pop(entry_id, None) is not None:
+                self._entries.pop(entry_id, None)
+
+    async def schedule_retry(self, envelope: Dict[str, Any], due: float):
+        heapq.heappush(self._retry, (due, next(self._ids), envelope))
+
+    async def promote_due(self, now: float, count: int) -> int:
+        moved = 0
+        while self._retry and self._retry[0][0] <= now and moved < count:
+            await self.add(heapq.heappop(self._retry)[2])
+            moved += 1
+        return moved
+
+    async def dead_letter(self, envelope: Dict[str, Any]):
+        self._dead.append(envelope)
+
+    async def dead_letters(self, limit: int) -> List[Dict[str, Any]]:
+        return list(self._dead)[-limit:][::-1]
+
+    async def lag(self) -> Dict[str, Optional[int]]:
+        return {"lag": len(self._ready), "pending": len(self._pending), "scheduled_retries": len(self._retry)}
+
+
+class RedisA2AStream:
+    """طابور دائم عبر Redis Streams مع مجموعة مستهلكين"""
+
+    backend = "redis_stream"
+
+    def __init__(self, redis_client: Any, max_len: int = 100000, dead_letter_max_len: int = 10000):
+        self.redis_client = redis_client
+        self.max_len = max_len
+        self.dead_letter_max_len = dead_letter_max_len
+        self.consumer = f"{socket.gethostname()}-{os.getpid()}"
+
+    async def setup(self):
+        try:
+            await self.redis_client.xgroup_create(STREAM_KEY, CONSUMER_GROUP, id="0", mkstream=True)
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    @staticmethod
+    def _entries(entries: List[Any]) -> List[QueuedMessage]:
+        batch: List[QueuedMessage] = []
+        for entry_id, fields in entries:
+            raw = fields.get(b"envelope", fields.get("envelope")) if fields else None
+            if raw is not None:  # trimmed away by MAXLEN while pending
+                batch.append((_decode(entry_id), json.loads(raw)))
+        return batch
+
+    async def add(self, envelope: Dict[str, Any]) -> str:
+        entry_id = await self.redis_client.xadd(
+            STREAM_KEY,
+            {"envelope": json.dumps(envelope, ensure_ascii=False)},
+            maxlen=self.max_len,
+            approximate=True
+        )
+        return _decode(entry_id)
+
+    async def read(self, count: int, block_ms: int) -> List[QueuedMessage]:
+        response = await self.redis_client.xreadgroup(
+            CONSUMER_GROUP, self.consumer, {STREAM_KEY: ">"}, count=count, block=block_ms
+        )
+        return self._entries(response[0][1]) if response else []
+
+    async def claim_stale(self, min_idle_ms: int, count: int) -> List[QueuedMessage]:
+        """استعادة رسائل مستهلك توقف قبل الإقرار بها"""
+        response = await self.redis_client.xautoclaim(
+            STREAM_KEY, CONSUMER_GROUP, self.consumer, min_idle_time=min_idle_ms, start_id="0-0", count=count
+        )
+        return self._entries(response[1])
+
+    async def ack(self, entry_ids: List[str]):
+        if entry_ids:
+            await self.redis_client.xack(STREAM_KEY, CONSUMER_GROUP, *entry_ids)
+
+    async def schedule_retry(self, envelope: Dict[str, Any], due: float):
+        await self.redis_client.zadd(RETRY_KEY, {json.dumps(envelope, ensure_ascii=False): due})
+
+    async def promote_due(self, now: float, count: int) -> int:
+        moved = 0
+        for raw in await self.redis_client.zrangebyscore(RETRY_KEY, "-inf", now, start=0, num=count):
+            # Whoever removes the member owns it, so concurrent workers don't double-enqueue
+            if await self.redis_client.zrem(RETRY_KEY, raw):
+                await self.add(json.loads(raw))
+                moved += 1
+        return moved
+
+    async def dead_letter(self, envelope: Dict[str, Any]):
+        await self.redis_client.xadd(
+            DEAD_LETTER_KEY,
+            {"envelope": json.dumps(envelope, ensure_ascii=False)},
+            maxlen=self.dead_letter_max_len,
+            approximate=True
+        )
+
+    async def dead_letters(self, limit: int) -> List[Dict[str, Any]]:
+        entries = await self.redis_client.xrevrange(DEAD_LETTER_KEY, count=limit)
+        return [envelope for _, envelope in self._entries(entries)]
+
+    async def lag(self) -> Dict[str, Optional[int]]:
+        stats: Dict[str, Optional[int]] = {"lag": None, "pending": None, "scheduled_retries": None}
+        try:
+            for info in await self.redis_client.xinfo_groups(STREAM_KEY):
+                if _decode(info.get("name", info.get(b"name"))) == CONSUMER_GROUP:
+                    stats["lag"] = info.get("lag", info.get(b"lag"))
+                    stats["pending"] = info.get("pending", info.get(b"pending"))
+            stats["scheduled_retries"] = await self.redis_client.zcard(RETRY_KEY)
+        except Exception as e:
+            logger.debug(f"A2A queue lag unavailable: {str(e)}")
+        return stats
+
+
+class DurableA2AQueue:
+    """تسليم رسائل A2A مرة واحدة على الأقل مع تأخير متزايد وقائمة رسائل ميتة"""
+
+    def __init__(
+        self,
+        deliver: Deliver,
+        redis_client: Optional[Any] = None,
+        max_retries: int = 3,
+        retry_delay: float = 5,
+        ttl: float = 3600,
+        concurrency: int = 20,
+        batch_size: int = 100,
+        block_ms: int = 1000,
+        visibility_timeout: float = 90,
+        delivery_timeout: float = 30,
+        max_backoff: float = 300,
+        dead_letter_max_len: int = 10000
+    ):
+        self.deliver = deliver
+        self.stream = (
+            RedisA2AStream(redis_client, dead_letter_max_len=dead_letter_max_len) if redis_client
+            else InMemoryA2AStream(dead_letter_max_len)
+        )
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.ttl = ttl
+        self.batch_size = batch_size
+        self.block_ms = block_ms
+        self.delivery_timeout = delivery_timeout
+        # Entries are read only into free delivery slots, so one is handled
+        # within delivery_timeout of being read; a longer visibility timeout
+        # keeps other consumers from reclaiming entries that are still live
+        self.visibility_timeout = max(visibility_timeout, 2 * delivery_timeout)
+        self.max_backoff = max_backoff
+        self.concurrency = concurrency
+        self._active = 0
+        self._slot_free = asyncio.Event()
+        self._handlers: Set[asyncio.Task] = set()
+        self._tasks: List[asyncio.Task] = []
+        self._lag: Dict[str, Optional[int]] = {}
+        self._started_at: Optional[float] = None
+        self.stats = {
+            "enqueued": 0,
+            "delivered": 0,
+            "retried": 0,
+            "dead_lettered": 0,
+            "expired": 0,
+            "reclaimed": 0,
+            "latency_total": 0.0
+        }
+
+    async def enqueue(self, from_agent: str, to_agent: str, message: Dict[str, Any], require_auth: bool = True) -> Dict[str, Any]:
+        """إضافة رسالة لطابور التسليم؛ تعيد إيصالاً فورياً"""
+        envelope = {
+            "from": from_agent,
+            "to": to_agent,
+            "message": message,
+            "require_auth": require_auth,
+            "enqueued_at": time.time(),
+            "attempts": 0
+        }
+        entry_id = await self.stream.add(envelope)
+        self.stats["enqueued"] += 1
+        return {"status": "queued", "queue_id": entry_id, "to": to_agent}
+
+    def _backoff(self, attempts: int) -> float:
+        return min(self.retry_delay * (2 ** (attempts - 1)), self.max_backoff)
+
+    async def _handle(self, entry_id: str, envelope: Dict[str, Any]):
+        now = time.time()
+        if now - envelope["enqueued_at"] > self.ttl:
+            self.stats["expired"] += 1
+            await self._dead_letter(envelope, "expired")
+        else:
+            envelope["attempts"] += 1
+            try:
+                await asyncio.wait_for(self.deliver(envelope), self.delivery_timeout)
+                self.stats["delivered"] += 1
+                self.stats["latency_total"] += time.time() - envelope["enqueued_at"]
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    envelope["last_error"] = f"no reply within {self.delivery_timeout}s"
+                else:
+                    envelope["last_error"] = str(getattr(e, "detail", e))
+                if envelope["attempts"] >= self.max_retries:
+                    await self._dead_letter(envelope, "max_retries")
+                else:
+                    self.stats["retried"] += 1
+                    await self.stream.schedule_retry(envelope, time.time() + self._backoff(envelope["attempts"]))
+        # Only now is the message safe elsewhere (delivered, rescheduled or dead);
+        # acked as soon as this entry is done, not when its whole batch is
+        await self.stream.ack([entry_id])
+
+    def _free_slots(self) -> int:
+        return self.concurrency - self._active
+
+    def _spawn(self, entry_id: str, envelope: Dict[str, Any]):
+        self._active += 1
+        task = asyncio.create_task(self._handle(entry_id, envelope))
+        self._handlers.add(task)
+
+        def done(t: asyncio.Task):
+            self._handlers.discard(t)
+            self._active -= 1
+            self._slot_free.set()
+            if not t.cancelled() and t.exception() is not None:
+                # Not acked: stays pending and is reclaimed after the visibility timeout
+                logger.error(f"A2A queue entry {entry_id} failed: {str(t.exception())}")
+
+        task.add_done_callback(done)
+
+    async def _dead_letter(self, envelope: Dict[str, Any], reason: str):
+        envelope["dead_reason"] = reason
+        envelope["dead_at"] = time.time()
+        self.stats["dead_lettered"] += 1
+        await self.stream.dead_letter(envelope)
+        logger.warning(f"A2A message {envelope['from']}->{envelope['to']} dead-lettered ({reason})")
+
+    async def _consume(self):
+        while True:
+            try:
+                while self._free_slots() <= 0:
+                    self._slot_free.clear()
+                    await self._slot_free.wait()
+                # Read only what can start now, so no entry idles while pending
+                batch = await self.stream.read(min(self.batch_size, self._free_slots()), self.block_ms)
+                for entry_id, envelope in batch:
+                    self._spawn(entry_id, envelope)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Unacknowledged entries stay pending and are reclaimed later
+                logger.error(f"A2A queue consumer failed: {str(e)}")
+                await asyncio.sleep(1)
+
+    async def _maintain(self):
+        interval = max(min(self.retry_delay, 5), 0.05)
+        while True:
+            try:
+                await self.stream.promote_due(time.time(), self.batch_size)
+                free = min(self.batch_size, self._free_slots())
+                if free > 0:
+                    stale = await self.stream.claim_stale(int(self.visibility_timeout * 1000), free)
+                    self.stats["reclaimed"] += len(stale)
+                    for entry_id, envelope in stale:
+                        self._spawn(entry_id, envelope)
+                self._lag = await self.stream.lag()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"A2A queue maintenance failed: {str(e)}")
+            await asyncio.sleep(interval)
+
+    async def dead_letters(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """أحدث الرسائل الميتة"""
+        return await self.stream.dead_letters(limit)
+
+    async def start(self):
+        if self._tasks:
+            return
+        await self.stream.setup()
+        self._started_at = time.monotonic()
+        self._tasks = [asyncio.create_task(self._consume()), asyncio.create_task(self._maintain())]
+        logger.info(f"Durable A2A queue started (backend={self.stream.backend})")
+
+    async def stop(self):
+        tasks = [*self._tasks, *self._handlers]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+
+    def get_stats(self) -> Dict[str, Any]:
+        delivered = self.stats["delivered"]
+        uptime = time.monotonic() - self._started_at if self._started_at else 0
+        return {
+            **{k: v for k, v in self.stats.items() if k != "latency_total"},
+            **self._lag,
+            "backend": self.stream.backend,
+            "in_flight": self._active,
+            "throughput_per_s": round(delivered / uptime, 2) if uptime else 0.0,
+            "avg_delivery_latency_s": round(self.stats["latency_total"] / delivered, 3) if delivered else 0.0
+        }
@@ -0,0 +1,309 @@
+"""
+A2A Transports
+طبقات نقل رسائل A2A
+
+HTTPTransport posts each message to the agent's /receive endpoint.
+LocalTransport delivers to agents living in this process without leaving
+it: either by calling the agent's handler directly or, for agents without a
+handler, by putting the message on a bounded in-memory inbox.
+BatchingTransport keeps one persistent WebSocket per remote agent, packs
+messages sent within a short window into one frame and matches replies by
+message id; without a WebSocket it posts the batch to /receive_batch, and
+falls back to one /receive call per message for agents that have neither.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+LocalHandler = Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+
+class A2ATransportError(Exception):
+    """فشل التسليم على مستوى النقل (حالة HTTP غير 200 مثلاً)"""
+
+    def __init__(self, agent_id: str, message: str, status: int = 502):
+        super().__init__(message)
+        self.agent_id = agent_id
+        self.status = status
+
+
+class HTTPTransport:
+    """نقل عبر HTTP لكل رسالة"""
+
+    name = "http"
+
+    def __init__(self, session: Optional[aiohttp.ClientSession], timeout: float = 30):
+        self.session = session
+        self.timeout = timeout
+        self.sent = 0
+
+    async def send(self, agent_id: str, endpoint: str, payload: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, Any]:
+        async with self.session.post(
+            f"{endpoint}/receive",
+            json=payload,
+            headers=headers,
+            timeout=self.timeout
+        ) as response:
+            if response.status != 200:
+                raise A2ATransportError(agent_id, f"Failed to send message: {response.reason}", response.status)
+            self.sent += 1
+            return await response.json()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"sent": self.sent}
+
+
+class LocalTransport:
+    """تسليم داخل العملية للوكلاء المحليين (استدعاء مباشر أو صندوق وارد)"""
+
+    name = "local"
+
+    def __init__(self, inbox_size: int = 1000):
+        self.inbox_size = inbox_size
+        self.handlers: Dict[str, Optional[LocalHandler]] = {}
+        self.inboxes: Dict[str, asyncio.Queue] = {}
+        self.stats = {"sent": 0, "dropped_oldest": 0}
+
+    def register(self, agent_id: str, handler: Optional[LocalHandler] = None):
+        """تسجيل وكيل محلي؛ بدون handler تُوضع الرسائل في صندوق وارده"""
+        self.handlers[agent_id] = handler
+        if handler is None and agent_id not in self.inboxes:
+            self.inboxes[agent_id] = asyncio.Queue(maxsize=self.inbox_size)
+
+    def unregister(self, agent_id: str):
+        self.handlers.pop(agent_id, None)
+        self.inboxes.pop(agent_id, None)
+
+    def is_local(self, agent_id: str) -> bool:
+        return agent_id in self.handlers
+
+    def inbox(self, agent_id: str) -> Optional[asyncio.Queue]:
+        return self.inboxes.get(agent_id)
+
+    async def send(self, agent_id: str, endpoint: str, payload: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, Any]:
+        if agent_id not in self.handlers:
+            raise A2ATransportError(agent_id, f"Agent {agent_id} is not local", 404)
+        self.stats["sent"] += 1
+        handler = self.handlers[agent_id]
+        if handler is not None:
+            # Same payload object as the sender's; handlers must not mutate it
+            return await handler(payload)
+
+        inbox = self.inboxes[agent_id]
+        if inbox.full():
+            inbox.get_nowait()
+            self.stats["dropped_oldest"] += 1
+        inbox.put_nowait(payload)
+        return {"status": "queued", "agent_id": agent_id, "message_id": payload.get("message_id")}
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "local_agents": len(self.handlers),
+            "inbox_depth": {agent_id: q.qsize() for agent_id, q in self.inboxes.items()}
+        }
+
+
+class _AgentChannel:
+    """اتصال وطابور إرسال وردود معلقة لوكيل بعيد واحد"""
+
+    def __init__(self, agent_id: str, endpoint: str):
+        self.agent_id = agent_id
+        self.endpoint = endpoint
+        self.ws: Optional[aiohttp.ClientWebSocketResponse] = None
+        self.reader: Optional[asyncio.Task] = None
+        self.connect_lock = asyncio.Lock()
+        self.ws_retry_at = 0.0
+        self.batch_supported = True
+        self.buffer: List[Dict[str, Any]] = []
+        self.headers: Dict[str, str] = {}
+        self.flush_handle: Optional[asyncio.TimerHandle] = None
+        self.pending: Dict[str, asyncio.Future] = {}
+        # message id -> socket its frame was written to (awaiting the reply there)
+        self.written: Dict[str, aiohttp.ClientWebSocketResponse] = {}
+
+    @property
+    def ws_url(self) -> str:
+        return self.endpoint.replace("https://", "wss://", 1).replace("http://", "ws://", 1) + "/ws"
+
+
+class BatchingTransport:
+    """نقل مجمّع عبر WebSocket دائم لكل وكيل بعيد مع بديل HTTP مجمّع"""
+
+    name = "websocket"
+
+    def __init__(
+        self,
+        session: Optional[aiohttp.ClientSession],
+        window: float = 0.002,
+        max_batch: int = 100,
+        reply_timeout: float = 30,
+        reconnect_delay: float = 30
+    ):
+        self.session = session
+        self.window = window
+        self.max_batch = max_batch
+        self.reply_timeout = reply_timeout
+        self.reconnect_delay = reconnect_delay
+        self.fallback = HTTPTransport(session, timeout=reply_timeout)
+        self.channels: Dict[str, _AgentChannel] = {}
+        self._flushes: set = set()
+        self.stats = {"sent": 0, "ws_frames": 0, "http_batches": 0, "per_message_fallback": 0, "reconnects": 0}
+
+    async def send(self, agent_id: str, endpoint: str, payload: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, Any]:
+        channel = self.channels.get(agent_id)
+        if channel is None or channel.endpoint != endpoint:
+            channel = self.channels[agent_id] = _AgentChannel(agent_id, endpoint)
+
+        future = asyncio.get_running_loop().create_future()
+        message_id = payload["message_id"]
+        channel.pending[message_id] = future
+        channel.buffer.append(payload)
+        channel.headers = headers
+        self.stats["sent"] += 1
+
+        if len(channel.buffer) >= self.max_batch:
+            self._schedule_flush(channel)
+        elif channel.flush_handle is None:
+            channel.flush_handle = asyncio.get_running_loop().call_later(self.window, self._schedule_flush, channel)
+
+        try:
+            return await asyncio.wait_for(future, self.reply_timeout)
+        except asyncio.TimeoutError:
+            raise A2ATransportError(agent_id, f"No reply within {self.reply_timeout}s", 504)
+        finally:
+            channel.pending.pop(message_id, None)
+            channel.written.pop(message_id, None)
+
+    def _schedule_flush(self, channel: _AgentChannel):
+        if channel.flush_handle:
+            channel.flush_handle.cancel()
+            channel.flush_handle = None
+        batch, channel.buffer = channel.buffer, []
+        if batch:
+            task = asyncio.create_task(self._flush(channel, batch))
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, channel: _AgentChannel, batch: List[Dict[str, Any]]):
+        if await self._ensure_ws(channel):
+            ws = channel.ws
+            try:
+                await ws.send_json({"type": "batch", "messages": batch})
+                for payload in batch:
+                    channel.written[payload["message_id"]] = ws
+                self.stats["ws_frames"] += 1
+                return
+            except Exception as e:
+                logger.warning(f"A2A WebSocket to {channel.agent_id} failed, using HTTP: {str(e)}")
+                await self._close_ws(channel)
+        await self._flush_http(channel, batch)
+
+    async def _ensure_ws(self, channel: _AgentChannel) -> bool:
+        if channel.ws is not None and not channel.ws.closed:
+            return True
+        if time.monotonic() < channel.ws_retry_at:
+            return False
+        async with channel.connect_lock:
+            if channel.ws is not None and not channel.ws.closed:
+                return True
+            try:
+                channel.ws = await self.session.ws_connect(channel.ws_url, headers=channel.headers, heartbeat=30)
+                channel.reader = asyncio.create_task(self._read(channel, channel.ws))
+                self.stats["reconnects"] += 1
+                return True
+            except Exception as e:
+                # Agent has no WebSocket endpoint (or is down); retry later
+                channel.ws_retry_at = time.monotonic() + self.reconnect_delay
+                logger.debug(f"A2A WebSocket unavailable for {channel.agent_id}: {str(e)}")
+                return False
+
+    async def _read(self, channel: _AgentChannel, ws: aiohttp.ClientWebSocketResponse):
+        try:
+            async for msg in ws:
+                if msg.type != aiohttp.WSMsgType.TEXT:
+                    continue
+                for reply in msg.json().get("replies", []):
+                    self._resolve(channel, reply)
+        finally:
+            if channel.ws is ws:
+                channel.ws = None
+            # Only messages written to this socket lose their reply; buffered or
+            # in-flight ones go out on the next socket or over HTTP
+            for message_id, sent_on in list(channel.written.items()):
+                if sent_on is not ws:
+                    continue
+                del channel.written[message_id]
+                future = channel.pending.get(message_id)
+                if future is not None and not future.done():
+                    future.set_exception(A2ATransportError(channel.agent_id, "A2A WebSocket closed", 502))
+
+    def _resolve(self, channel: _AgentChannel, reply: Dict[str, Any]):
+        future = channel.pending.get(reply.get("message_id"))
+        if future is None or future.done():
+            return
+        status = reply.get("status", 200)
+        if status == 200:
+            future.set_result(reply.get("result"))
+        else:
+            future.set_exception(A2ATransportError(channel.agent_id, reply.get("error", "delivery failed"), status))
+
+    async def _flush_http(self, channel: _AgentChannel, batch: List[Dict[str, Any]]):
+        try:
+            if channel.batch_supported:
+                async with self.session.post(
+                    f"{channel.endpoint}/receive_batch",
+                    json={"messages": batch},
+                    headers=channel.headers,
+                    timeout=self.reply_timeout
+                ) as response:
+                    if response.status == 200:
+                        self.stats["http_batches"] += 1
+                        for reply in (await response.json()).get("replies", []):
+                            self._resolve(channel, reply)
+                        return
+                    if response.status not in (404, 405):
+                        raise A2ATransportError(channel.agent_id, f"Failed to send batch: {response.reason}", response.status)
+                    channel.batch_supported = False
+
+            self.stats["per_message_fallback"] += len(batch)
+            outcomes = await asyncio.gather(
+                *(self.fallback.send(channel.agent_id, channel.endpoint, payload, channel.headers) for payload in batch),
+                return_exceptions=True
+            )
+            for payload, outcome in zip(batch, outcomes):
+                if isinstance(outcome, A2ATransportError):
+                    self._resolve(channel, {"message_id": payload["message_id"], "status": outcome.status, "error": str(outcome)})
+                elif isinstance(outcome, BaseException):
+                    self._resolve(channel, {"message_id": payload["message_id"], "status": 502, "error": str(outcome)})
+                else:
+                    self._resolve(channel, {"message_id": payload["message_id"], "result": outcome})
+        except Exception as e:
+            status = e.status if isinstance(e, A2ATransportError) else 502
+            for payload in batch:
+                self._resolve(channel, {"message_id": payload["message_id"], "status": status, "error": str(e)})
+
+    async def _close_ws(self, channel: _AgentChannel):
+        ws, channel.ws = channel.ws, None
+        if ws is not None and not ws.closed:
+            await ws.close()
+        if channel.reader:
+            channel.reader.cancel()
+
+    async def close(self):
+        for channel in self.channels.values():
+            await self._close_ws(channel)
+
+    def get_stats(self) -> Dict[str, Any]:
+        frames = self.stats["ws_frames"] + self.stats["http_batches"]
+        return {
+            **self.stats,
+            "open_connections": sum(1 for c in self.channels.values() if c.ws is not None and not c.ws.closed),
+            "avg_batch_size": round((self.stats["sent"] - self.stats["per_message_fallback"]) / frames, 2) if frames else 0.0
+        }
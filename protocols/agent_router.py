@@ -0,0 +1,153 @@
+"""
+Capability Router
+توجيه رسائل A2A حسب القدرة والحمل
+
+Inverted index from capability (e.g. "sentiment_analysis") to the agents
+that declare it, plus live load signals per agent: messages in flight and
+EWMA latency and error rate, updated around every delivery. Selection uses
+power-of-two-choices: two random candidates are scored and the lighter one
+wins, which is O(1) per pick and avoids herding every sender onto the same
+"best" agent.
+"""
+
+import random
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+
+class AgentLoad:
+    """إشارات الحمل الحية لوكيل واحد"""
+
+    __slots__ = ("in_flight", "latency", "error_rate", "completed")
+
+    def __init__(self):
+        self.in_flight = 0
+        self.latency: Optional[float] = None  # EWMA seconds
+        self.error_rate = 0.0  # EWMA of failures
+        self.completed = 0
+
+    def score(self, default_latency: float) -> float:
+        """أقل أفضل: زمن متوقع للرسالة التالية مع عقوبة للأخطاء"""
+        latency = self.latency if self.latency is not None else default_latency
+        return (self.in_flight + 1) * latency * (1 + 4 * self.error_rate)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "ewma_latency_ms": round(self.latency * 1000, 2) if self.latency is not None else None,
+            "error_rate": round(self.error_rate, 3),
+            "completed": self.completed
+        }
+
+
+class CapabilityRouter:
+    """فهرس القدرات إلى الوكلاء مع اختيار حسب الحمل"""
+
+    def __init__(self, alpha: float = 0.2):
+        self.alpha = alpha
+        # List + position map: O(1) add, remove and random sampling
+        self._members: Dict[str, List[str]] = {}
+        self._positions: Dict[str, Dict[str, int]] = {}
+        self._capabilities: Dict[str, Set[str]] = {}
+        self.loads: Dict[str, AgentLoad] = {}
+        # Running sum/count of measured EWMA latencies for the default
+        self._latency_sum = 0.0
+        self._latency_count = 0
+
+    def add(self, agent_id: str, capabilities: Iterable[str]):
+        """فهرسة وكيل (إعادة التسجيل تستبدل قدراته السابقة)"""
+        self._unindex(agent_id)
+        caps = set(capabilities)
+        self._capabilities[agent_id] = caps
+        for capability in caps:
+            members = self._members.setdefault(capability, [])
+            self._positions.setdefault(capability, {})[agent_id] = len(members)
+            members.append(agent_id)
+        self.loads.setdefault(agent_id, AgentLoad())
+
+    def remove(self, agent_id: str):
+        self._unindex(agent_id)
+        load = self.loads.pop(agent_id, None)
+        if load is not None and load.latency is not None:
+            self._latency_sum -= load.latency
+            self._latency_count -= 1
+
+    def _unindex(self, agent_id: str):
+        for capability in self._capabilities.pop(agent_id, ()):
+            members = self._members[capability]
+            positions = self._positions[capability]
+            slot = positions.pop(agent_id)
+            last = members.pop()
+            if last != agent_id:
+                members[slot] = last
+                positions[last] = slot
+            if not members:
+                del self._members[capability]
+                del self._positions[capability]
+
+    def agents_for(self, capability: str) -> List[str]:
+        return list(self._members.get(capability, ()))
+
+    def capabilities(self) -> Dict[str, int]:
+        return {capability: len(members) for capability, members in self._members.items()}
+
+    def _default_latency(self) -> float:
+        # Unmeasured agents look average, so new ones get traffic without being flooded
+        return self._latency_sum / self._latency_count if self._latency_count else 0.1
+
+    def _draw(self, members: List[str], exclude: Set[str], skip: Optional[str] = None) -> Optional[str]:
+        """سحب عشوائي يتجاهل المستبعدين بإعادة السحب (O(1) متوقع)"""
+        for _ in range(8):
+            agent_id = members[random.randrange(len(members))]
+            if agent_id not in exclude and agent_id != skip:
+                return agent_id
+        # Mostly excluded: fall back to one scan
+        eligible = [a for a in members if a not in exclude and a != skip]
+        return random.choice(eligible) if eligible else None
+
+    def select(self, capability: str, exclude: Optional[Set[str]] = None) -> Optional[str]:
+        """اختيار الوكيل الأخف حملاً من عينتين عشوائيتين"""
+        members = self._members.get(capability)
+        if not members:
+            return None
+        if exclude:
+            first = self._draw(members, exclude)
+            if first is None:
+                return None
+            second = self._draw(members, exclude, skip=first)
+            if second is None:
+                return first
+        elif len(members) == 1:
+            return members[0]
+        else:
+            first, second = random.sample(members, 2)
+        default_latency = self._default_latency()
+        if self.loads[second].score(default_latency) < self.loads[first].score(default_latency):
+            return second
+        return first
+
+    def begin(self, agent_id: str):
+        load = self.loads.get(agent_id)
+        if load:
+            load.in_flight += 1
+
+    def end(self, agent_id: str, latency: float, ok: bool):
+        load = self.loads.get(agent_id)
+        if load is None:
+            return
+        load.in_flight = max(load.in_flight - 1, 0)
+        load.completed += 1
+        if load.latency is None:
+            self._latency_count += 1
+            self._latency_sum += latency
+            load.latency = latency
+        else:
+            updated = load.latency + self.alpha * (latency - load.latency)
+            self._latency_sum += updated - load.latency
+            load.latency = updated
+        load.error_rate += self.alpha * ((0.0 if ok else 1.0) - load.error_rate)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "capabilities": self.capabilities(),
+            "agents": {agent_id: load.to_dict() for agent_id, load in self.loads.items()}
+        }
@@ -7,7 +7,9 @@ Main coordinator for MCP and A2A protocols with advanced integrations
 
 import logging
 import asyncio
-from typing import Dict, List, Optional, Any
+import importlib.util
+import time
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, List, Optional
 from datetime import datetime
 from pathlib import Path
 import aiohttp
@@ -20,40 +22,34 @@ except ImportError:
     REDIS_AVAILABLE = False
     redis = None
 
-try:
-    from databases import Database
-    DATABASE_AVAILABLE = True
-except ImportError:
-    DATABASE_AVAILABLE = False
-    Database = None
+# Optional integrations are only located here and imported when startup()
+# initializes them, so importing this module stays cheap
+DATABASE_AVAILABLE = importlib.util.find_spec("databases") is not None
+SUPABASE_AVAILABLE = importlib.util.find_spec("supabase") is not None
+GIT_AVAILABLE = importlib.util.find_spec("git") is not None
+MCP_AVAILABLE = importlib.util.find_spec("mcp") is not None
 
-# Optional imports - handle gracefully if not available
-try:
-    from supabase import create_client, Client
-    SUPABASE_AVAILABLE = True
-except ImportError:
-    SUPABASE_AVAILABLE = False
-    create_client = None
-    Client = None
-
-try:
+if TYPE_CHECKING:
+    from databases import Database
     from git import Repo
-    GIT_AVAILABLE = True
-except ImportError:
-    GIT_AVAILABLE = False
-    Repo = None
+    from supabase import Client
 
 from config import (
+    OPENAI_API_KEY,
     SUPABASE_URL, 
     SUPABASE_KEY, 
     DATABASE_URL,
-    REDIS_URL
+    REDIS_URL,
+    STARTUP_COMPONENT_TIMEOUT,
+    STARTUP_REDIS_TIMEOUT,
+    STARTUP_OPTIONAL_IN_BACKGROUND,
+    HEALTH_PROBE_INTERVAL,
+    HEALTH_PROBE_TIMEOUT,
+    HEALTH_PROBE_HISTORY,
+    HEALTH_CRITICAL_DEPENDENCIES,
+    LLM_HEALTH_URL
 )
-# Try to import mcp_server, set to None if not available
-try:
-    from .mcp_server import mcp_server
-except ImportError:
-    mcp_server = None
+from health_prober import HealthProber
 from .a2a_protocol import EnhancedA2AProtocol
 
 logger = logging.getLogger(__name__)
@@ -63,72 +59,195 @@ class EnhancedProtocolManager:
     """مدير بروتوكولات MCP و A2A المحسن"""
     
     def __init__(self):
-        self.mcp_server = mcp_server
+        self._mcp_server: Any = None
+        # Resource/tool counts from the last successful MCP probe
+        self.mcp_capabilities: Optional[Dict[str, int]] = None
         self.session: Optional[aiohttp.ClientSession] = None
-        self.supabase: Optional[Client] = None
-        self.database: Optional[Database] = None
+        self.supabase: Optional["Client"] = None
+        self.database: Optional["Database"] = None
         self.redis_client: Optional[redis.Redis] = None
-        self.git_repos: Dict[str, Repo] = {}
+        self.git_repos: Dict[str, "Repo"] = {}
         self.agent_registry: Dict[str, Dict] = {}
         self.cache_ttl = 3600  # 1 hour default cache
         self.a2a_handler: Optional[EnhancedA2AProtocol] = None
+        self.provider_http = None
+        # Per-component status and duration of the last startup()
+        self.startup_report: Dict[str, Any] = {"components": {}, "total_ms": None}
+        self._background_init: List[asyncio.Task] = []
+        self._supabase_init: Optional[asyncio.Task] = None
+        # Dependencies are pinged in the background; health endpoints read its snapshot
+        self.health_prober = HealthProber(HEALTH_PROBE_INTERVAL, HEALTH_PROBE_TIMEOUT, HEALTH_PROBE_HISTORY)
         
+    @property
+    def mcp_server(self):
+        """خادم MCP (يُحمّل mcp عند أول استخدام)"""
+        if self._mcp_server is None:
+            try:
+                from .mcp_server import mcp_server
+                self._mcp_server = mcp_server
+            except ImportError:
+                pass
+        return self._mcp_server
+
     async def startup(self):
-        """تهيئة جميع البروتوكولات والاتصالات - متوافق مع main_new.py"""
+        """تهيئة جميع البروتوكولات والاتصالات - متوافق مع main_new.py
+        
+        Supabase وقاعدة البيانات وGit مستقلة فتبدأ بالتوازي، ولكل مكون مهلة؛
+        المكونات الاختيارية قد تكتمل في الخلفية بعد بدء استقبال الطلبات.
+        Redis وحده ينتظره الباقي لأن المزودين وA2A يُربطون به.
+        """
+        started = time.perf_counter()
         try:
             # Initialize HTTP session
             self.session = aiohttp.ClientSession()
             
-            # Initialize Supabase
-            if SUPABASE_AVAILABLE and SUPABASE_URL and SUPABASE_KEY:
-                self.supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-                logger.info("✅ Supabase client initialized")
+            self._supabase_init = asyncio.create_task(self._timed("supabase", self._init_supabase))
+            optional = [
+                self._supabase_init,
+                asyncio.create_task(self._timed("database", self._init_database)),
+                asyncio.create_task(self._timed("git", self._initialize_git_repos))
+            ]
             
-            # Initialize Database
-            if DATABASE_URL and DATABASE_AVAILABLE:
-                try:
-                    self.database = Database(DATABASE_URL)
-                    await self.database.connect()
-                    logger.info("✅ Database connected")
-                except Exception as db_err:
-                    logger.warning(f"Database connection failed: {str(db_err)}")
-                    self.database = None
-            else:
-                logger.info("ℹ️ Database module not available or not configured, skipping initialization")
+            await self._timed("redis", self._init_redis, STARTUP_REDIS_TIMEOUT)
+            await self._timed("providers", self._init_providers)
+            await self._timed("a2a", self._init_a2a)
             
-            # Initialize Redis (optional)
-            if REDIS_URL and REDIS_AVAILABLE:
-                try:
-                    self.redis_client = redis.from_url(REDIS_URL)
-                    await self.redis_client.ping()
-                    logger.info("✅ Redis connected")
-                except Exception as redis_err:
-                    logger.warning(f"Redis connection skipped: {str(redis_err)}")
-                    self.redis_client = None
+            if STARTUP_OPTIONAL_IN_BACKGROUND:
+                self._background_init = optional
             else:
-                logger.info("ℹ️ Redis not configured, skipping initialization")
-            
-            # Initialize A2A handler
-            self.a2a_handler = EnhancedA2AProtocol(self.session, self.redis_client)
-            
-            # Initialize Git repositories
-            await self._initialize_git_repos()
+                await asyncio.gather(*optional)
             
-            # Register default agents
-            await self._register_default_agents()
+            self._register_health_probes()
+            self.health_prober.start()
             
-            logger.info("✅ Enhanced Protocol Manager initialized successfully")
+            self.startup_report["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            pending = [name for name, entry in self.startup_report["components"].items() if entry["status"] == "pending"]
+            logger.info(
+                f"✅ Enhanced Protocol Manager initialized in {self.startup_report['total_ms']}ms"
+                + (f" (still starting: {', '.join(pending)})" if pending else "")
+            )
             
         except Exception as e:
             logger.error(f"❌ Protocol manager initialization failed: {str(e)}")
             raise
 
+    async def _timed(self, name: str, init: Callable[[], Awaitable[Any]], timeout: Optional[float] = None):
+        """تشغيل مكون بمهلة وتسجيل مدته وحالته في تقرير البدء"""
+        entry = {"status": "pending", "duration_ms": None}
+        self.startup_report["components"][name] = entry
+        started = time.perf_counter()
+        try:
+            skipped = await asyncio.wait_for(init(), timeout or STARTUP_COMPONENT_TIMEOUT) is False
+            entry["status"] = "skipped" if skipped else "ok"
+        except asyncio.TimeoutError:
+            entry["status"] = "timeout"
+            logger.warning(f"⏱️ Startup component {name} timed out after {timeout or STARTUP_COMPONENT_TIMEOUT}s")
+        except Exception as e:
+            entry["status"] = "failed"
+            entry["error"] = str(e)
+            logger.warning(f"Startup component {name} failed: {str(e)}")
+        entry["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+    async def _init_supabase(self):
+        if not (SUPABASE_AVAILABLE and SUPABASE_URL and SUPABASE_KEY):
+            return False
+        from supabase import create_client
+        # create_client is synchronous
+        self.supabase = await asyncio.to_thread(create_client, SUPABASE_URL, SUPABASE_KEY)
+        logger.info("✅ Supabase client initialized")
+
+    def supabase_pending(self) -> bool:
+        """هل ما زالت تهيئة Supabase جارية في الخلفية"""
+        return self._supabase_init is not None and not self._supabase_init.done()
+
+    def on_supabase_ready(self, callback: Callable[[Any], None]):
+        """استدعاء callback بعميل Supabase المشترك عند اكتمال تهيئته (إن نجحت)"""
+        def done(_task: asyncio.Task):
+            if self.supabase is not None:
+                callback(self.supabase)
+
+        if self._supabase_init is not None:
+            self._supabase_init.add_done_callback(done)
+
+    async def _init_database(self):
+        if not (DATABASE_URL and DATABASE_AVAILABLE):
+            logger.info("ℹ️ Database module not available or not configured, skipping initialization")
+            return False
+        from databases import Database
+        database = Database(DATABASE_URL)
+        try:
+            await database.connect()
+        except BaseException:
+            await self._close_quietly("database", database.disconnect())
+            raise
+        self.database = database
+        logger.info("✅ Database connected")
+
+    @staticmethod
+    async def _close_quietly(name: str, closing: Awaitable[Any]):
+        """إغلاق عميل نصف مهيأ دون حجب خطأ التهيئة الأصلي"""
+        try:
+            await asyncio.shield(closing)
+        except Exception as e:
+            logger.debug(f"Closing half-initialized {name} client failed: {str(e)}")
+
+    async def _init_redis(self):
+        if not (REDIS_URL and REDIS_AVAILABLE):
+            logger.info("ℹ️ Redis not configured, skipping initialization")
+            return False
+        client = redis.from_url(REDIS_URL)
+        try:
+            await client.ping()
+        except BaseException:
+            # Timed out (cancelled by _timed) or refused: release the pool now
+            await self._close_quietly("redis", client.close())
+            raise
+        self.redis_client = client
+        logger.info("✅ Redis connected")
+
+    async def _init_providers(self):
+        # Share the providers cache and rate limits across workers when
+        # Redis is up, and give every provider the pooled HTTP client
+        from providers import providers_manager
+        from provider_http import ProviderHTTPClient
+        from rate_limiter import TokenBucketLimiter
+        self.provider_http = ProviderHTTPClient()
+        await self.provider_http.start()
+        providers_manager.attach_redis(self.redis_client)
+        providers_manager.attach_http(self.provider_http)
+        providers_manager.attach_limiter(TokenBucketLimiter(self.redis_client))
+        providers_manager.refresh_scheduler.start()
+        providers_manager.mention_ingestor.start()
+        providers_manager.sentiment_store.start()
+        providers_manager.mention_index.start()
+
+    async def _init_a2a(self):
+        self.a2a_handler = EnhancedA2AProtocol(self.session, self.redis_client)
+        await self.a2a_handler.durable_queue.start()
+        await self.a2a_handler.load_registry()
+        await self._register_default_agents()
+
     async def shutdown(self):
         """تنظيف جميع الموارد - متوافق مع main_new.py"""
         tasks = []
         
+        for task in self._background_init:
+            task.cancel()
+        await asyncio.gather(*self._background_init, return_exceptions=True)
+        await self.health_prober.stop()
+        
+        from providers import providers_manager
+        tasks.append(providers_manager.refresh_scheduler.stop())
+        tasks.append(providers_manager.mention_ingestor.stop())
+        tasks.append(providers_manager.sentiment_store.stop())
+        tasks.append(providers_manager.mention_index.stop())
+        if self.a2a_handler:
+            # Before the session goes away: its WebSockets belong to it
+            await self.a2a_handler.close()
         if self.session:
             tasks.append(self.session.close())
+        if self.provider_http:
+            tasks.append(self.provider_http.close())
         if self.database:
             tasks.append(self.database.disconnect())
         if self.redis_client:
@@ -139,17 +258,79 @@ class EnhancedProtocolManager:
         
         logger.info("✅ Enhanced Protocol Manager cleaned up")
 
+    def _register_health_probes(self):
+        """تسجيل فحوص الاعتماديات المُعدّة فقط"""
+        from providers import providers_manager
+
+        def critical(name: str) -> bool:
+            return name in HEALTH_CRITICAL_DEPENDENCIES
+
+        if MCP_AVAILABLE:
+            self.health_prober.register("mcp", self._probe_mcp, critical("mcp"))
+        if REDIS_URL and REDIS_AVAILABLE:
+            self.health_prober.register("redis", self._probe_redis, critical("redis"))
+        if DATABASE_URL and DATABASE_AVAILABLE:
+            self.health_prober.register("postgres", self._probe_postgres, critical("postgres"))
+        if SUPABASE_URL and SUPABASE_KEY:
+            self.health_prober.register("supabase", lambda: self._probe_http(
+                f"{SUPABASE_URL}/rest/v1/", {"apikey": SUPABASE_KEY}
+            ), critical("supabase"))
+        if OPENAI_API_KEY:
+            self.health_prober.register("llm", lambda: self._probe_http(
+                LLM_HEALTH_URL, {"Authorization": f"Bearer {OPENAI_API_KEY}"}
+            ), critical("llm"))
+        for provider in (providers_manager.seranking, providers_manager.awario, providers_manager.mention):
+            if provider.api_key:
+                self.health_prober.register(
+                    f"provider:{provider.name}",
+                    lambda provider=provider: self._probe_http(provider.base_url, provider.auth_headers),
+                    critical(provider.name)
+                )
+
+    async def _probe_mcp(self):
+        if self.mcp_server is None:
+            raise ConnectionError("MCP server failed to load")
+        from .mcp_server import count_capabilities
+        self.mcp_capabilities = await count_capabilities()
+
+    async def _probe_redis(self):
+        if not self.redis_client:
+            raise ConnectionError("not connected")
+        await self.redis_client.ping()
+
+    async def _probe_postgres(self):
+        # Connected in the background at startup; down until then
+        if not self.database:
+            raise ConnectionError("not connected")
+        await self.database.fetch_val("SELECT 1")
+
+    async def _probe_http(self, url: str, headers: Dict[str, str]):
+        """الخدمة متاحة إن ردت بأي حالة أقل من 500 (401 تعني أنها تعمل)"""
+        session = self.provider_http.session if self.provider_http and self.provider_http.session else self.session
+        async with session.get(url, headers=headers, allow_redirects=False) as response:
+            if response.status >= 500:
+                raise ConnectionError(f"HTTP {response.status}")
+
     async def health_check(self):
-        """فحص صحة البروتوكولات - متوافق مع main_new.py"""
+        """فحص صحة البروتوكولات - متوافق مع main_new.py
+        
+        حالة الاعتماديات من آخر لقطة للفحص الدوري (لا تُستدعى أي خدمة هنا)
+        """
+        probes = self.health_prober.snapshot()
+        dependencies = probes["dependencies"]
+
+        def probed(name: str, fallback: str) -> str:
+            return dependencies[name]["status"] if name in dependencies else fallback
+
         health_status = {
-            "status": "healthy",
+            "status": probes["status"],
             "timestamp": datetime.now().isoformat(),
             "protocols": {
                 "mcp": {
-                    "status": "active",
-                    # Fix: Don't call the function directly, it's a decorator reference
-                    "resources_count": 6,  # Hardcoded count based on the list in mcp_server.py
-                    "tools_count": 3  # Hardcoded count based on the list in mcp_server.py
+                    "status": probed("mcp", "not_installed"),
+                    # Counted from the server's own list handlers by the last probe
+                    "resources_count": self.mcp_capabilities["resources"] if self.mcp_capabilities else None,
+                    "tools_count": self.mcp_capabilities["tools"] if self.mcp_capabilities else None
                 },
                 "a2a": {
                     "status": "active" if self.a2a_handler else "not_initialized",
@@ -158,15 +339,15 @@ class EnhancedProtocolManager:
             },
             "integrations": {
                 "supabase": {
-                    "status": "connected" if self.supabase else "not_configured",
+                    "status": probed("supabase", "connected" if self.supabase else "not_configured"),
                     "url": SUPABASE_URL if self.supabase else None
                 },
                 "database": {
-                    "status": "connected" if self.database else "not_configured",
+                    "status": probed("postgres", "connected" if self.database else "not_configured"),
                     "url": DATABASE_URL if self.database else None
                 },
                 "redis": {
-                    "status": "connected" if self.redis_client else "not_configured", 
+                    "status": probed("redis", "connected" if self.redis_client else "not_configured"),
                     "url": REDIS_URL if self.redis_client else None
                 },
                 "git": {
@@ -175,26 +356,28 @@ class EnhancedProtocolManager:
                 }
             },
             "features": {
-                "enhanced_mcp_resources": True,
+                "enhanced_mcp_resources": MCP_AVAILABLE,
                 "supabase_integration": bool(self.supabase),
                 "git_operations": bool(self.git_repos),
                 "advanced_caching": bool(self.redis_client),
                 "secure_a2a_communication": bool(self.a2a_handler),
                 "real_time_monitoring": True
-            }
+            },
+            "dependencies": probes,
+            "startup": self.startup_report
         }
         
         return health_status
 
     async def _initialize_git_repos(self):
         """تهيئة مستودعات Git المحلية"""
-        try:
-            project_root = Path.cwd()
-            if (project_root / ".git").exists() and GIT_AVAILABLE:
-                self.git_repos["main"] = Repo(project_root)
-                logger.info(f"Git repository initialized: {project_root}")
-        except Exception as e:
-            logger.warning(f"Git initialization failed: {str(e)}")
+        project_root = Path.cwd()
+        if not ((project_root / ".git").exists() and GIT_AVAILABLE):
+            return False
+        from git import Repo
+        # Repo() reads .git from disk synchronously
+        self.git_repos["main"] = await asyncio.to_thread(Repo, project_root)
+        logger.info(f"Git repository initialized: {project_root}")
 
     async def _register_default_agents(self):
         """تسجيل الوكلاء الافتراضيين في نظام A2A"""
@@ -240,7 +423,9 @@ class EnhancedProtocolManager:
                     agent["id"],
                     agent["endpoint"], 
                     agent["capabilities"],
-                    metadata={"name": agent["name"], "version": "2.0"}
+                    metadata={"name": agent["name"], "version": "2.0"},
+                    # M1–M5 run in this process; messages go to their in-memory inbox
+                    local=True
                 )
                 self.agent_registry[agent["id"]] = agent
                 logger.info(f"✅ وكيل {agent['id']} مسجل في نظام A2A")
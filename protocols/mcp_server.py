@@ -318,6 +318,13 @@ async def _handle_cache_operation(args: dict) -> str:
     return f"Cache operation executed: {args}"
 
 
+async def count_capabilities() -> Dict[str, int]:
+    """عدد الموارد والأدوات التي يعلنها الخادم فعلياً"""
+    if not MCP_AVAILABLE:
+        return {"resources": 0, "tools": 0}
+    return {"resources": len(await handle_list_resources()), "tools": len(await handle_list_tools())}
+
+
 # Initialize enhanced MCP server
 def setup_enhanced_mcp_server(supabase_client: Optional[Client] = None, git_repos: Optional[Dict[str, Repo]] = None):
     """Setup enhanced MCP server with integrations"""
@@ -0,0 +1,106 @@
+"""
+A2A Message Tracker
+متتبع رسائل A2A بفهرس وذاكرة محدودة
+
+Fixed-size ring buffer of message records with a dict index by message id.
+Per-agent sent/received counts and per-status counts are maintained as
+messages are added, updated and evicted, so status updates and agent stats
+are O(1) and memory never grows past the configured capacity.
+"""
+
+from collections import Counter
+from typing import Any, Dict, Iterator, List, Optional
+
+
+class MessageTracker:
+    """سجل دائري للرسائل مع فهرس حسب المعرف"""
+
+    def __init__(self, capacity: int = 1000):
+        self.capacity = capacity
+        self._ring: List[Optional[Dict[str, Any]]] = [None] * capacity
+        self._next = 0  # slot for the next message
+        self._index: Dict[str, int] = {}
+        self.status_counts: Counter = Counter()
+        self._sent: Counter = Counter()
+        self._received: Counter = Counter()
+        self._last_message: Dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        """من الأقدم إلى الأحدث"""
+        for offset in range(self.capacity):
+            record = self._ring[(self._next + offset) % self.capacity]
+            if record is not None:
+                yield record
+
+    def _evict_slot(self, slot: int):
+        old = self._ring[slot]
+        if old is None:
+            return
+        self._ring[slot] = None
+        if self._index.get(old["id"]) == slot:
+            del self._index[old["id"]]
+        self.status_counts[old["status"]] -= 1
+        self._sent[old["from"]] -= 1
+        self._received[old["to"]] -= 1
+
+    def track(self, message_id: str, from_agent: str, to_agent: str, timestamp: str, status: str = "pending") -> Dict[str, Any]:
+        """إضافة رسالة (تُزاح الأقدم عند امتلاء السجل)"""
+        if message_id in self._index:
+            # Reused id: drop the older record so counts stay exact
+            self._evict_slot(self._index[message_id])
+        slot = self._next
+        self._evict_slot(slot)
+        record = {"id": message_id, "from": from_agent, "to": to_agent, "timestamp": timestamp, "status": status}
+        self._ring[slot] = record
+        self._index[message_id] = slot
+        self._next = (slot + 1) % self.capacity
+        self.status_counts[status] += 1
+        self._sent[from_agent] += 1
+        self._received[to_agent] += 1
+        self._last_message[from_agent] = message_id
+        self._last_message[to_agent] = message_id
+        return record
+
+    def get(self, message_id: str) -> Optional[Dict[str, Any]]:
+        slot = self._index.get(message_id)
+        return self._ring[slot] if slot is not None else None
+
+    def update_status(self, message_id: str, status: str, **fields: Any) -> bool:
+        """تحديث حالة رسالة؛ False إن أزيحت من السجل"""
+        record = self.get(message_id)
+        if record is None:
+            return False
+        self.status_counts[record["status"]] -= 1
+        self.status_counts[status] += 1
+        record["status"] = status
+        record.update(fields)
+        return True
+
+    def agent_stats(self, agent_id: str) -> Dict[str, Any]:
+        """عدد الرسائل المرسلة والمستقبلة ضمن السجل الحالي"""
+        return {
+            "messages_sent": self._sent[agent_id],
+            "messages_received": self._received[agent_id],
+            "last_message": self.get(self._last_message.get(agent_id, ""))
+        }
+
+    def trim(self, max_size: int):
+        """إبقاء أحدث max_size رسالة فقط"""
+        excess = len(self) - max_size
+        for offset in range(self.capacity):
+            if excess <= 0:
+                break
+            slot = (self._next + offset) % self.capacity
+            if self._ring[slot] is not None:
+                self._evict_slot(slot)
+                excess -= 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "tracked": len(self),
+            "capacity": self.capacity,
+            "by_status": {status: n for status, n in self.status_counts.items() if n}
+        }
@@ -0,0 +1,75 @@
+"""
+Redis Write Batcher
+تجميع كتابات Redis في pipeline واحد
+
+Fire-and-forget writes (registrations, communication logs) are buffered
+and sent as one non-transactional pipeline when the buffer reaches
+max_batch commands or flush_interval after the first buffered command,
+whichever comes first. Writes are best-effort: a failed pipeline is logged
+and counted, not retried.
+"""
+
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class RedisWriteBatcher:
+    """كتابات Redis مؤجلة تُرسل على دفعات"""
+
+    def __init__(self, redis_client: Optional[Any], max_batch: int = 100, flush_interval: float = 0.05):
+        self.redis_client = redis_client
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self._buffer: List[Tuple[str, tuple, Dict[str, Any]]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flushes: set = set()
+        self.stats = {"commands": 0, "pipelines": 0, "failed_pipelines": 0}
+
+    def queue(self, command: str, *args: Any, **kwargs: Any):
+        """إضافة أمر (مثل "setex" أو "lpush") للدفعة التالية"""
+        if not self.redis_client:
+            return
+        self._buffer.append((command, args, kwargs))
+        if len(self._buffer) >= self.max_batch:
+            self._schedule_flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.flush_interval, self._schedule_flush)
+
+    def _schedule_flush(self):
+        if self._flush_handle:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        commands, self._buffer = self._buffer, []
+        if commands:
+            task = asyncio.create_task(self._execute(commands))
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+
+    async def _execute(self, commands: List[Tuple[str, tuple, Dict[str, Any]]]):
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            for command, args, kwargs in commands:
+                getattr(pipe, command)(*args, **kwargs)
+            await pipe.execute()
+            self.stats["commands"] += len(commands)
+            self.stats["pipelines"] += 1
+        except Exception as e:
+            self.stats["failed_pipelines"] += 1
+            logger.warning(f"Redis write batch of {len(commands)} failed: {str(e)}")
+
+    async def flush(self):
+        """إرسال كل ما في الدفعة الحالية وانتظار الدفعات الجارية"""
+        self._schedule_flush()
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        pipelines = self.stats["pipelines"]
+        return {
+            **self.stats,
+            "buffered": len(self._buffer),
+            "avg_pipeline_size": round(self.stats["commands"] / pipelines, 2) if pipelines else 0.0
+        }
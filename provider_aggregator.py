@@ -0,0 +1,147 @@
+"""
+Latency-Budgeted Provider Aggregator
+مجمّع نتائج المزودين بميزانية زمنية
+
+Fans out to several provider calls with a deadline per source and returns
+whatever finished in time, with a status for each source. A source that runs
+past its own p95 can optionally get a hedged second attempt, and the slowest
+source of each fan-out is recorded as the bottleneck.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+SourceFactory = Callable[[], Awaitable[Any]]
+
+
+class SourceStats:
+    """سجل زمن الاستجابة والحالات لمصدر واحد"""
+
+    def __init__(self, window: int = 200):
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.counts = {"ok": 0, "timeout": 0, "error": 0, "hedged": 0, "hedge_wins": 0, "bottleneck": 0}
+
+    def p95(self, min_samples: int) -> Optional[float]:
+        if len(self.latencies) < min_samples:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+
+class LatencyBudgetAggregator:
+    """تنفيذ المصادر بالتوازي مع مهلة لكل مصدر ونتائج جزئية"""
+
+    def __init__(
+        self,
+        default_deadline: float = 8.0,
+        deadlines: Optional[Dict[str, float]] = None,
+        hedging: bool = False,
+        hedge_min_samples: int = 20
+    ):
+        self.default_deadline = default_deadline
+        self.deadlines = deadlines or {}
+        self.hedging = hedging
+        self.hedge_min_samples = hedge_min_samples
+        self.sources: Dict[str, SourceStats] = {}
+
+    def _stats_for(self, name: str) -> SourceStats:
+        if name not in self.sources:
+            self.sources[name] = SourceStats()
+        return self.sources[name]
+
+    async def _run_source(self, name: str, factory: SourceFactory, deadline: float) -> Dict[str, Any]:
+        """تشغيل مصدر واحد ضمن مهلته مع محاولة تحوّط اختيارية بعد p95"""
+        stats = self._stats_for(name)
+        hedge_after = stats.p95(self.hedge_min_samples) if self.hedging else None
+        start = time.perf_counter()
+        attempts = {asyncio.create_task(factory()): "primary"}
+        hedged = False
+        last_error: Optional[BaseException] = None
+        try:
+            while attempts:
+                elapsed = time.perf_counter() - start
+                remaining = deadline - elapsed
+                if remaining <= 0:
+                    stats.counts["timeout"] += 1
+                    return {"status": "timeout", "latency_ms": round(elapsed * 1000, 2), "hedged": hedged}
+
+                wait_for = remaining
+                if hedge_after is not None and not hedged:
+                    wait_for = min(remaining, max(0.0, hedge_after - elapsed))
+                done, _ = await asyncio.wait(attempts, timeout=wait_for, return_when=asyncio.FIRST_COMPLETED)
+
+                for task in done:
+                    attempt = attempts.pop(task)
+                    # A cancelled attempt (e.g. a shared load cancelled elsewhere) counts as failed
+                    if task.cancelled():
+                        last_error = asyncio.CancelledError(f"{attempt} attempt cancelled")
+                        continue
+                    if task.exception() is not None:
+                        last_error = task.exception()
+                        continue
+                    latency = time.perf_counter() - start
+                    stats.latencies.append(latency)
+                    stats.counts["ok"] += 1
+                    if attempt == "hedge":
+                        stats.counts["hedge_wins"] += 1
+                    return {
+                        "status": "ok",
+                        "latency_ms": round(latency * 1000, 2),
+                        "hedged": hedged,
+                        "data": task.result()
+                    }
+
+                if not done and hedge_after is not None and not hedged:
+                    hedged = True
+                    stats.counts["hedged"] += 1
+                    attempts[asyncio.create_task(factory())] = "hedge"
+
+            stats.counts["error"] += 1
+            return {
+                "status": "error",
+                "latency_ms": round((time.perf_counter() - start) * 1000, 2),
+                "hedged": hedged,
+                "error": str(last_error)
+            }
+        finally:
+            for task in attempts:
+                task.cancel()
+
+    async def gather(self, sources: Dict[str, SourceFactory]) -> Dict[str, Any]:
+        """تشغيل جميع المصادر وإرجاع النتائج الجزئية مع حالة كل مصدر"""
+        names = list(sources)
+        outcomes = await asyncio.gather(*(
+            self._run_source(name, sources[name], self.deadlines.get(name, self.default_deadline))
+            for name in names
+        ))
+        results = dict(zip(names, outcomes))
+
+        bottleneck = max(results, key=lambda name: results[name]["latency_ms"]) if results else None
+        if bottleneck:
+            self._stats_for(bottleneck).counts["bottleneck"] += 1
+            logger.debug(f"Provider fan-out bottleneck: {bottleneck} ({results[bottleneck]['latency_ms']}ms)")
+
+        succeeded = [name for name, outcome in results.items() if outcome["status"] == "ok"]
+        return {
+            "results": results,
+            "bottleneck": bottleneck,
+            "succeeded": len(succeeded),
+            "partial": 0 < len(succeeded) < len(results),
+            "failed": not succeeded
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """إحصائيات كل مصدر بما فيها عدد مرات كونه الأبطأ"""
+        return {
+            name: {
+                **stats.counts,
+                "p95_ms": round(p95 * 1000, 2) if (p95 := stats.p95(1)) is not None else None,
+                "deadline_s": self.deadlines.get(name, self.default_deadline)
+            }
+            for name, stats in self.sources.items()
+        }
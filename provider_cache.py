@@ -0,0 +1,308 @@
+"""
+Provider Results Cache
+التخزين المؤقت لنتائج مزودي البيانات
+
+Bounded TTL-LRU cache with stale-while-revalidate and an optional shared
+Redis tier, used by ProvidersManager so every gunicorn worker sees the same
+entries and a stable key regardless of keyword order or hash seed.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_keywords(keywords: Iterable[str]) -> list:
+    """توحيد الكلمات المفتاحية: إزالة الفراغات والتكرار وترتيبها"""
+    return sorted({k.strip().lower() for k in keywords if k and k.strip()})
+
+
+def canonical_cache_key(namespace: str, **parts: Any) -> str:
+    """توليد مفتاح ثابت بين العمليات (لا يعتمد على hash() ولا على ترتيب الكلمات)"""
+    normalized = {
+        name: normalize_keywords(value) if isinstance(value, (list, tuple, set)) else value
+        for name, value in parts.items()
+    }
+    digest = hashlib.sha256(
+        json.dumps(normalized, sort_keys=True, ensure_ascii=False).encode()
+    ).hexdigest()[:32]
+    return f"{namespace}:{digest}"
+
+
+class TTLCache:
+    """ذاكرة مؤقتة محدودة الحجم مع انتهاء صلاحية وتحديث في الخلفية"""
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: float = 3600,
+        stale_ttl: float = 600,
+        redis_client: Optional[Any] = None,
+        redis_prefix: str = "providers_cache"
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # How long past ttl an entry may still be served while it refreshes
+        self.stale_ttl = stale_ttl
+        self.redis_client = redis_client
+        self.redis_prefix = redis_prefix
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._refreshing: Dict[str, asyncio.Task] = {}
+        self.stats = {
+            "hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "redis_hits": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "refreshes": 0,
+            "refresh_errors": 0,
+            "load_errors": 0
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        entry = self._entries.get(key)
+        return entry is not None and self._age(entry[0]) < self.ttl
+
+    @staticmethod
+    def _age(stored_at: float) -> float:
+        return time.time() - stored_at
+
+    def _store_local(self, key: str, value: Any, stored_at: Optional[float] = None):
+        self._entries[key] = (stored_at if stored_at is not None else time.time(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    async def _get_redis(self, key: str) -> Optional[Tuple[float, Any]]:
+        if not self.redis_client:
+            return None
+        try:
+            raw = await self.redis_client.get(f"{self.redis_prefix}:{key}")
+            if raw is None:
+                return None
+            payload = json.loads(raw)
+            return payload["stored_at"], payload["data"]
+        except Exception as e:
+            logger.warning(f"Redis cache read failed for {key}: {str(e)}")
+            return None
+
+    async def _set_redis(self, key: str, value: Any, stored_at: float):
+        if not self.redis_client:
+            return
+        try:
+            await self.redis_client.setex(
+                f"{self.redis_prefix}:{key}",
+                int(self.ttl + self.stale_ttl),
+                json.dumps({"stored_at": stored_at, "data": value}, ensure_ascii=False, default=str)
+            )
+        except Exception as e:
+            logger.warning(f"Redis cache write failed for {key}: {str(e)}")
+
+    async def _lookup(self, key: str) -> Optional[Tuple[float, Any]]:
+        """البحث محلياً ثم في Redis؛ النسخة المحلية القديمة لا تحجب نسخة Redis الأحدث"""
+        local = self._entries.get(key)
+        if local is not None:
+            self._entries.move_to_end(key)
+            if self._age(local[0]) < self.ttl:
+                return local
+        # Missing or past ttl locally: another worker may already have refreshed it
+        shared = await self._get_redis(key)
+        if (
+            shared is not None
+            and self._age(shared[0]) < self.ttl + self.stale_ttl
+            and (local is None or shared[0] > local[0])
+        ):
+            self.stats["redis_hits"] += 1
+            self._store_local(key, shared[1], shared[0])
+            return shared
+        return local
+
+    async def get(self, key: str) -> Optional[Any]:
+        """قراءة قيمة حديثة فقط، بدون تحميل"""
+        entry = await self._lookup(key)
+        if entry is not None and self._age(entry[0]) < self.ttl:
+            self.stats["hits"] += 1
+            return entry[1]
+        self.stats["misses"] += 1
+        return None
+
+    async def get_many(self, keys: List[str]) -> Dict[str, Any]:
+        """قراءة عدة مفاتيح حديثة: المحلي أولاً ثم MGET واحد لبقيتها"""
+        found: Dict[str, Any] = {}
+        remote: List[str] = []
+        for key in keys:
+            entry = self._entries.get(key)
+            if entry is not None and self._age(entry[0]) < self.ttl:
+                self._entries.move_to_end(key)
+                found[key] = entry[1]
+            else:
+                remote.append(key)
+
+        if remote and self.redis_client:
+            try:
+                raws = await self.redis_client.mget([f"{self.redis_prefix}:{key}" for key in remote])
+                for key, raw in zip(remote, raws):
+                    if raw is None:
+                        continue
+                    payload = json.loads(raw)
+                    if self._age(payload["stored_at"]) < self.ttl:
+                        self.stats["redis_hits"] += 1
+                        self._store_local(key, payload["data"], payload["stored_at"])
+                        found[key] = payload["data"]
+            except Exception as e:
+                logger.warning(f"Redis cache multi-read of {len(remote)} keys failed: {str(e)}")
+
+        self.stats["hits"] += len(found)
+        self.stats["misses"] += len(keys) - len(found)
+        return found
+
+    async def set_many(self, values: Dict[str, Any]):
+        """حفظ عدة قيم في الطبقتين بـ pipeline واحد"""
+        stored_at = time.time()
+        for key, value in values.items():
+            self._store_local(key, value, stored_at)
+        if not self.redis_client or not values:
+            return
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            for key, value in values.items():
+                pipe.setex(
+                    f"{self.redis_prefix}:{key}",
+                    int(self.ttl + self.stale_ttl),
+                    json.dumps({"stored_at": stored_at, "data": value}, ensure_ascii=False, default=str)
+                )
+            await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Redis cache write of {len(values)} keys failed: {str(e)}")
+
+    async def set(self, key: str, value: Any):
+        """حفظ قيمة في الطبقتين"""
+        stored_at = time.time()
+        self._store_local(key, value, stored_at)
+        await self._set_redis(key, value, stored_at)
+
+    def stored_at(self, key: str) -> Optional[float]:
+        """وقت حفظ القيمة محلياً (None إن لم تكن موجودة)"""
+        entry = self._entries.get(key)
+        return entry[0] if entry is not None else None
+
+    async def shared_stored_at(self, key: str) -> Optional[float]:
+        """وقت حفظ أحدث نسخة في أي من الطبقتين؛ تُنسخ نسخة Redis الأحدث محلياً
+
+        Another worker may have refreshed the key; without this the local
+        copy would look due until it expires.
+        """
+        local = self.stored_at(key)
+        shared = await self._get_redis(key)
+        if shared is not None and (local is None or shared[0] > local):
+            self._store_local(key, shared[1], shared[0])
+            return shared[0]
+        return local
+
+    def is_loading(self, key: str) -> bool:
+        """هل يجري تحميل المفتاح الآن (طلب أو تحديث في الخلفية)"""
+        return key in self._inflight or key in self._refreshing
+
+    def invalidate(self, key: str):
+        self._entries.pop(key, None)
+
+    async def get_or_load(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Any]],
+        cache_if: Optional[Callable[[Any], bool]] = None
+    ) -> Any:
+        """إرجاع القيمة المخزنة أو تحميلها مرة واحدة فقط مهما تعدد الطالبون
+
+        cache_if can veto storing a loaded value (e.g. partial results).
+        """
+        entry = await self._lookup(key)
+        if entry is not None:
+            age = self._age(entry[0])
+            if age < self.ttl:
+                self.stats["hits"] += 1
+                return entry[1]
+            if age < self.ttl + self.stale_ttl:
+                self.stats["stale_hits"] += 1
+                self._schedule_refresh(key, loader, cache_if)
+                return entry[1]
+            self.stats["expirations"] += 1
+            self.invalidate(key)
+
+        self.stats["misses"] += 1
+        return await self._load(key, loader, cache_if)
+
+    async def _load(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Any]],
+        cache_if: Optional[Callable[[Any], bool]] = None
+    ) -> Any:
+        """تحميل واحد لكل مفتاح؛ الطلبات المتزامنة تنتظر نفس النتيجة"""
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await loader()
+            if cache_if is None or cache_if(value):
+                await self.set(key, value)
+            future.set_result(value)
+            return value
+        except Exception as e:
+            self.stats["load_errors"] += 1
+            future.set_exception(e)
+            # Nobody else may be waiting, don't leave an unretrieved exception behind
+            future.exception()
+            raise
+        finally:
+            if not future.done():
+                future.cancel()
+            self._inflight.pop(key, None)
+
+    def _schedule_refresh(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Any]],
+        cache_if: Optional[Callable[[Any], bool]] = None
+    ):
+        """تحديث القيمة في الخلفية مع إبقاء القيمة القديمة متاحة"""
+        if key in self._refreshing or key in self._inflight:
+            return
+
+        async def refresh():
+            try:
+                await self._load(key, loader, cache_if)
+                self.stats["refreshes"] += 1
+            except Exception as e:
+                self.stats["refresh_errors"] += 1
+                logger.warning(f"Background refresh failed for {key}: {str(e)}")
+            finally:
+                self._refreshing.pop(key, None)
+
+        self._refreshing[key] = asyncio.create_task(refresh())
+
+    def get_stats(self) -> Dict[str, Any]:
+        """إحصائيات الذاكرة المؤقتة"""
+        lookups = self.stats["hits"] + self.stats["stale_hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hit_ratio": round((self.stats["hits"] + self.stats["stale_hits"]) / lookups, 4) if lookups else 0.0,
+            "shared_tier": "redis" if self.redis_client else "none"
+        }
@@ -0,0 +1,173 @@
+"""
+Provider HTTP Client
+عميل HTTP المشترك لمزودي البيانات
+
+One pooled aiohttp session for SE Ranking, Awario and Mention: keep-alive
+connections, per-host limits, DNS caching, request timeouts and per-provider
+latency/error metrics. Created once by the protocol manager lifespan and
+attached to every provider.
+"""
+
+import logging
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+import aiohttp
+
+from config import (
+    PROVIDER_HTTP_MAX_CONNECTIONS,
+    PROVIDER_HTTP_MAX_PER_HOST,
+    PROVIDER_HTTP_DNS_TTL,
+    PROVIDER_HTTP_KEEPALIVE,
+    PROVIDER_HTTP_CONNECT_TIMEOUT,
+    REQUEST_TIMEOUT
+)
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderRequestError(Exception):
+    """خطأ في طلب مزود بيانات خارجي"""
+
+    def __init__(self, provider: str, message: str, status: Optional[int] = None):
+        super().__init__(f"{provider}: {message}")
+        self.provider = provider
+        self.status = status
+
+
+class ProviderMetrics:
+    """مقاييس زمن الاستجابة والأخطاء لمزود واحد"""
+
+    def __init__(self, window: int = 500):
+        self.requests = 0
+        self.errors = 0
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.last_error: Optional[str] = None
+        self.last_error_at: Optional[float] = None
+
+    def record(self, latency: float, error: Optional[str] = None):
+        self.requests += 1
+        self.latencies.append(latency)
+        if error:
+            self.errors += 1
+            self.last_error = error
+            self.last_error_at = time.time()
+
+    def percentile(self, pct: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def snapshot(self) -> Dict[str, Any]:
+        p50, p95 = self.percentile(50), self.percentile(95)
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "error_rate": round(self.errors / self.requests, 4) if self.requests else 0.0,
+            "latency_p50_ms": round(p50 * 1000, 2) if p50 is not None else None,
+            "latency_p95_ms": round(p95 * 1000, 2) if p95 is not None else None,
+            "last_error": self.last_error
+        }
+
+
+class ProviderHTTPClient:
+    """جلسة HTTP مشتركة مع تجميع الاتصالات لجميع المزودين"""
+
+    def __init__(
+        self,
+        max_connections: int = PROVIDER_HTTP_MAX_CONNECTIONS,
+        max_per_host: int = PROVIDER_HTTP_MAX_PER_HOST,
+        dns_ttl: int = PROVIDER_HTTP_DNS_TTL,
+        keepalive: float = PROVIDER_HTTP_KEEPALIVE,
+        timeout: float = REQUEST_TIMEOUT,
+        connect_timeout: float = PROVIDER_HTTP_CONNECT_TIMEOUT
+    ):
+        self.max_connections = max_connections
+        self.max_per_host = max_per_host
+        self.dns_ttl = dns_ttl
+        self.keepalive = keepalive
+        self.timeout = aiohttp.ClientTimeout(total=timeout, connect=connect_timeout)
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.metrics: Dict[str, ProviderMetrics] = {}
+
+    async def start(self):
+        """إنشاء الجلسة (يجب استدعاؤها داخل حلقة الأحداث)"""
+        if self.session and not self.session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=self.max_connections,
+            limit_per_host=self.max_per_host,
+            ttl_dns_cache=self.dns_ttl,
+            use_dns_cache=True,
+            keepalive_timeout=self.keepalive
+        )
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=self.timeout,
+            headers={"Accept": "application/json"}
+        )
+        logger.info(
+            f"Provider HTTP pool ready (limit={self.max_connections}, per_host={self.max_per_host})"
+        )
+
+    async def close(self):
+        if self.session and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
+    def _metrics_for(self, provider: str) -> ProviderMetrics:
+        if provider not in self.metrics:
+            self.metrics[provider] = ProviderMetrics()
+        return self.metrics[provider]
+
+    async def request(
+        self,
+        provider: str,
+        method: str,
+        url: str,
+        headers: Optional[Dict[str, str]] = None,
+        timeout: Optional[float] = None,
+        **kwargs: Any
+    ) -> Any:
+        """تنفيذ طلب عبر الجلسة المشتركة مع تسجيل المقاييس"""
+        if not self.session or self.session.closed:
+            await self.start()
+
+        metrics = self._metrics_for(provider)
+        if timeout:
+            kwargs["timeout"] = aiohttp.ClientTimeout(total=timeout)
+        start = time.perf_counter()
+        try:
+            async with self.session.request(
+                method, url, headers=headers, **kwargs
+            ) as response:
+                if response.status >= 400:
+                    body = await response.text()
+                    raise ProviderRequestError(
+                        provider, f"HTTP {response.status}: {body[:200]}", status=response.status
+                    )
+                data = await response.json(content_type=None)
+            metrics.record(time.perf_counter() - start)
+            return data
+        except ProviderRequestError as e:
+            metrics.record(time.perf_counter() - start, str(e))
+            raise
+        except Exception as e:
+            error = f"{type(e).__name__}: {str(e)}"
+            metrics.record(time.perf_counter() - start, error)
+            raise ProviderRequestError(provider, error) from e
+
+    def get_stats(self) -> Dict[str, Any]:
+        """إحصائيات المجمع والمزودين"""
+        return {
+            "pool": {
+                "open": bool(self.session and not self.session.closed),
+                "limit": self.max_connections,
+                "limit_per_host": self.max_per_host,
+                "dns_cache_ttl": self.dns_ttl
+            },
+            "providers": {name: m.snapshot() for name, m in self.metrics.items()}
+        }
@@ -0,0 +1,169 @@
+"""
+Distributed Token-Bucket Rate Limiter
+محدد معدل الطلبات الموزع لمزودي البيانات
+
+Async token buckets per provider and endpoint. When Redis is available the
+buckets live in Redis and are updated atomically by a Lua script, so every
+gunicorn worker draws from the same vendor quota; otherwise each process keeps
+its own in-memory buckets.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# KEYS[1] bucket key; ARGV rate (tokens/s), burst, requested tokens.
+# Uses the Redis clock so workers on different hosts agree on refill time.
+TOKEN_BUCKET_LUA = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local retry_after = 0
+if tokens >= requested then
+    tokens = tokens - requested
+    allowed = 1
+else
+    retry_after = (requested - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return {allowed, tostring(retry_after)}
+"""
+
+
+class RateLimitExceeded(Exception):
+    """تجاوز حد الطلبات المسموح للمزود"""
+
+    def __init__(self, bucket: str, retry_after: float):
+        super().__init__(f"Rate limit exceeded for {bucket}, retry after {retry_after:.2f}s")
+        self.bucket = bucket
+        self.retry_after = retry_after
+
+
+class BucketMetrics:
+    """مقاييس الانتظار لدلو واحد"""
+
+    def __init__(self, window: int = 500):
+        self.acquired = 0
+        self.rejected = 0
+        self.waited = 0
+        self.total_wait = 0.0
+        self.wait_times: Deque[float] = deque(maxlen=window)
+
+    def record(self, wait: float):
+        self.acquired += 1
+        if wait > 0:
+            self.waited += 1
+            self.total_wait += wait
+            self.wait_times.append(wait)
+
+    def snapshot(self) -> Dict[str, Any]:
+        ordered = sorted(self.wait_times)
+        p95 = ordered[int(0.95 * (len(ordered) - 1))] if ordered else 0.0
+        return {
+            "acquired": self.acquired,
+            "rejected": self.rejected,
+            "waited": self.waited,
+            "avg_wait_ms": round(self.total_wait / self.waited * 1000, 2) if self.waited else 0.0,
+            "p95_wait_ms": round(p95 * 1000, 2),
+            "max_wait_ms": round(ordered[-1] * 1000, 2) if ordered else 0.0
+        }
+
+
+class TokenBucketLimiter:
+    """محدد معدل بدلاء الرموز، مشترك عبر Redis أو محلي عند غيابه"""
+
+    def __init__(self, redis_client: Optional[Any] = None, prefix: str = "ratelimit"):
+        self.redis_client = redis_client
+        self.prefix = prefix
+        self._script = None
+        # name -> (rate per second, burst)
+        self._limits: Dict[str, Tuple[float, float]] = {}
+        # bucket -> [tokens, last refill]
+        self._local: Dict[str, list] = {}
+        self.metrics: Dict[str, BucketMetrics] = {}
+
+    def configure(self, name: str, rate: float, burst: Optional[float] = None):
+        """تحديد المعدل لمزود (name) أو لنقطة نهاية محددة (provider:endpoint)"""
+        self._limits[name] = (float(rate), float(burst if burst is not None else max(1.0, rate)))
+
+    def _bucket_for(self, provider: str, endpoint: str) -> Optional[str]:
+        """نقطة النهاية لها دلو خاص إن ضُبطت، وإلا تشترك في حصة المزود كاملة"""
+        if f"{provider}:{endpoint}" in self._limits:
+            return f"{provider}:{endpoint}"
+        if provider in self._limits:
+            return provider
+        return None
+
+    def _take_local(self, bucket: str, rate: float, burst: float, tokens: float) -> Tuple[bool, float]:
+        now = time.monotonic()
+        state = self._local.setdefault(bucket, [burst, now])
+        state[0] = min(burst, state[0] + (now - state[1]) * rate)
+        state[1] = now
+        if state[0] >= tokens:
+            state[0] -= tokens
+            return True, 0.0
+        return False, (tokens - state[0]) / rate
+
+    async def _take(self, bucket: str, rate: float, burst: float, tokens: float) -> Tuple[bool, float]:
+        if self.redis_client:
+            try:
+                if self._script is None:
+                    self._script = self.redis_client.register_script(TOKEN_BUCKET_LUA)
+                allowed, retry_after = await self._script(
+                    keys=[f"{self.prefix}:{bucket}"], args=[rate, burst, tokens]
+                )
+                return bool(int(allowed)), float(retry_after)
+            except Exception as e:
+                logger.warning(f"Redis rate limiter unavailable, using local bucket: {str(e)}")
+        return self._take_local(bucket, rate, burst, tokens)
+
+    async def acquire(
+        self,
+        provider: str,
+        endpoint: str = "default",
+        tokens: float = 1,
+        wait: bool = True,
+        max_wait: Optional[float] = None
+    ) -> float:
+        """حجز رموز قبل الطلب؛ ينتظر في الطابور أو يفشل فوراً. يعيد زمن الانتظار"""
+        bucket = self._bucket_for(provider, endpoint)
+        if bucket is None:
+            return 0.0
+        rate, burst = self._limits[bucket]
+        if tokens > burst:
+            # The bucket never holds more than burst, so this could never be granted
+            raise ValueError(f"Cannot acquire {tokens} tokens from {bucket}: burst is {burst}")
+        metrics = self.metrics.setdefault(bucket, BucketMetrics())
+
+        start = time.monotonic()
+        waited = 0.0
+        while True:
+            allowed, retry_after = await self._take(bucket, rate, burst, tokens)
+            if allowed:
+                metrics.record(waited)
+                return waited
+            if not wait or (max_wait is not None and waited + retry_after > max_wait):
+                metrics.rejected += 1
+                raise RateLimitExceeded(bucket, retry_after)
+            await asyncio.sleep(retry_after)
+            waited = time.monotonic() - start
+
+    def get_stats(self) -> Dict[str, Any]:
+        """إحصائيات الانتظار لكل دلو"""
+        return {
+            "backend": "redis" if self.redis_client else "local",
+            "limits": {name: {"rate": rate, "burst": burst} for name, (rate, burst) in self._limits.items()},
+            "buckets": {bucket: m.snapshot() for bucket, m in self.metrics.items()}
+        }
@@ -0,0 +1,234 @@
+"""
+Analysis Refresh Scheduler
+جدولة تحديث التحليلات الشاملة للعلامات المتتبعة
+
+Keeps the brand/keyword pairs users actually ask about and refreshes their
+get_comprehensive_analysis results before the cache entry expires, so the
+first request after expiry doesn't pay for the full provider fan-out.
+Refreshes are jittered, capped in concurrency and ordered by recent access
+frequency; with Redis, due-ness is re-checked against the shared tier and a
+short lock keeps workers from refreshing the same pair twice. Failed or
+partial refreshes back off exponentially per pair.
+"""
+
+import asyncio
+import logging
+import math
+import random
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class TrackedAnalysis:
+    """زوج علامة/كلمات متتبع مع تكرار الوصول المتناقص زمنياً"""
+
+    __slots__ = ("brand", "keywords", "cache_key", "score", "last_access", "jitter", "failures", "retry_at")
+
+    def __init__(self, brand: str, keywords: List[str], cache_key: str, jitter: float):
+        self.brand = brand
+        self.keywords = keywords
+        self.cache_key = cache_key
+        self.score = 0.0
+        self.last_access = time.time()
+        self.jitter = jitter
+        self.failures = 0
+        self.retry_at = 0.0
+
+    def touch(self, half_life: float):
+        now = time.time()
+        self.score = self.decayed_score(half_life, now) + 1.0
+        self.last_access = now
+
+    def decayed_score(self, half_life: float, now: Optional[float] = None) -> float:
+        elapsed = (now or time.time()) - self.last_access
+        return self.score * math.pow(0.5, elapsed / half_life)
+
+
+class AnalysisRefreshScheduler:
+    """مجدول تحديث مسبق قبل انتهاء صلاحية الكاش"""
+
+    def __init__(
+        self,
+        providers_manager: Any,
+        interval: float = 30.0,
+        refresh_ahead: float = 0.8,
+        jitter: float = 0.1,
+        max_concurrency: int = 2,
+        max_tracked: int = 500,
+        idle_ttl: float = 86400.0,
+        access_half_life: float = 3600.0
+    ):
+        self.providers = providers_manager
+        self.interval = interval
+        # Refresh once an entry reaches this fraction of its TTL
+        self.refresh_ahead = refresh_ahead
+        self.jitter = jitter
+        self.max_concurrency = max_concurrency
+        self.max_tracked = max_tracked
+        self.idle_ttl = idle_ttl
+        self.access_half_life = access_half_life
+        self.tracked: Dict[str, TrackedAnalysis] = {}
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._running: Set[str] = set()
+        self._jobs: Set[asyncio.Task] = set()
+        self._loop_task: Optional[asyncio.Task] = None
+        self.stats = {
+            "ticks": 0,
+            "jobs_started": 0,
+            "jobs_succeeded": 0,
+            "jobs_failed": 0,
+            "skipped_locked": 0,
+            "skipped_fresh": 0,
+            "skipped_loading": 0,
+            "skipped_backoff": 0,
+            "untracked_idle": 0,
+            "lag_total": 0.0,
+            "lag_max": 0.0
+        }
+
+    def record_access(self, brand: str, keywords: List[str], cache_key: str):
+        """تسجيل طلب للعلامة ليتم تتبعها وتحديثها مسبقاً"""
+        entry = self.tracked.get(cache_key)
+        if entry is None:
+            if len(self.tracked) >= self.max_tracked:
+                self._drop_coldest()
+            ttl = self.providers.cache.ttl
+            entry = TrackedAnalysis(brand, list(keywords), cache_key, random.uniform(0, self.jitter * ttl))
+            self.tracked[cache_key] = entry
+        entry.touch(self.access_half_life)
+
+    def _drop_coldest(self):
+        now = time.time()
+        coldest = min(self.tracked.values(), key=lambda e: e.decayed_score(self.access_half_life, now))
+        self.tracked.pop(coldest.cache_key, None)
+
+    def _due_at(self, entry: TrackedAnalysis, stored_at: float) -> float:
+        return stored_at + self.providers.cache.ttl * self.refresh_ahead - entry.jitter
+
+    def _collect_due(self) -> List[Tuple[float, float, TrackedAnalysis]]:
+        """العناصر المستحقة مرتبة حسب تكرار الوصول"""
+        now = time.time()
+        due: List[Tuple[float, float, TrackedAnalysis]] = []
+        for key, entry in list(self.tracked.items()):
+            if now - entry.last_access > self.idle_ttl:
+                self.tracked.pop(key, None)
+                self.stats["untracked_idle"] += 1
+                continue
+            if key in self._running:
+                continue
+            if now < entry.retry_at:
+                self.stats["skipped_backoff"] += 1
+                continue
+            if self.providers.cache.is_loading(key):
+                # A request or stale-while-revalidate load is already fetching it
+                self.stats["skipped_loading"] += 1
+                continue
+            stored_at = self.providers.cache.stored_at(key)
+            # Entries that already fell out of the cache are refreshed right away
+            due_at = self._due_at(entry, stored_at) if stored_at is not None else now
+            if due_at <= now:
+                due.append((-entry.decayed_score(self.access_half_life, now), due_at, entry))
+        due.sort(key=lambda item: (item[0], item[1]))
+        return due
+
+    async def _acquire_lock(self, key: str) -> bool:
+        redis_client = self.providers.cache.redis_client
+        if not redis_client:
+            return True
+        try:
+            return bool(await redis_client.set(f"refresh_lock:{key}", "1", nx=True, ex=int(self.interval * 2)))
+        except Exception as e:
+            logger.warning(f"Refresh lock unavailable, refreshing locally: {str(e)}")
+            return True
+
+    def _backoff(self, entry: TrackedAnalysis):
+        # interval, 2x, 4x ... capped at one TTL
+        entry.failures += 1
+        delay = min(self.interval * 2 ** (entry.failures - 1), self.providers.cache.ttl)
+        entry.retry_at = time.time() + delay * random.uniform(1, 1 + self.jitter)
+
+    async def _refresh(self, entry: TrackedAnalysis, due_at: float):
+        async with self._semaphore:
+            cache = self.providers.cache
+            if cache.redis_client:
+                # Another worker may have refreshed it since the local copy was stored
+                stored_at = await cache.shared_stored_at(entry.cache_key)
+                if stored_at is not None and self._due_at(entry, stored_at) > time.time():
+                    self.stats["skipped_fresh"] += 1
+                    return
+            if cache.is_loading(entry.cache_key):
+                self.stats["skipped_loading"] += 1
+                return
+            if not await self._acquire_lock(entry.cache_key):
+                self.stats["skipped_locked"] += 1
+                return
+            lag = max(0.0, time.time() - due_at)
+            self.stats["lag_total"] += lag
+            self.stats["lag_max"] = max(self.stats["lag_max"], lag)
+            self.stats["jobs_started"] += 1
+            try:
+                analysis = await self.providers.refresh_analysis(entry.brand, entry.keywords)
+            except Exception as e:
+                self.stats["jobs_failed"] += 1
+                self._backoff(entry)
+                logger.warning(f"Background refresh failed for {entry.brand}: {str(e)}")
+                return
+            if isinstance(analysis, dict) and analysis.get("partial"):
+                # Not cached, so the entry would look due again on the next tick
+                self.stats["jobs_failed"] += 1
+                self._backoff(entry)
+                return
+            entry.failures = 0
+            entry.retry_at = 0.0
+            self.stats["jobs_succeeded"] += 1
+
+    def _start_job(self, entry: TrackedAnalysis, due_at: float):
+        self._running.add(entry.cache_key)
+        task = asyncio.create_task(self._refresh(entry, due_at))
+        self._jobs.add(task)
+
+        def done(t: asyncio.Task):
+            self._jobs.discard(t)
+            self._running.discard(entry.cache_key)
+
+        task.add_done_callback(done)
+
+    async def tick(self):
+        """دورة واحدة: جدولة كل العناصر المستحقة (التنفيذ محدود بالتزامن)"""
+        self.stats["ticks"] += 1
+        for _, due_at, entry in self._collect_due():
+            self._start_job(entry, due_at)
+
+    async def _run(self):
+        while True:
+            try:
+                await self.tick()
+            except Exception as e:
+                logger.error(f"Refresh scheduler tick failed: {str(e)}")
+            # Jittered sleep so workers don't tick in lockstep
+            await asyncio.sleep(self.interval * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    def start(self):
+        if self._loop_task is None or self._loop_task.done():
+            self._loop_task = asyncio.create_task(self._run())
+            logger.info(f"Analysis refresh scheduler started (interval={self.interval}s)")
+
+    async def stop(self):
+        tasks = [t for t in [self._loop_task, *self._jobs] if t]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._loop_task = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """إحصائيات التحديث: عدد المهام وتأخر التحديث"""
+        started = self.stats["jobs_started"]
+        return {
+            **{k: v for k, v in self.stats.items() if not k.startswith("lag_")},
+            "tracked": len(self.tracked),
+            "in_flight": len(self._running),
+            "refresh_lag_avg_s": round(self.stats["lag_total"] / started, 3) if started else 0.0,
+            "refresh_lag_max_s": round(self.stats["lag_max"], 3)
+        }
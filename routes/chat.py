@@ -5,6 +5,7 @@ Chat Routes for Morvo AI
 
 import logging
 from datetime import datetime
+from typing import Optional
 from fastapi import APIRouter, HTTPException
 from models import ChatMessage, ChatResponse
 from agents import MorvoAgents
@@ -12,15 +13,24 @@ from agents import MorvoAgents
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/v2/chat", tags=["chat"])
 
-# Initialize agents
-morvo_agents = MorvoAgents()
+# Built on first request rather than at import (keeps worker boot fast)
+_morvo_agents: Optional[MorvoAgents] = None
+
+
+def get_morvo_agents() -> MorvoAgents:
+    global _morvo_agents
+    if _morvo_agents is None:
+        # Wraps the companion shared with the WebSocket handler
+        from websocket_manager import get_companion
+        _morvo_agents = MorvoAgents(get_companion())
+    return _morvo_agents
 
 @router.post("/message", response_model=ChatResponse)
 async def process_chat_message(message: ChatMessage):
     """معالجة رسالة المحادثة"""
     try:
         # معالجة الرسالة عبر الوكلاء
-        result = await morvo_agents.process_message(
+        result = await get_morvo_agents().process_message(
             content=message.content,
             user_id=message.user_id,
             session_id=message.session_id or f"session_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
@@ -42,7 +52,7 @@ async def process_chat_message(message: ChatMessage):
 async def get_agents_status():
     """الحصول على حالة الوكلاء"""
     try:
-        agents_status = morvo_agents.get_agents_status()
+        agents_status = get_morvo_agents().get_agents_status()
         return {
             "status": "active",
             "agents": agents_status,
@@ -17,6 +17,7 @@ from agents import UnifiedMorvoCompanion
 from auth.jwt_bearer import get_current_user_ws
 from config import get_settings
 from protocols.manager import EnhancedProtocolManager
+from turn_persistence import schedule_turn_persistence
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
@@ -54,7 +55,6 @@ class ConnectionManager:
 # Singleton connection manager
 manager = ConnectionManager()
 
-
 class WSChatMessage(BaseModel):
     """WebSocket chat message model"""
     message: str
@@ -65,16 +65,15 @@ class WSChatMessage(BaseModel):
 async def handle_websocket(
     websocket: WebSocket, 
     user_id: str = Depends(get_current_user_ws),
-    protocol_manager: EnhancedProtocolManager = None
+    protocol_manager: EnhancedProtocolManager = None,
+    companion: UnifiedMorvoCompanion = None
 ):
-    """Handle WebSocket connections for unified مورفو companion chat"""
-    await manager.connect(websocket, user_id)
+    """Handle WebSocket connections for unified مورفو companion chat
     
-    # Initialize the unified companion
-    companion = UnifiedMorvoCompanion(
-        supabase_client=protocol_manager.supabase_client if protocol_manager else None,
-        load_system_prompt=True
-    )
+    The companion is the per-process instance created in the app lifespan;
+    connections share it instead of building their own client and prompt.
+    """
+    await manager.connect(websocket, user_id)
     
     try:
         while True:
@@ -89,14 +88,8 @@ async def handle_websocket(
                     conversation_id = str(uuid.uuid4())
                     manager.set_conversation(user_id, conversation_id)
                 
-                # Store user message in database if Supabase is available
-                if protocol_manager and protocol_manager.supabase_client:
-                    await protocol_manager.supabase_client.table("messages").insert({
-                        "conversation_id": conversation_id,
-                        "role": "user",
-                        "content": chat_request.message,
-                        "created_at": datetime.utcnow().isoformat()
-                    }).execute()
+                # Persisted together with the reply once it has been sent
+                user_created_at = datetime.utcnow().isoformat()
                 
                 # Acknowledge receipt
                 await manager.send_message(
@@ -118,20 +111,6 @@ async def handle_websocket(
                     context=chat_request.context
                 )
                 
-                # Store assistant message in database if Supabase is available
-                if protocol_manager and protocol_manager.supabase_client:
-                    await protocol_manager.supabase_client.table("messages").insert({
-                        "conversation_id": conversation_id,
-                        "role": "assistant",
-                        "content": response,
-                        "created_at": datetime.utcnow().isoformat()
-                    }).execute()
-                    
-                    # Update conversation last_message_at
-                    await protocol_manager.supabase_client.table("conversations").update({
-                        "last_message_at": datetime.utcnow().isoformat()
-                    }).eq("id", conversation_id).execute()
-                
                 # Stop typing indicator
                 await manager.send_message(
                     user_id, 
@@ -139,16 +118,29 @@ async def handle_websocket(
                 )
                 
                 # Send response
+                assistant_created_at = datetime.utcnow().isoformat()
                 await manager.send_message(
                     user_id,
                     {
                         "type": "message",
                         "message": response,
                         "conversation_id": conversation_id,
-                        "timestamp": datetime.utcnow().isoformat()
+                        "timestamp": assistant_created_at
                     }
                 )
                 
+                # Record the whole turn in one transaction after the reply is out
+                if protocol_manager and protocol_manager.supabase:
+                    schedule_turn_persistence(
+                        protocol_manager.supabase,
+                        conversation_id=conversation_id,
+                        user_id=user_id,
+                        user_message=chat_request.message,
+                        assistant_message=response.get("response", "") if isinstance(response, dict) else str(response),
+                        user_created_at=user_created_at,
+                        assistant_created_at=assistant_created_at
+                    )
+                
             except json.JSONDecodeError:
                 await manager.send_message(
                     user_id, 
@@ -175,6 +167,7 @@ def configure_websocket_route(app):
     async def websocket_endpoint(
         websocket: WebSocket, 
         user_id: str,
-        protocol_manager: EnhancedProtocolManager = Depends(lambda: app.state.protocol_manager)
+        protocol_manager: EnhancedProtocolManager = Depends(lambda: app.state.protocol_manager),
+        companion: UnifiedMorvoCompanion = Depends(lambda: app.state.companion)
     ):
-        await handle_websocket(websocket, user_id, protocol_manager)
\ No newline at end of file
+        await handle_websocket(websocket, user_id, protocol_manager, companion)
\ No newline at end of file
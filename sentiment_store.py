@@ -0,0 +1,365 @@
+"""
+Rolling Sentiment Store
+مخزن المشاعر وحجم الإشارات المتجدد لكل علامة تجارية
+
+Keeps per-brand mention counts by sentiment in fixed-size ring buffers at
+minute, hour and day resolution, fed from the mention stream. Recording and
+range/breakdown queries are plain array index arithmetic, so they stay in
+the microsecond range and memory is fixed per brand.
+
+Each worker records only the mentions it ingested, so every worker
+snapshots its buffers to its own file ({path stem}.{pid}.json) and reads
+the other workers' files on the same interval; queries sum the local
+buffers with those peers. On startup a worker adopts (merges and deletes)
+the files of workers that are no longer running, under a file lock.
+"""
+
+import asyncio
+import fcntl
+import glob
+import json
+import logging
+import os
+import time
+from array import array
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SENTIMENTS = ("positive", "neutral", "negative")
+
+# name -> (seconds per bucket, number of buckets)
+RESOLUTIONS = {
+    "minute": (60, 1440),   # last 24 hours
+    "hour": (3600, 720),    # last 30 days
+    "day": (86400, 365)     # last year
+}
+
+
+def normalize_sentiment(value: Any) -> str:
+    value = str(value or "").lower()
+    return value if value in SENTIMENTS else "neutral"
+
+
+class RingSeries:
+    """سلسلة زمنية بحجم ثابت: عداد لكل شعور في كل خانة"""
+
+    __slots__ = ("step", "size", "epochs", "counts")
+
+    def __init__(self, step: int, size: int):
+        self.step = step
+        self.size = size
+        # Absolute bucket number held by each slot; -1 means empty
+        self.epochs = array("q", [-1]) * size
+        self.counts = {s: array("I", [0]) * size for s in SENTIMENTS}
+
+    def add(self, sentiment: str, ts: float, n: int = 1):
+        # A future timestamp (clock skew) would claim a slot and wipe live data
+        bucket = int(min(ts, time.time()) // self.step)
+        slot = bucket % self.size
+        current = self.epochs[slot]
+        if current != bucket:
+            if current > bucket:
+                # Late mention older than this ring's window
+                return
+            # Slot still holds an older bucket from a previous lap
+            self.epochs[slot] = bucket
+            for counts in self.counts.values():
+                counts[slot] = 0
+        self.counts[sentiment][slot] += n
+
+    def points(self, start: float, end: float) -> List[Dict[str, Any]]:
+        """خانة لكل فترة بين start و end (الخانات المنتهية تظهر أصفاراً)"""
+        first = max(int(start // self.step), int(end // self.step) - self.size + 1)
+        last = int(end // self.step)
+        series = []
+        for bucket in range(first, last + 1):
+            slot = bucket % self.size
+            live = self.epochs[slot] == bucket
+            point = {"ts": bucket * self.step}
+            for sentiment, counts in self.counts.items():
+                point[sentiment] = counts[slot] if live else 0
+            series.append(point)
+        return series
+
+    def totals(self, start: float, end: float) -> Dict[str, int]:
+        totals = dict.fromkeys(SENTIMENTS, 0)
+        first = max(int(start // self.step), int(end // self.step) - self.size + 1)
+        epochs = self.epochs
+        for bucket in range(first, int(end // self.step) + 1):
+            slot = bucket % self.size
+            if epochs[slot] == bucket:
+                for sentiment, counts in self.counts.items():
+                    totals[sentiment] += counts[slot]
+        return totals
+
+    def merge(self, other: "RingSeries"):
+        """دمج سلسلة أخرى بنفس الدقة (الخانة الأحدث تفوز، المتساوية تُجمع)"""
+        for slot in range(self.size):
+            theirs = other.epochs[slot]
+            ours = self.epochs[slot]
+            if theirs < 0 or theirs < ours:
+                continue
+            if theirs > ours:
+                self.epochs[slot] = theirs
+                for sentiment, counts in self.counts.items():
+                    counts[slot] = other.counts[sentiment][slot]
+            else:
+                for sentiment, counts in self.counts.items():
+                    counts[slot] += other.counts[sentiment][slot]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "step": self.step,
+            "size": self.size,
+            "epochs": self.epochs.tolist(),
+            "counts": {s: c.tolist() for s, c in self.counts.items()}
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "RingSeries":
+        series = cls(data["step"], data["size"])
+        series.epochs = array("q", data["epochs"])
+        series.counts = {s: array("I", data["counts"][s]) for s in SENTIMENTS}
+        return series
+
+
+class BrandSentimentStore:
+    """مخزن السلاسل الزمنية لكل علامة تجارية"""
+
+    def __init__(self, snapshot_path: Optional[str] = None, snapshot_interval: float = 300.0, max_brands: int = 5000):
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self.max_brands = max_brands
+        self.brands: Dict[str, Dict[str, RingSeries]] = {}
+        # Other workers' buffers from their snapshot files, by file path
+        self._peers: Dict[str, Dict[str, Dict[str, RingSeries]]] = {}
+        self._snapshot_task: Optional[asyncio.Task] = None
+        self._loaded = False
+        self.stats = {"recorded": 0, "unattributed": 0, "dropped_brands": 0, "snapshots": 0, "adopted_snapshots": 0}
+
+    @staticmethod
+    def brand_key(brand: str) -> str:
+        return brand.strip().lower()
+
+    def _series_for(self, brand: str) -> Optional[Dict[str, RingSeries]]:
+        key = self.brand_key(brand)
+        series = self.brands.get(key)
+        if series is None:
+            if len(self.brands) >= self.max_brands:
+                self.stats["dropped_brands"] += 1
+                return None
+            series = {name: RingSeries(step, size) for name, (step, size) in RESOLUTIONS.items()}
+            self.brands[key] = series
+        return series
+
+    def record(self, brand: str, sentiment: Any, ts: Optional[float] = None):
+        series = self._series_for(brand)
+        if series is None:
+            return
+        sentiment = normalize_sentiment(sentiment)
+        ts = ts if ts is not None else time.time()
+        for ring in series.values():
+            ring.add(sentiment, ts)
+        self.stats["recorded"] += 1
+
+    def record_mention(self, mention: Dict[str, Any]):
+        """تسجيل إشارة من تدفق الإشارات (الاستطلاع أو webhooks)"""
+        brand = mention.get("brand") or mention.get("topic") or mention.get("keyword")
+        if not brand:
+            self.stats["unattributed"] += 1
+            return
+        ts = None
+        timestamp = mention.get("timestamp")
+        if timestamp:
+            try:
+                ts = datetime.fromisoformat(str(timestamp).replace("Z", "+00:00")).timestamp()
+            except ValueError:
+                ts = None
+        self.record(brand, mention.get("sentiment"), ts)
+
+    def _rings(self, brand: str, resolution: str) -> List[RingSeries]:
+        """سلسلة هذا العامل وسلاسل العمال الآخرين لنفس العلامة"""
+        key = self.brand_key(brand)
+        candidates = [self.brands.get(key), *(peer.get(key) for peer in self._peers.values())]
+        return [series[resolution] for series in candidates if series is not None]
+
+    def has_brand(self, brand: str) -> bool:
+        key = self.brand_key(brand)
+        return key in self.brands or any(key in peer for peer in self._peers.values())
+
+    def range(self, brand: str, resolution: str = "hour", points: int = 24, end: Optional[float] = None) -> List[Dict[str, Any]]:
+        """آخر عدد من النقاط بدقة معينة"""
+        rings = self._rings(brand, resolution)
+        if not rings:
+            return []
+        end = end if end is not None else time.time()
+        start = end - (points - 1) * rings[0].step
+        series = rings[0].points(start, end)
+        for ring in rings[1:]:
+            for point, extra in zip(series, ring.points(start, end)):
+                for sentiment in SENTIMENTS:
+                    point[sentiment] += extra[sentiment]
+        return series
+
+    def breakdown(self, brand: str, seconds: float, end: Optional[float] = None) -> Dict[str, Any]:
+        """توزيع المشاعر خلال آخر فترة (تُختار أدق دقة تغطيها)"""
+        end = end if end is not None else time.time()
+        for name in ("minute", "hour", "day"):
+            step, size = RESOLUTIONS[name]
+            if seconds <= step * size:
+                break
+        totals = dict.fromkeys(SENTIMENTS, 0)
+        for ring in self._rings(brand, name):
+            for sentiment, count in ring.totals(end - seconds + 1, end).items():
+                totals[sentiment] += count
+        return {"total": sum(totals.values()), **totals}
+
+    # ---- snapshots ----
+
+    def _payload(self) -> Dict[str, Any]:
+        return {
+            "saved_at": time.time(),
+            "brands": {
+                brand: {name: ring.to_dict() for name, ring in series.items()}
+                for brand, series in self.brands.items()
+            }
+        }
+
+    def _own_path(self) -> str:
+        stem, ext = os.path.splitext(self.snapshot_path)
+        return f"{stem}.{os.getpid()}{ext}"
+
+    def _snapshot_files(self) -> List[Tuple[Optional[int], str]]:
+        """(pid, path) لكل ملفات اللقطات؛ pid=None للملف القديم المشترك"""
+        stem, ext = os.path.splitext(self.snapshot_path)
+        files: List[Tuple[Optional[int], str]] = []
+        for path in glob.glob(f"{glob.escape(stem)}.*{ext}"):
+            pid = path[len(stem) + 1:len(path) - len(ext)]
+            if pid.isdigit():
+                files.append((int(pid), path))
+        if os.path.exists(self.snapshot_path):
+            files.append((None, self.snapshot_path))
+        return files
+
+    @staticmethod
+    def _alive(pid: Optional[int]) -> bool:
+        if pid is None:
+            return False
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    @staticmethod
+    def _read(path: str) -> Dict[str, Dict[str, RingSeries]]:
+        with open(path, encoding="utf-8") as f:
+            payload = json.load(f)
+        return {
+            brand: {name: RingSeries.from_dict(ring) for name, ring in series.items()}
+            for brand, series in payload.get("brands", {}).items()
+        }
+
+    def _write(self, payload: Dict[str, Any]):
+        """كتابة ذرية لملف لقطة هذا العامل"""
+        directory = os.path.dirname(self.snapshot_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        path = self._own_path()
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f)
+        os.replace(tmp_path, path)
+        self.stats["snapshots"] += 1
+
+    def _load_peers(self):
+        own = self._own_path()
+        peers = {}
+        for _, path in self._snapshot_files():
+            if path == own:
+                continue
+            try:
+                peers[path] = self._read(path)
+            except Exception as e:
+                # Deleted by an adopting worker between listing and reading
+                logger.debug(f"Sentiment snapshot {path} skipped: {str(e)}")
+        self._peers = peers
+
+    def _sync(self, payload: Dict[str, Any]):
+        self._write(payload)
+        self._load_peers()
+
+    def snapshot(self):
+        if self.snapshot_path:
+            self._write(self._payload())
+
+    def load(self):
+        """تبني لقطات العمال المتوقفين ثم قراءة لقطات العمال الأحياء"""
+        if not self.snapshot_path:
+            return
+        try:
+            directory = os.path.dirname(self.snapshot_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(f"{self.snapshot_path}.lock", "w") as lock:
+                # Two workers starting together must not adopt the same file
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                adopted = []
+                own_path = self._own_path()
+                for pid, path in self._snapshot_files():
+                    if path == own_path:
+                        # A restarted container reuses its pid (uvicorn runs as
+                        # PID 1): on first load this file is our previous boot's
+                        if self._loaded:
+                            continue
+                    elif self._alive(pid):
+                        continue
+                    for brand, series in self._read(path).items():
+                        own = self._series_for(brand)
+                        if own is not None:
+                            for name, ring in series.items():
+                                own[name].merge(ring)
+                    adopted.append(path)
+                if adopted:
+                    # Written before deleting, so a crash here can't lose counts
+                    self._write(self._payload())
+                    for path in adopted:
+                        if path != own_path:
+                            os.remove(path)
+                    self.stats["adopted_snapshots"] += len(adopted)
+                    logger.info(f"Adopted {len(adopted)} sentiment snapshots ({len(self.brands)} brands)")
+            self._loaded = True
+            self._load_peers()
+        except Exception as e:
+            logger.warning(f"Sentiment snapshot could not be loaded: {str(e)}")
+
+    async def _snapshot_loop(self):
+        while True:
+            await asyncio.sleep(self.snapshot_interval)
+            try:
+                # Copy the buffers on the loop, write and read files off it
+                await asyncio.to_thread(self._sync, self._payload())
+            except Exception as e:
+                logger.warning(f"Sentiment snapshot failed: {str(e)}")
+
+    def start(self):
+        self.load()
+        if self.snapshot_path and (self._snapshot_task is None or self._snapshot_task.done()):
+            self._snapshot_task = asyncio.create_task(self._snapshot_loop())
+
+    async def stop(self):
+        if self._snapshot_task:
+            self._snapshot_task.cancel()
+            await asyncio.gather(self._snapshot_task, return_exceptions=True)
+            self._snapshot_task = None
+        try:
+            self.snapshot()
+        except Exception as e:
+            logger.warning(f"Final sentiment snapshot failed: {str(e)}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "brands": len(self.brands), "peer_snapshots": len(self._peers)}
@@ -0,0 +1,53 @@
+"""
+KeywordBatcher cancellation
+إلغاء أحد المنتظرين لا يلغي البقية
+"""
+
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from keyword_batcher import KeywordBatcher
+
+
+def make_batcher(calls):
+    async def fetch(keywords, location):
+        calls.append(list(keywords))
+        await asyncio.sleep(0.05)
+        return {k: {"keyword": k} for k in keywords}
+
+    return KeywordBatcher(fetch, window=0.01)
+
+
+def test_cancelled_caller_does_not_cancel_shared_keyword():
+    async def scenario():
+        calls = []
+        batcher = make_batcher(calls)
+        short = asyncio.create_task(batcher.lookup(["تسويق"]))
+        long = asyncio.create_task(batcher.lookup(["تسويق", "سيو"]))
+        await asyncio.sleep(0.03)  # batch sent, both waiting on "تسويق"
+        short.cancel()
+        result = await long
+        assert short.cancelled()
+        assert set(result) == {"تسويق", "سيو"}
+        assert calls == [["تسويق", "سيو"]]
+
+    asyncio.run(scenario())
+
+
+def test_keyword_dropped_when_last_waiter_cancelled_before_send():
+    async def scenario():
+        calls = []
+        batcher = make_batcher(calls)
+        only = asyncio.create_task(batcher.lookup(["إعلانات"]))
+        await asyncio.sleep(0)  # queued, window still open
+        only.cancel()
+        await asyncio.sleep(0.05)
+        assert only.cancelled()
+        assert calls == []
+        assert batcher.get_stats()["abandoned"] == 1
+        assert batcher.get_stats()["pending"] == 0
+
+    asyncio.run(scenario())
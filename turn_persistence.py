@@ -0,0 +1,65 @@
+"""
+Companion Turn Persistence
+حفظ جولات المحادثة مع رفيق مورفو
+
+Records a full chat turn (user message, assistant reply, conversation
+timestamp) with the record_conversation_turn RPC (migrations/03) in one round
+trip. WebSocket handlers schedule it after the reply has been sent, so the
+database write is off the reply's critical path.
+"""
+
+import asyncio
+import logging
+from typing import Any, Set
+
+logger = logging.getLogger(__name__)
+
+# Turn writes running in the background, kept referenced until they finish
+_pending_turn_writes: Set[asyncio.Task] = set()
+
+
+async def persist_turn(
+    supabase_client: Any,
+    conversation_id: str,
+    user_id: str,
+    user_message: str,
+    assistant_message: str,
+    user_created_at: str,
+    assistant_created_at: str
+) -> bool:
+    """Record a full chat turn with a single round trip to the database
+
+    Both messages and the conversation's last_message_at are written by the
+    record_conversation_turn function (migrations/03) inside one transaction.
+    """
+    query = supabase_client.rpc("record_conversation_turn", {
+        "p_conversation_id": conversation_id,
+        "p_user_id": user_id,
+        "p_user_content": user_message,
+        "p_assistant_content": assistant_message,
+        "p_user_created_at": user_created_at,
+        "p_assistant_created_at": assistant_created_at
+    })
+    try:
+        if asyncio.iscoroutinefunction(query.execute):
+            await query.execute()
+        else:
+            # The sync Supabase client blocks, keep it off the event loop
+            await asyncio.to_thread(query.execute)
+        return True
+    except Exception as e:
+        logger.error(f"Failed to persist turn for conversation {conversation_id}: {str(e)}")
+        return False
+
+
+def schedule_turn_persistence(supabase_client: Any, **turn: Any) -> asyncio.Task:
+    """Persist a turn after the reply has been sent, off the critical path"""
+    task = asyncio.create_task(persist_turn(supabase_client, **turn))
+    _pending_turn_writes.add(task)
+    task.add_done_callback(_pending_turn_writes.discard)
+    return task
+
+
+def pending_turn_writes() -> int:
+    """عدد عمليات الحفظ الجارية في الخلفية"""
+    return len(_pending_turn_writes)
@@ -0,0 +1,559 @@
+"""
+Webhook Ingestion Pipeline
+خط استقبال webhooks للإشارات (Awario, Mention)
+
+Webhook handlers only validate and enqueue, then answer 202. A background
+consumer drains the queue in batches, persists the mentions, drops the ones
+already seen and fans the new ones out to WebSocket clients. The queue is a
+Redis Stream with a consumer group (acknowledged after processing, so a
+crashed worker's batch is re-read on restart) or an in-memory stand-in when
+Redis is not available. Mentions are marked seen only after the batch was
+broadcast and acknowledged, so a failed batch is retried rather than
+dropped as a duplicate. Retried entries are processed one at a time, and
+an entry that still fails after WEBHOOK_MAX_ATTEMPTS deliveries is moved to
+a dead-letter stream so it cannot block ingestion. A full queue rejects new
+webhooks (503) instead of trimming entries that were never processed.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from pydantic import ValidationError
+
+from models import AwarioWebhookData
+
+logger = logging.getLogger(__name__)
+
+STREAM_KEY = "webhooks:mentions"
+DEAD_LETTER_KEY = "webhooks:mentions:dead"
+CONSUMER_GROUP = "mention_consumers"
+
+# (message id, event)
+QueuedEvent = Tuple[str, Dict[str, Any]]
+
+
+class WebhookQueueFull(Exception):
+    """الطابور ممتلئ؛ يجب على المزود إعادة المحاولة لاحقاً"""
+
+
+def awario_event_data(payload: AwarioWebhookData) -> Dict[str, Any]:
+    """تحويل إشارة Awario إلى بيانات الحدث المخزنة والمبثوثة"""
+    return {
+        "mention_id": payload.mention_id,
+        "content": payload.content,
+        "source": payload.source,
+        "sentiment": payload.sentiment,
+        "author": payload.author,
+        "url": payload.url,
+        "timestamp": payload.timestamp.isoformat(),
+        "brand": payload.brand
+    }
+
+
+def parse_mention(provider: str, obj: Any) -> Tuple[str, Dict[str, Any]]:
+    """التحقق من إشارة واحدة؛ يعيد (المعرف، البيانات) أو يرفع ValueError"""
+    if not isinstance(obj, dict):
+        raise ValueError("mention must be a JSON object")
+    if provider == "awario":
+        try:
+            payload = AwarioWebhookData.model_validate(obj)
+        except ValidationError as e:
+            raise ValueError("; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()))
+        return payload.mention_id, awario_event_data(payload)
+    if provider == "mention":
+        if obj.get("id") is None:
+            raise ValueError("id: field required")
+        return str(obj["id"]), obj
+    raise ValueError(f"unknown provider: {provider}")
+
+
+async def iter_ndjson_lines(chunks: AsyncIterator[bytes], max_line_bytes: int = 1_000_000) -> AsyncIterator[Tuple[int, bytes]]:
+    """تقسيم تدفق البايتات إلى أسطر دون تحميل الجسم كاملاً"""
+    buffer = b""
+    line_no = 0
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_no += 1
+            yield line_no, line
+        if len(buffer) > max_line_bytes:
+            raise ValueError(f"line {line_no + 1} exceeds {max_line_bytes} bytes")
+    if buffer:
+        yield line_no + 1, buffer
+
+
+class InMemoryEventQueue:
+    """بديل محلي غير دائم عن Redis Streams"""
+
+    backend = "memory"
+
+    def __init__(self, max_size: int = 10000, max_attempts: int = 5, dead_letter_max_len: int = 1000):
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_size)
+        # Failed batches, read again before anything new
+        self._retry: deque = deque()
+        # message id -> deliveries so far, for entries that failed at least once
+        self._attempts: Dict[str, int] = {}
+        self.max_attempts = max_attempts
+        self.dead: deque = deque(maxlen=dead_letter_max_len)
+        # Whether the last batch came from the retry queue
+        self.retrying = False
+        self._next_id = 0
+
+    async def setup(self):
+        pass
+
+    async def enqueue(self, event: Dict[str, Any]) -> str:
+        self._next_id += 1
+        message_id = str(self._next_id)
+        try:
+            self._queue.put_nowait((message_id, event))
+        except asyncio.QueueFull:
+            raise WebhookQueueFull("in-memory webhook queue is full")
+        return message_id
+
+    async def enqueue_many(self, events: List[Dict[str, Any]]):
+        # All-or-nothing so a bulk sender knows exactly what to resend
+        if self._queue.maxsize and self._queue.qsize() + len(events) > self._queue.maxsize:
+            raise WebhookQueueFull("in-memory webhook queue is full")
+        for event in events:
+            self._next_id += 1
+            self._queue.put_nowait((str(self._next_id), event))
+
+    async def read_batch(self, count: int, block_ms: int) -> List[QueuedEvent]:
+        batch: List[QueuedEvent] = []
+        while self._retry and len(batch) < count:
+            message_id, event = self._retry.popleft()
+            if self._attempts.get(message_id, 1) > self.max_attempts:
+                self._dead_letter(message_id, event)
+                continue
+            batch.append((message_id, event))
+        self.retrying = bool(batch)
+        if batch:
+            return batch
+        try:
+            first = await asyncio.wait_for(self._queue.get(), timeout=block_ms / 1000)
+        except asyncio.TimeoutError:
+            return []
+        batch.append(first)
+        while len(batch) < count and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def ack(self, message_ids: List[str]):
+        for message_id in message_ids:
+            self._attempts.pop(message_id, None)
+
+    async def requeue(self, batch: List[QueuedEvent]):
+        """إعادة دفعة فشلت معالجتها لتُقرأ أولاً"""
+        for message_id, _ in batch:
+            self._attempts[message_id] = self._attempts.get(message_id, 1) + 1
+        self._retry.extendleft(reversed(batch))
+
+    def _dead_letter(self, message_id: str, event: Dict[str, Any]):
+        # _attempts holds the number of the next delivery
+        attempts = self._attempts.pop(message_id, self.max_attempts + 1) - 1
+        self.dead.append({"id": message_id, "event": event, "attempts": attempts, "failed_at": time.time()})
+        logger.error(f"Webhook entry {message_id} dead-lettered after {attempts} attempts")
+
+    def dead_letter_count(self) -> int:
+        return len(self.dead)
+
+    def depth(self) -> int:
+        return self._queue.qsize() + len(self._retry)
+
+
+class RedisStreamQueue:
+    """طابور دائم عبر Redis Streams مع مجموعة مستهلكين"""
+
+    backend = "redis_stream"
+
+    def __init__(
+        self,
+        redis_client: Any,
+        stream: str = STREAM_KEY,
+        group: str = CONSUMER_GROUP,
+        max_len: int = 100000,
+        max_attempts: int = 5,
+        dead_letter_stream: str = DEAD_LETTER_KEY,
+        dead_letter_max_len: int = 10000
+    ):
+        self.redis_client = redis_client
+        self.stream = stream
+        self.group = group
+        self.max_len = max_len
+        self.max_attempts = max_attempts
+        self.dead_letter_stream = dead_letter_stream
+        self.dead_letter_max_len = dead_letter_max_len
+        self.retrying = False
+        self.dead_lettered = 0
+        self.consumer = f"{socket.gethostname()}-{os.getpid()}"
+        # Re-read this consumer's unacknowledged entries once after a restart
+        self._pending_checked = False
+        self._depth: Optional[int] = None
+
+    async def setup(self):
+        try:
+            await self.redis_client.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def _check_capacity(self, incoming: int):
+        # Acked entries are deleted, so XLEN is the unread + pending backlog.
+        # No MAXLEN trimming: it would silently drop entries never processed.
+        if self.max_len and await self.redis_client.xlen(self.stream) + incoming > self.max_len:
+            raise WebhookQueueFull("webhook stream is full")
+
+    async def enqueue(self, event: Dict[str, Any]) -> str:
+        await self._check_capacity(1)
+        message_id = await self.redis_client.xadd(self.stream, {"event": json.dumps(event, ensure_ascii=False)})
+        return message_id.decode() if isinstance(message_id, bytes) else message_id
+
+    async def enqueue_many(self, events: List[Dict[str, Any]]):
+        await self._check_capacity(len(events))
+        pipe = self.redis_client.pipeline(transaction=False)
+        for event in events:
+            pipe.xadd(self.stream, {"event": json.dumps(event, ensure_ascii=False)})
+        await pipe.execute()
+
+    async def read_batch(self, count: int, block_ms: int) -> List[QueuedEvent]:
+        start_id = ">" if self._pending_checked else "0"
+        response = await self.redis_client.xreadgroup(
+            self.group, self.consumer, {self.stream: start_id}, count=count,
+            block=None if start_id == "0" else block_ms
+        )
+        entries = response[0][1] if response else []
+        if start_id == "0" and len(entries) < count:
+            self._pending_checked = True
+        self.retrying = start_id == "0" and bool(entries)
+
+        batch: List[QueuedEvent] = []
+        gone: List[str] = []
+        for message_id, fields in entries:
+            if isinstance(message_id, bytes):
+                message_id = message_id.decode()
+            # A pending entry deleted from the stream comes back with nil fields
+            raw = (fields or {}).get(b"event", (fields or {}).get("event"))
+            if raw is None:
+                gone.append(message_id)
+                continue
+            batch.append((message_id, json.loads(raw)))
+        if gone:
+            logger.warning(f"Dropping {len(gone)} pending webhook entries missing from the stream")
+            await self.ack(gone)
+        if self.retrying and batch:
+            batch = await self._drop_exhausted(batch)
+        return batch
+
+    async def _drop_exhausted(self, batch: List[QueuedEvent]) -> List[QueuedEvent]:
+        """نقل الرسائل التي تجاوزت عدد المحاولات إلى مجرى الرسائل الميتة"""
+        # Re-reading a pending entry with XREADGROUP bumps its delivery count
+        pending = await self.redis_client.xpending_range(
+            self.stream, self.group, min=batch[0][0], max=batch[-1][0],
+            count=len(batch), consumername=self.consumer
+        )
+        deliveries = {}
+        for info in pending:
+            message_id = info["message_id"]
+            deliveries[message_id.decode() if isinstance(message_id, bytes) else message_id] = info["times_delivered"]
+
+        keep: List[QueuedEvent] = []
+        dead: List[Tuple[str, Dict[str, Any], int]] = []
+        for message_id, event in batch:
+            attempts = deliveries.get(message_id, 1)
+            if attempts > self.max_attempts:
+                dead.append((message_id, event, attempts))
+            else:
+                keep.append((message_id, event))
+        if dead:
+            pipe = self.redis_client.pipeline(transaction=False)
+            for message_id, event, attempts in dead:
+                pipe.xadd(
+                    self.dead_letter_stream,
+                    {
+                        "id": message_id,
+                        "event": json.dumps(event, ensure_ascii=False),
+                        "attempts": attempts,
+                        "failed_at": time.time()
+                    },
+                    maxlen=self.dead_letter_max_len,
+                    approximate=True
+                )
+            await pipe.execute()
+            await self.ack([message_id for message_id, _, _ in dead])
+            self.dead_lettered += len(dead)
+            for message_id, _, attempts in dead:
+                logger.error(f"Webhook entry {message_id} dead-lettered after {attempts} deliveries")
+        return keep
+
+    async def ack(self, message_ids: List[str]):
+        if message_ids:
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.xack(self.stream, self.group, *message_ids)
+            pipe.xdel(self.stream, *message_ids)
+            await pipe.execute()
+
+    async def requeue(self, batch: List[QueuedEvent]):
+        # The failed entries are still pending for this consumer: re-read from "0"
+        self._pending_checked = False
+
+    def dead_letter_count(self) -> int:
+        return self.dead_lettered
+
+    def depth(self) -> Optional[int]:
+        return self._depth
+
+    async def refresh_depth(self):
+        """عدد الرسائل غير المقروءة بعد للمجموعة (lag في Redis 7+)"""
+        try:
+            for info in await self.redis_client.xinfo_groups(self.stream):
+                name = info.get("name", info.get(b"name"))
+                if name in (self.group, self.group.encode()):
+                    self._depth = info.get("lag", info.get(b"lag"))
+        except Exception:
+            self._depth = None
+
+
+class WebhookPipeline:
+    """استقبال سريع للـ webhooks ومعالجة الإشارات على دفعات في الخلفية"""
+
+    def __init__(
+        self,
+        redis_client: Optional[Any],
+        broadcast: Callable[[Dict[str, Any]], Awaitable[None]],
+        ingestor: Optional[Any] = None,
+        batch_size: int = 200,
+        block_ms: int = 1000,
+        queue_size: int = 10000,
+        stream_max_len: int = 100000,
+        max_attempts: int = 5
+    ):
+        self.redis_client = redis_client
+        self.broadcast = broadcast
+        # Shared seen-ID set with the polling path (mention_ingest.MentionIngestor)
+        self.ingestor = ingestor
+        self.batch_size = batch_size
+        self.block_ms = block_ms
+        self.queue = (
+            RedisStreamQueue(redis_client, max_len=stream_max_len, max_attempts=max_attempts) if redis_client
+            else InMemoryEventQueue(queue_size, max_attempts=max_attempts)
+        )
+        self._consumer_task: Optional[asyncio.Task] = None
+        self.stats = {
+            "accepted": 0,
+            "rejected_full": 0,
+            "bulk_requests": 0,
+            "batches": 0,
+            "processed": 0,
+            "duplicates": 0,
+            "broadcast": 0,
+            "batch_errors": 0,
+            "lag_total": 0.0,
+            "lag_max": 0.0
+        }
+
+    async def enqueue(self, provider: str, mention_id: str, data: Dict[str, Any]) -> str:
+        """إضافة إشارة إلى الطابور (يُستدعى من معالج الـ webhook)"""
+        try:
+            message_id = await self.queue.enqueue({
+                "provider": provider,
+                "id": str(mention_id),
+                "data": data,
+                "received_at": time.time()
+            })
+        except WebhookQueueFull:
+            self.stats["rejected_full"] += 1
+            raise
+        self.stats["accepted"] += 1
+        return message_id
+
+    async def enqueue_bulk(self, provider: str, mentions: List[Tuple[str, Dict[str, Any]]]):
+        """إضافة دفعة إشارات متحقق منها بعملية واحدة على الطابور"""
+        received_at = time.time()
+        events = [
+            {"provider": provider, "id": str(mention_id), "data": data, "received_at": received_at}
+            for mention_id, data in mentions
+        ]
+        try:
+            await self.queue.enqueue_many(events)
+        except WebhookQueueFull:
+            self.stats["rejected_full"] += len(events)
+            raise
+        self.stats["accepted"] += len(events)
+
+    async def ingest_ndjson(
+        self,
+        provider: str,
+        chunks: AsyncIterator[bytes],
+        batch_size: Optional[int] = None,
+        max_errors: int = 100
+    ) -> Dict[str, Any]:
+        """قراءة NDJSON تدريجياً والتحقق سطراً بسطر وإضافة الصالح على دفعات"""
+        batch_size = batch_size or self.batch_size
+        batch: List[Tuple[str, Dict[str, Any]]] = []
+        batch_first_line = 0
+        summary: Dict[str, Any] = {"accepted": 0, "rejected": 0, "errors": [], "queue_full": False}
+        self.stats["bulk_requests"] += 1
+
+        try:
+            async for line_no, line in iter_ndjson_lines(chunks):
+                if not line.strip():
+                    continue
+                try:
+                    mention = parse_mention(provider, json.loads(line))
+                except ValueError as e:  # json.JSONDecodeError is a ValueError
+                    summary["rejected"] += 1
+                    if len(summary["errors"]) < max_errors:
+                        summary["errors"].append({"line": line_no, "error": str(e)})
+                    continue
+                if not batch:
+                    batch_first_line = line_no
+                batch.append(mention)
+                if len(batch) >= batch_size:
+                    await self.enqueue_bulk(provider, batch)
+                    summary["accepted"] += len(batch)
+                    batch = []
+            if batch:
+                await self.enqueue_bulk(provider, batch)
+                summary["accepted"] += len(batch)
+        except WebhookQueueFull:
+            # Everything before this line is queued; the sender resends from here
+            summary["queue_full"] = True
+            summary["resume_from_line"] = batch_first_line
+
+        summary["errors_truncated"] = summary["rejected"] > len(summary["errors"])
+        return summary
+
+    async def _persist(self, events: List[Dict[str, Any]]):
+        """حفظ الإشارات في Redis كنص JSON (hset لا يقبل قيم dict)"""
+        if not self.redis_client:
+            return
+        by_provider: Dict[str, Dict[str, str]] = {}
+        for event in events:
+            by_provider.setdefault(event["provider"], {})[event["id"]] = json.dumps(event["data"], ensure_ascii=False)
+        for provider, mapping in by_provider.items():
+            await self.redis_client.hset(f"mentions:{provider}", mapping=mapping)
+
+    @staticmethod
+    def _by_provider(events: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+        by_provider: Dict[str, List[Dict[str, Any]]] = {}
+        for event in events:
+            by_provider.setdefault(event["provider"], []).append(event)
+        return by_provider
+
+    async def _filter_new(self, events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """الأحداث التي لم تُشاهد بعد (دون تسجيلها؛ انظر _mark_seen)"""
+        if not self.ingestor:
+            return events
+        fresh: List[Dict[str, Any]] = []
+        for provider, group in self._by_provider(events).items():
+            new_mentions = await self.ingestor.filter_unseen(
+                provider, [{**e["data"], "id": e["id"]} for e in group]
+            )
+            new_ids = {m["id"] for m in new_mentions}
+            for event in group:
+                if event["id"] in new_ids:
+                    new_ids.discard(event["id"])
+                    fresh.append(event)
+        return fresh
+
+    async def _mark_seen(self, events: List[Dict[str, Any]]):
+        if not self.ingestor:
+            return
+        for provider, group in self._by_provider(events).items():
+            await self.ingestor.commit(provider, [{**e["data"], "id": e["id"]} for e in group], via="webhook")
+
+    async def process_batch(self, batch: List[QueuedEvent]):
+        events = [event for _, event in batch]
+        await self._persist(events)
+        fresh = await self._filter_new(events)
+
+        for event in fresh:
+            await self.broadcast({
+                "type": "new_mention",
+                "source": event["provider"],
+                "data": event["data"]
+            })
+        self.stats["broadcast"] += len(fresh)
+        self.stats["duplicates"] += len(events) - len(fresh)
+
+        await self.queue.ack([message_id for message_id, _ in batch])
+        try:
+            await self._mark_seen(fresh)
+        except Exception as e:
+            # Already delivered; at worst a later copy is broadcast again
+            logger.warning(f"Marking webhook mentions seen failed: {str(e)}")
+
+        now = time.time()
+        for event in events:
+            lag = now - event.get("received_at", now)
+            self.stats["lag_total"] += lag
+            self.stats["lag_max"] = max(self.stats["lag_max"], lag)
+        self.stats["processed"] += len(events)
+        self.stats["batches"] += 1
+
+    async def _run(self):
+        while True:
+            try:
+                batch = await self.queue.read_batch(self.batch_size, self.block_ms)
+                if not batch:
+                    continue
+                if self.queue.retrying:
+                    # One at a time, so a bad entry fails (and is dead-lettered) alone
+                    failed: List[QueuedEvent] = []
+                    error: Optional[Exception] = None
+                    for entry in batch:
+                        try:
+                            await self.process_batch([entry])
+                        except Exception as e:
+                            failed.append(entry)
+                            error = e
+                    if failed:
+                        await self.queue.requeue(failed)
+                        raise error
+                    continue
+                try:
+                    await self.process_batch(batch)
+                except Exception:
+                    # Not acknowledged and not marked seen: read again after the pause
+                    await self.queue.requeue(batch)
+                    raise
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["batch_errors"] += 1
+                logger.error(f"Webhook batch processing failed: {str(e)}")
+                await asyncio.sleep(1)
+
+    async def start(self):
+        await self.queue.setup()
+        if self._consumer_task is None or self._consumer_task.done():
+            self._consumer_task = asyncio.create_task(self._run())
+            logger.info(f"Webhook pipeline started (backend={self.queue.backend})")
+
+    async def stop(self):
+        if self._consumer_task:
+            self._consumer_task.cancel()
+            await asyncio.gather(self._consumer_task, return_exceptions=True)
+            self._consumer_task = None
+
+    async def get_stats(self) -> Dict[str, Any]:
+        """إحصائيات الطابور والمعالجة"""
+        if isinstance(self.queue, RedisStreamQueue):
+            await self.queue.refresh_depth()
+        processed = self.stats["processed"]
+        return {
+            **{k: v for k, v in self.stats.items() if not k.startswith("lag_")},
+            "backend": self.queue.backend,
+            "queue_depth": self.queue.depth(),
+            "dead_lettered": self.queue.dead_letter_count(),
+            "lag_avg_s": round(self.stats["lag_total"] / processed, 3) if processed else 0.0,
+            "lag_max_s": round(self.stats["lag_max"], 3)
+        }
@@ -9,6 +9,12 @@ from typing import Dict, List, Any, Optional
 from fastapi import WebSocket, WebSocketDisconnect
 from datetime import datetime
 import asyncio
+import importlib.util
+import uuid
+
+from config import MENTION_DIGEST_WINDOW_MS, MENTION_DIGEST_SAMPLES
+from mention_digest import MentionDigestAggregator
+from turn_persistence import schedule_turn_persistence
 
 logger = logging.getLogger(__name__)
 
@@ -73,18 +79,69 @@ class ConnectionManager:
 # إنشاء مثيل مدير الاتصالات
 manager = ConnectionManager()
 
-# Import the AI agent handler if available
-try:
-    # Import the unified morvo companion directly 
-    from agents import UnifiedMorvoCompanion
-    morvo_ai = UnifiedMorvoCompanion()
-    AI_AVAILABLE = True
-    logger.info("تم تحميل رفيق مورفو الموحد بنجاح")
-except ImportError:
-    AI_AVAILABLE = False
-    morvo_ai = None
+# تجميع إشعارات الإشارات قبل بثها
+mention_digest = MentionDigestAggregator(
+    manager.broadcast,
+    window=MENTION_DIGEST_WINDOW_MS / 1000,
+    sample_size=MENTION_DIGEST_SAMPLES
+)
+
+# The companion is shared with the app (set from main's lifespan) and only
+# built here on first use, never at import time
+AI_AVAILABLE = importlib.util.find_spec("crewai") is not None
+morvo_ai = None
+if not AI_AVAILABLE:
     logger.warning("فشل تحميل رفيق مورفو الموحد - سيعمل وضع المحاكاة فقط")
 
+
+def set_companion(companion: Any):
+    """استخدام رفيق مورفو المشترك الذي أنشأه التطبيق"""
+    global morvo_ai
+    morvo_ai = companion
+
+
+def get_companion() -> Optional[Any]:
+    global morvo_ai
+    if morvo_ai is None and AI_AVAILABLE:
+        from agents import UnifiedMorvoCompanion
+        morvo_ai = UnifiedMorvoCompanion()
+        logger.info("تم تحميل رفيق مورفو الموحد بنجاح")
+    return morvo_ai
+
+def conversation_id_for(message: dict, user_id: str) -> str:
+    """معرف المحادثة المرسل، أو معرف ثابت مشتق من الجلسة"""
+    conversation_id = message.get("conversation_id")
+    if conversation_id:
+        try:
+            # record_conversation_turn takes a UUID; other ids fall back below
+            return str(uuid.UUID(str(conversation_id)))
+        except ValueError:
+            logger.debug(f"Ignoring non-UUID conversation_id from {user_id}")
+    session_id = message.get("session_id", f"session_{user_id}")
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"morvo:{user_id}:{session_id}"))
+
+
+def persist_chat_turn(message: dict, response: dict, user_id: str, user_created_at: str):
+    """حفظ الجولة بعد إرسال الرد عبر عميل Supabase الخاص بالرفيق"""
+    companion = morvo_ai
+    supabase_client = getattr(companion, "supabase_client", None)
+    if supabase_client is None or response.get("type") != "chat_response":
+        return
+    try:
+        uuid.UUID(str(user_id))
+    except ValueError:
+        # conversations.user_id is a UUID; anonymous/test ids are not stored
+        return
+    schedule_turn_persistence(
+        supabase_client,
+        conversation_id=response["conversation_id"],
+        user_id=user_id,
+        user_message=message.get("text", ""),
+        assistant_message=response.get("text", ""),
+        user_created_at=user_created_at,
+        assistant_created_at=response["timestamp"]
+    )
+
 async def process_chat_message(message: dict, user_id: str) -> dict:
     """معالجة رسالة دردشة ومحاولة الحصول على رد من وكيل الذكاء الاصطناعي"""
     text = message.get("text", "")
@@ -94,10 +151,11 @@ async def process_chat_message(message: dict, user_id: str) -> dict:
     logger.info(f"تم استلام رسالة من المستخدم {user_id}: {text[:50]}...")
     
     try:
-        if AI_AVAILABLE and morvo_ai:
+        companion = get_companion()
+        if companion:
             # استخدام وكيل مورفو للحصول على رد
             # Use process_message instead of get_response since that's what UnifiedMorvoCompanion provides
-            result = await morvo_ai.process_message(user_id=user_id, message=text)
+            result = await companion.process_message(user_id=user_id, message=text)
             response_text = result.get('response', "عذراً، لم أستطع فهم طلبك. يرجى المحاولة مرة أخرى.")
             
             return {
@@ -105,7 +163,8 @@ async def process_chat_message(message: dict, user_id: str) -> dict:
                 "text": response_text,
                 "user_id": user_id,
                 "session_id": session_id,
-                "timestamp": datetime.now().isoformat(),
+                "conversation_id": conversation_id_for(message, user_id),
+                "timestamp": datetime.utcnow().isoformat(),
                 "companion": "مورفو"  # Add companion name
             }
         else:
@@ -155,11 +214,25 @@ async def handle_websocket_connection(websocket: WebSocket, user_id: str):
                     "timestamp": datetime.now().isoformat()
                 }, user_id)
                 
+            elif message_data.get("type") == "digest_details":
+                digest_id = message_data.get("digest_id", "")
+                mentions = mention_digest.get_digest(digest_id)
+                await manager.send_personal_message({
+                    "type": "digest_details",
+                    "digest_id": digest_id,
+                    "mentions": mentions or [],
+                    "found": mentions is not None,
+                    "timestamp": datetime.now().isoformat()
+                }, user_id)
+                
             # معالجة رسائل الدردشة (النوع الجديد)
             elif message_data.get("type") in ["chat", "chat_message"]:
                 # معالجة غير متزامنة لرسائل الدردشة
+                user_created_at = datetime.utcnow().isoformat()
                 response = await process_chat_message(message_data, user_id)
                 await manager.send_personal_message(response, user_id)
+                # الحفظ بعد إرسال الرد: استدعاء RPC واحد في الخلفية
+                persist_chat_turn(message_data, response, user_id, user_created_at)
                 
     except WebSocketDisconnect:
         manager.disconnect(user_id)